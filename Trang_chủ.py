@@ -3,74 +3,22 @@ import os
 from datetime import datetime
 from auth import init_auth, check_auth, login, logout
 from database import Database
-from supabase_keepalive import SupabaseKeepAlive
 from translations import get_text, get_current_language, set_language
 from utils import apply_theme
 import json
 import streamlit.components.v1 as components
 
 def handle_keep_alive_request():
-    """Handle Supabase keep-alive API requests without displaying navigation"""
-    try:
-        database_url = os.environ.get('DATABASE_URL')
-        if not database_url:
-            error_response = {
-                "success": False,
-                "timestamp": datetime.now().isoformat(),
-                "error": "DATABASE_URL environment variable not set",
-                "status": "Configuration error - please set DATABASE_URL in Replit Secrets",
-                "service": "Supabase Keep-Alive",
-                "version": "1.0.0"
-            }
-            st.json(error_response)
-            return
-
-        keep_alive = SupabaseKeepAlive()
-        success, messages = keep_alive.run_keep_alive()
-        response = {
-            "success": success,
-            "timestamp": datetime.now().isoformat(),
-            "status": "Database keep-alive completed successfully" if success else "Keep-alive failed",
-            "messages": messages,
-            "service": "Supabase Keep-Alive",
-            "version": "1.0.0"
-        }
-        st.json(response)
-        print(f"Keep-alive API called at {datetime.now()}: {'SUCCESS' if success else 'FAILED'}")
-
-    except ImportError as e:
-        if 'psycopg2' in str(e):
-            error_response = {
-                "success": False,
-                "timestamp": datetime.now().isoformat(),
-                "error": "psycopg2 not installed",
-                "status": "Missing dependency - run: pip install psycopg2-binary",
-                "service": "Supabase Keep-Alive",
-                "version": "1.0.0"
-            }
-        else:
-            error_response = {
-                "success": False,
-                "timestamp": datetime.now().isoformat(),
-                "error": str(e),
-                "status": "Import error",
-                "service": "Supabase Keep-Alive",
-                "version": "1.0.0"
-            }
-        st.json(error_response)
-        print(f"Keep-alive API import error at {datetime.now()}: {str(e)}")
+    """Answer keep-alive API requests with the cached health status
 
-    except Exception as e:
-        error_response = {
-            "success": False,
-            "timestamp": datetime.now().isoformat(),
-            "error": str(e),
-            "status": "Keep-alive service error",
-            "service": "Supabase Keep-Alive",
-            "version": "1.0.0"
-        }
-        st.json(error_response)
-        print(f"Keep-alive API error at {datetime.now()}: {str(e)}")
+    The status is cached for a few minutes (and served without Streamlit
+    by the health_server process on port 8001); a request never writes
+    to the database.
+    """
+    from health_server import get_health_status
+    response = get_health_status()
+    st.json(response)
+    print(f"Keep-alive API called at {datetime.now()}: {'SUCCESS' if response.get('success') else 'FAILED'}")
 
 
 # Set page config
@@ -110,25 +58,13 @@ def main():
     init_auth()
     db = Database()
 
-    if 'backup_scheduler_started' not in st.session_state:
-        try:
-            from local_backup import start_automatic_backups
-            start_automatic_backups()
-            st.session_state.backup_scheduler_started = True
-        except Exception as e:
-            if "conflicts with an existing job" not in str(e):
-                print(f"Failed to start backup scheduler: {e}")
-            else:
-                st.session_state.backup_scheduler_started = True
-
-    if 'keep_alive_daemon_started' not in st.session_state:
-        try:
-            from keep_alive_daemon import start_keep_alive_daemon
-            if start_keep_alive_daemon():
-                print("Keep-alive daemon started for deployment")
-            st.session_state.keep_alive_daemon_started = True
-        except Exception as e:
-            print(f"Failed to start keep-alive daemon: {e}")
+    # Backups, maintenance and keep-alive run as jobs of one process-wide
+    # scheduler; registering is a no-op after the first session
+    try:
+        from job_scheduler import start_background_jobs
+        start_background_jobs()
+    except Exception as e:
+        print(f"Failed to start background jobs: {e}")
 
     if st.query_params.get("keep_alive"):
         handle_keep_alive_request()
@@ -1,6 +1,63 @@
 import streamlit as st
 import hashlib
-from database import Database
+from types import MappingProxyType
+from database import Database, ROLE_PAGE_IDS, get_pages_for_role
+
+# Access control matrix, built once at import. Every check below is a
+# dict and set lookup on the current user's role.
+
+# Admin và hành chính có toàn quyền
+FULL_ACCESS_ROLES = frozenset({'admin', 'administrative'})
+
+# Pages (by id) each role can open
+ROLE_PAGES = MappingProxyType({role: frozenset(page_ids) for role, page_ids in ROLE_PAGE_IDS.items()})
+
+# Page keys allowed by check_role for roles without full access
+CHECK_ROLE_PAGES = MappingProxyType({role: frozenset(pages) for role, pages in {
+    # Giáo viên: quản lý lớp học, hồ sơ học sinh, tìm kiếm và in, thống kê
+    'teacher': ["03_Quan_ly_ho_so", "04_Lop_hoc", "05_Tim_kiem_va_In", "07_Thong_ke"],
+    # Bác sĩ: y tế, hồ sơ học sinh, tìm kiếm và in, thống kê
+    'doctor': ["02_Y_te", "03_Quan_ly_ho_so", "05_Tim_kiem_va_In", "07_Thong_ke"],
+    # Phụ huynh: chỉ xem thông tin của con mình, thống kê
+    'family': ["03_Quan_ly_ho_so", "04_Lop_hoc", "07_Thong_ke"],
+}.items()})
+
+# Capability flags per role:
+#   view_students      xem hồ sơ học sinh (phụ huynh chỉ xem con mình)
+#   edit_student_info  sửa thông tin học sinh
+#   edit_veteran_info  sửa thông tin cựu chiến binh
+#   manage_data        nhập/xuất dữ liệu, quản lý cơ sở dữ liệu
+#   search, print      tìm kiếm và in hồ sơ
+ROLE_CAPABILITIES = MappingProxyType({role: frozenset(capabilities) for role, capabilities in {
+    'admin': ['view_students', 'edit_student_info', 'edit_veteran_info', 'manage_data', 'search', 'print'],
+    'administrative': ['view_students', 'edit_student_info', 'edit_veteran_info', 'manage_data', 'search', 'print'],
+    'teacher': ['view_students', 'edit_student_info', 'manage_data', 'search', 'print'],
+    'doctor': ['view_students', 'edit_student_info', 'edit_veteran_info', 'manage_data', 'search', 'print'],
+    # Y tá chỉ có thể cập nhật thông tin sức khỏe, không thể sửa thông tin cá nhân
+    'nurse': ['view_students', 'search', 'print'],
+    'counselor': ['view_students', 'edit_student_info', 'search', 'print'],
+    # Phụ huynh không được tìm kiếm hay in hồ sơ
+    'family': [],
+}.items()})
+
+# Roles not listed above can still search and print
+DEFAULT_CAPABILITIES = frozenset({'search', 'print'})
+
+# Record types each role can search
+ROLE_SEARCH_TYPES = MappingProxyType({
+    'admin': ('students', 'veterans', 'medical_records', 'psychological_evaluations'),
+    'administrative': ('students', 'veterans', 'medical_records', 'psychological_evaluations'),
+    'doctor': ('students', 'veterans', 'medical_records'),
+    'nurse': ('students', 'veterans', 'medical_records'),
+    'counselor': ('students', 'psychological_evaluations'),
+    'teacher': ('students', 'psychological_evaluations'),
+})
+
+def has_capability(capability: str) -> bool:
+    """Check if the current user's role has a capability flag"""
+    if not st.session_state.authenticated:
+        return False
+    return capability in ROLE_CAPABILITIES.get(st.session_state.user.role, DEFAULT_CAPABILITIES)
 
 def init_auth():
     if 'user' not in st.session_state:
@@ -42,44 +99,15 @@ def check_auth():
 
 def check_role(allowed_roles):
     """Check if current user has permission to access the page"""
-    # Admin và hành chính có toàn quyền
-    if st.session_state.user.role in ['admin', 'administrative']:
+    if st.session_state.user.role in FULL_ACCESS_ROLES:
         return True
 
-    # Define page access for each role
-    role_allowed_pages = {
-        # Giáo viên: quản lý lớp học, hồ sơ học sinh, tìm kiếm và in, thống kê
-        'teacher': [
-            "03_Quan_ly_ho_so", # Hồ sơ học sinh
-            "04_Lop_hoc",       # Lớp học
-            "05_Tim_kiem_va_In", # Tìm kiếm và in
-            "07_Thong_ke"       # Thống kê
-        ],
-        
-        # Bác sĩ: y tế, hồ sơ học sinh, tìm kiếm và in, thống kê
-        'doctor': [
-            "02_Y_te",          # Y tế
-            "03_Quan_ly_ho_so", # Hồ sơ học sinh và cựu chiến binh
-            "05_Tim_kiem_va_In", # Tìm kiếm và in
-            "07_Thong_ke"       # Thống kê
-        ],
-        
-
-        
-        # Phụ huynh: chỉ xem thông tin của con mình, thống kê
-        'family': [
-            "03_Quan_ly_ho_so", # Hồ sơ học sinh (chỉ xem con mình)
-            "04_Lop_hoc",       # Lớp học (chỉ xem thông tin lớp của con mình)
-            "07_Thong_ke"       # Thống kê (chỉ xem thống kê chung)
-        ]
-    }
-    
     # Kiểm tra quyền truy cập dựa trên vai trò
     user_role = st.session_state.user.role
     current_page = st.session_state.get("current_page", "")
     
     # Nếu không tìm thấy vai trò trong danh sách hoặc trang không được phép
-    if user_role not in role_allowed_pages or (current_page not in role_allowed_pages.get(user_role, [])):
+    if current_page not in CHECK_ROLE_PAGES.get(user_role, ()):
         st.error("Bạn không có quyền truy cập trang này")
         st.stop()
     
@@ -95,137 +123,55 @@ def check_student_access(student_id):
     if not st.session_state.authenticated:
         return False
 
-    if st.session_state.user.role in ['admin', 'administrative']:
-        return True
-
     if st.session_state.user.role == 'family':
         return student_id == st.session_state.user.family_student_id
 
-    # Only certain roles can access student information
-    return st.session_state.user.role in ['teacher', 'doctor', 'counselor', 'nurse']
+    return has_capability('view_students')
 
 def can_edit_student_info():
     """Check if current user has permission to edit student information"""
-    if not st.session_state.authenticated:
-        return False
-
-    # Family users cannot edit information
-    if st.session_state.user.role == 'family':
-        return False
-        
-    # Y tá chỉ có thể cập nhật thông tin sức khỏe, không thể sửa thông tin cá nhân
-    if st.session_state.user.role == 'nurse':
-        return False
-
-    # Administrative chỉ có thể cập nhật thông tin cơ bản, không thể sửa thông tin y tế/tâm lý
-    if st.session_state.user.role == 'administrative':
-        return True
-        
-    # Các vai trò khác có quyền chỉnh sửa thông tin học sinh
-    return st.session_state.user.role in ['admin', 'teacher', 'doctor', 'counselor']
+    return has_capability('edit_student_info')
 
 def can_edit_veteran_info():
     """Check if current user has permission to edit veteran information"""
-    if not st.session_state.authenticated:
-        return False
-
-    # Admin, nhân viên hành chính, và bác sĩ có thể chỉnh sửa thông tin cựu chiến binh
-    return st.session_state.user.role in ['admin', 'administrative', 'doctor']
+    return has_capability('edit_veteran_info')
 
 def can_manage_data():
     """Check if user has permission to manage data (import/export/database)"""
-    if not st.session_state.authenticated:
-        return False
-
-    # Admin, bác sĩ và giáo viên có thể quản lý dữ liệu
-    return st.session_state.user.role in ['admin', 'doctor', 'teacher', 'administrative']
+    return has_capability('manage_data')
 
 def get_user_accessible_students():
     """Get list of student IDs that the current user can access"""
     if not st.session_state.authenticated:
         return []
 
-    if st.session_state.user.role in ['admin', 'administrative']:
-        return None  # None means all students
-
     if st.session_state.user.role == 'family':
         return [st.session_state.user.family_student_id]
 
-    return None  # Other authorized roles can see all students
+    return None  # None means all students
 
 def is_search_allowed():
     """Check if user has permission to use search functionality"""
-    if not st.session_state.authenticated:
-        return False
-
-    # Family users cannot use search
-    if st.session_state.user.role == 'family':
-        return False
-        
-    # Mọi vai trò khác đều có thể sử dụng tìm kiếm nhưng với phạm vi hạn chế
-    return True
+    return has_capability('search')
 
 def is_print_allowed():
     """Check if user has permission to print profiles"""
-    if not st.session_state.authenticated:
-        return False
-
-    # Family users cannot print profiles
-    if st.session_state.user.role == 'family':
-        return False
-        
-    # Các vai trò khác đều có thể in (bao gồm y tá)
-    return True
+    return has_capability('print')
     
 def get_role_based_search_types():
     """Trả về danh sách loại tìm kiếm mà vai trò hiện tại có thể thực hiện"""
     if not st.session_state.authenticated:
         return []
-        
-    # Admin và nhân viên hành chính có thể tìm kiếm tất cả
-    if st.session_state.user.role in ['admin', 'administrative']:
-        return ['students', 'veterans', 'medical_records', 'psychological_evaluations']
-        
-    # Vai trò y tế tìm kiếm y tế và học sinh, cựu chiến binh
-    if st.session_state.user.role == 'doctor':
-        return ['students', 'veterans', 'medical_records']
-        
-    # Y tá có thể tìm kiếm học sinh, cựu chiến binh và hồ sơ y tế
-    if st.session_state.user.role == 'nurse':
-        return ['students', 'veterans', 'medical_records']
-        
-    # Tư vấn tâm lý có thể tìm kiếm học sinh và đánh giá tâm lý
-    if st.session_state.user.role == 'counselor':
-        return ['students', 'psychological_evaluations']
-        
-    # Giáo viên tìm kiếm học sinh và đánh giá tâm lý
-    if st.session_state.user.role == 'teacher':
-        return ['students', 'psychological_evaluations']
-        
-    # Phụ huynh không được tìm kiếm
-    return []
+    return list(ROLE_SEARCH_TYPES.get(st.session_state.user.role, ()))
 
 def check_page_access(page_id: str) -> bool:
     """Check if current user has access to a specific page"""
     if not st.session_state.authenticated:
         return False
-    
-    from database import Database
-    db = Database()
-    available_pages = db.get_available_pages(st.session_state.user.role)
-    
-    # Check if page is in user's available pages
-    for page in available_pages:
-        if page['id'] == page_id:
-            return True
-    
-    return False
+    return page_id in ROLE_PAGES.get(st.session_state.user.role, ())
 
 def get_user_accessible_pages():
     """Get list of pages accessible to current user"""
     if not st.session_state.authenticated:
         return []
-    
-    from database import Database
-    db = Database()
-    return db.get_available_pages(st.session_state.user.role)
\ No newline at end of file
+    return get_pages_for_role(st.session_state.user.role)
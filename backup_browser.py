@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Backup Browser
+Opens a backup read-only in memory, compares it table by table against the
+live database and restores the records of a single student from it.
+"""
+
+import sqlite3
+import hashlib
+import logging
+
+from database import connect_database
+from local_backup import LocalBackup
+
+# Tables holding a student's records and the column linking them to the student
+STUDENT_TABLES = {
+    'families': 'student_id',
+    'periodic_assessments': 'student_id',
+    'supports': 'student_id',
+    'psychological_evaluations': 'student_id',
+    'student_class_history': 'student_id',
+    'student_notes': 'student_id',
+    'document_files': 'student_id',
+}
+
+# Number of row ids listed per table in a diff
+DIFF_SAMPLE_SIZE = 20
+
+
+def row_hash(*values):
+    """Fingerprint of a row, registered as an SQL function on both sides of a diff
+
+    BLOBs are fed to the hash as they are, other values as their text;
+    each is prefixed with its type and length so values cannot run together.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for value in values:
+        if value is None:
+            digest.update(b'n')
+            continue
+        if isinstance(value, bytes):
+            data, tag = value, b'b'
+        else:
+            data, tag = str(value).encode('utf-8'), type(value).__name__[0].encode()
+        digest.update(tag + len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.digest()
+
+
+class BackupBrowser:
+    def __init__(self, backup_path, db_path='lang_huu_nghi.db', backup_service=None):
+        self.backup_path = backup_path
+        self.db_path = db_path
+        self.backup_service = backup_service or LocalBackup()
+        self.warnings = []
+        self.conn = self._open_backup()
+
+    def _open_backup(self):
+        """Load the backup image into an in-memory read-only connection"""
+        image = bytearray(self.backup_service.read_backup_image(self.backup_path))
+        if image[18:20] == b'\x02\x02':
+            # In-memory databases cannot use WAL; mark the image as rollback-journal
+            image[18:20] = b'\x01\x01'
+
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        conn.deserialize(bytes(image))
+        conn.execute("PRAGMA query_only = ON")
+        conn.create_function('row_hash', -1, row_hash, deterministic=True)
+        return conn
+
+    def _open_live(self):
+        conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, timeout=30)
+        conn.create_function('row_hash', -1, row_hash, deterministic=True)
+        return conn
+
+    @staticmethod
+    def list_tables(conn):
+        cursor = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def table_columns(conn, table):
+        return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")').fetchall()]
+
+    @staticmethod
+    def row_hashes(conn, table, columns):
+        """Map rowid -> hash of the given columns for every row of a table"""
+        column_list = ', '.join(f'"{c}"' for c in columns)
+        cursor = conn.execute(f'SELECT rowid, row_hash({column_list}) FROM "{table}"')
+        return dict(cursor.fetchall())
+
+    def diff_table(self, live_conn, table):
+        """Compare one table by primary key and row hash
+
+        only_in_backup rows would come back on restore, only_in_live rows
+        would be lost, changed rows differ between the two.
+        """
+        backup_columns = self.table_columns(self.conn, table)
+        live_columns = self.table_columns(live_conn, table)
+        # Compare only the columns both schemas have, so a migration alone is not a change
+        columns = [c for c in backup_columns if c in live_columns]
+
+        backup_rows = self.row_hashes(self.conn, table, columns)
+        live_rows = self.row_hashes(live_conn, table, columns)
+
+        only_in_backup = sorted(backup_rows.keys() - live_rows.keys())
+        only_in_live = sorted(live_rows.keys() - backup_rows.keys())
+        changed = sorted(
+            row_id for row_id in backup_rows.keys() & live_rows.keys()
+            if backup_rows[row_id] != live_rows[row_id]
+        )
+
+        return {
+            'table': table,
+            'backup_rows': len(backup_rows),
+            'live_rows': len(live_rows),
+            'only_in_backup': len(only_in_backup),
+            'only_in_live': len(only_in_live),
+            'changed': len(changed),
+            'only_in_backup_ids': only_in_backup[:DIFF_SAMPLE_SIZE],
+            'only_in_live_ids': only_in_live[:DIFF_SAMPLE_SIZE],
+            'changed_ids': changed[:DIFF_SAMPLE_SIZE],
+            'schema_changed': backup_columns != live_columns,
+        }
+
+    def diff(self):
+        """Per-table differences between the backup and the live database"""
+        live_conn = self._open_live()
+        try:
+            backup_tables = set(self.list_tables(self.conn))
+            live_tables = set(self.list_tables(live_conn))
+
+            results = []
+            for table in sorted(backup_tables & live_tables):
+                results.append(self.diff_table(live_conn, table))
+            for table in sorted(backup_tables - live_tables):
+                count = self.conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                results.append({'table': table, 'backup_rows': count, 'live_rows': None, 'missing': 'live'})
+            for table in sorted(live_tables - backup_tables):
+                count = live_conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                results.append({'table': table, 'backup_rows': None, 'live_rows': count, 'missing': 'backup'})
+            return results
+        finally:
+            live_conn.close()
+
+    def list_students(self):
+        """(id, full_name) of every student in the backup"""
+        return self.conn.execute("SELECT id, full_name FROM students ORDER BY full_name").fetchall()
+
+    def get_student_records(self, conn, student_id):
+        """All rows belonging to a student, keyed by table, as (columns, rows)"""
+        records = {}
+        queries = {'students': ("SELECT * FROM students WHERE id = ?", (student_id,))}
+        for table, column in STUDENT_TABLES.items():
+            queries[table] = (f'SELECT * FROM "{table}" WHERE "{column}" = ?', (student_id,))
+        queries['medical_records'] = (
+            "SELECT * FROM medical_records WHERE patient_id = ? AND patient_type = 'student'",
+            (student_id,)
+        )
+
+        tables = set(self.list_tables(conn))
+        for table, (query, params) in queries.items():
+            if table not in tables:
+                continue
+            cursor = conn.execute(query, params)
+            columns = [d[0] for d in cursor.description]
+            records[table] = (columns, cursor.fetchall())
+        return records
+
+    @staticmethod
+    def foreign_keys(conn, table):
+        """[(column, parent table, parent column, not null)] of a live table's foreign keys"""
+        not_null = {row[1]: bool(row[3]) for row in conn.execute(f'PRAGMA table_info("{table}")').fetchall()}
+        return [(row[3], row[2], row[4] or 'id', not_null.get(row[3], False))
+                for row in conn.execute(f'PRAGMA foreign_key_list("{table}")').fetchall()]
+
+    def _check_foreign_keys(self, live, table, names, row, foreign_keys):
+        """Row with dangling references nulled out, or None if it has to be skipped
+
+        A reference to a row that no longer exists (e.g. a deleted class)
+        would abort the restore; nullable columns are cleared instead and
+        rows that cannot exist without the parent are left out. Both are
+        reported in self.warnings.
+        """
+        row = list(row)
+        for column, parent, parent_column, not_null in foreign_keys:
+            if column not in names:
+                continue
+            index = names.index(column)
+            value = row[index]
+            if value is None:
+                continue
+            if live.execute(f'SELECT 1 FROM "{parent}" WHERE "{parent_column}" = ?', (value,)).fetchone():
+                continue
+            if not_null:
+                self.warnings.append(f"{table} #{row[names.index('id')]}: bỏ qua vì {parent} #{value} không còn tồn tại")
+                return None
+            self.warnings.append(f"{table} #{row[names.index('id')]}: bỏ trống {column} vì {parent} #{value} không còn tồn tại")
+            row[index] = None
+        return tuple(row)
+
+    @staticmethod
+    def _is_archived(live, table, names, row):
+        """True if the same row (id and content) has been moved to archive.db"""
+        from record_archive import ARCHIVE_SCHEMA
+        conditions = ' AND '.join(f'"{c}" IS ?' for c in names)
+        return live.execute(
+            f'SELECT 1 FROM {ARCHIVE_SCHEMA}."{table}" WHERE {conditions}', row
+        ).fetchone() is not None
+
+    def restore_student(self, student_id):
+        """Replace a student's live records with the ones in the backup
+
+        The student row is updated in place and the dependent rows are
+        swapped in a single transaction, so other students are untouched.
+        References to rows deleted since the backup are cleared or the
+        row is skipped, rows already moved to archive.db are not copied
+        back into the live tables, and family accounts that pointed at the
+        student in the backup are linked to it again. What was changed
+        that way is listed in self.warnings.
+        Returns the number of rows written per table.
+        """
+        from record_archive import attach_archive, ARCHIVED_TABLES
+
+        records = self.get_student_records(self.conn, student_id)
+        if not records.get('students', (None, []))[1]:
+            raise ValueError(f"Student {student_id} not found in backup")
+
+        self.warnings = []
+        live = connect_database(self.db_path, timeout=30)
+        try:
+            live_tables = set(self.list_tables(live))
+            # ATTACH cannot run inside the transaction
+            archive_attached = attach_archive(live, self.db_path)
+            live.execute("BEGIN IMMEDIATE")
+            restored = {}
+
+            for table, (columns, rows) in records.items():
+                if table not in live_tables:
+                    continue
+                # Skip columns the live schema no longer has
+                live_columns = set(self.table_columns(live, table))
+                keep = [i for i, c in enumerate(columns) if c in live_columns]
+                names = [columns[i] for i in keep]
+                rows = [tuple(row[i] for i in keep) for row in rows]
+                foreign_keys = self.foreign_keys(live, table)
+
+                if table == 'students':
+                    id_index = names.index('id')
+                    row = self._check_foreign_keys(live, table, names, rows[0], foreign_keys)
+                    assignments = ', '.join(f'"{c}" = ?' for c in names if c != 'id')
+                    values = [v for i, v in enumerate(row) if i != id_index]
+                    cursor = live.execute(f'UPDATE students SET {assignments} WHERE id = ?', values + [student_id])
+                    if cursor.rowcount == 0:
+                        placeholders = ', '.join('?' * len(names))
+                        column_list = ', '.join(f'"{c}"' for c in names)
+                        live.execute(f'INSERT INTO students ({column_list}) VALUES ({placeholders})', row)
+                    restored[table] = 1
+                else:
+                    if table == 'medical_records':
+                        live.execute(
+                            "DELETE FROM medical_records WHERE patient_id = ? AND patient_type = 'student'",
+                            (student_id,)
+                        )
+                    else:
+                        live.execute(f'DELETE FROM "{table}" WHERE "{STUDENT_TABLES[table]}" = ?', (student_id,))
+                    placeholders = ', '.join('?' * len(names))
+                    column_list = ', '.join(f'"{c}"' for c in names)
+                    id_index = names.index('id')
+                    other_names = [c for c in names if c != 'id']
+                    other_list = ', '.join(f'"{c}"' for c in other_names)
+                    other_placeholders = ', '.join('?' * len(other_names))
+                    written = 0
+                    for row in rows:
+                        if archive_attached and table in ARCHIVED_TABLES and self._is_archived(live, table, names, row):
+                            continue
+                        row = self._check_foreign_keys(live, table, names, row, foreign_keys)
+                        if row is None:
+                            continue
+                        taken = live.execute(
+                            f'SELECT 1 FROM "{table}" WHERE id = ?', (row[id_index],)
+                        ).fetchone()
+                        if taken:
+                            # The id now belongs to another record; let SQLite assign a new one
+                            live.execute(
+                                f'INSERT INTO "{table}" ({other_list}) VALUES ({other_placeholders})',
+                                [v for i, v in enumerate(row) if i != id_index]
+                            )
+                        else:
+                            live.execute(f'INSERT INTO "{table}" ({column_list}) VALUES ({placeholders})', row)
+                        written += 1
+                    restored[table] = written
+
+            # Family accounts lose their link when the student is deleted
+            # (ON DELETE SET NULL); relink the ones the backup still links
+            if 'family_student_id' in self.table_columns(self.conn, 'users'):
+                family_user_ids = [row[0] for row in self.conn.execute(
+                    "SELECT id FROM users WHERE family_student_id = ?", (student_id,)
+                ).fetchall()]
+                relinked = 0
+                for user_id in family_user_ids:
+                    relinked += live.execute(
+                        "UPDATE users SET family_student_id = ? WHERE id = ? AND family_student_id IS NULL",
+                        (student_id, user_id)
+                    ).rowcount
+                if relinked:
+                    restored['users'] = relinked
+
+            live.commit()
+            logging.info(f"Restored student {student_id} from {self.backup_path}: {restored}")
+            for warning in self.warnings:
+                logging.warning(f"Restore of student {student_id}: {warning}")
+            return restored
+        except Exception:
+            live.rollback()
+            raise
+        finally:
+            live.close()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
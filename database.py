@@ -3,8 +3,8 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime
 import hashlib
 import os
-import shutil
 import json
+import threading
 from models import User, Student, Veteran, MedicalRecord, PsychologicalEvaluation, Family, Class, PeriodicAssessment, Support
 from translations import get_current_language
 
@@ -52,6 +52,634 @@ def translate_value(value: Any) -> Any:
     
     return TRANSLATIONS.get(value, value)
 
+def translate_column(data: Any, *columns, language: Optional[str] = None) -> Any:
+    """Dịch cả cột của một tập kết quả hoặc DataFrame trong một lần
+
+    data is a pandas DataFrame (columns given by name) or a list of rows,
+    tuples, lists or dicts (columns given by index or key). The language
+    is looked up once per call instead of once per value; when nothing is
+    translated data is returned as is, otherwise a translated copy.
+    """
+    if not columns or (language or get_current_language()) != 'en':
+        return data
+
+    lookup = TRANSLATIONS.get
+
+    def translate(value):
+        return lookup(value, value) if isinstance(value, str) else value
+
+    if hasattr(data, 'columns'):
+        data = data.copy()
+        for column in columns:
+            data[column] = data[column].map(translate)
+        return data
+
+    translated = []
+    for row in data:
+        new_row = dict(row) if isinstance(row, dict) else list(row)
+        for column in columns:
+            new_row[column] = translate(new_row[column])
+        translated.append(new_row if isinstance(row, (dict, list)) else tuple(new_row))
+    return translated
+
+# Connections only checkpoint the WAL on their own once it reaches this many
+# pages. The WAL archiver in local_backup checkpoints every minute right after
+# shipping new frames, so in practice no frame is checkpointed unarchived.
+WAL_AUTOCHECKPOINT_PAGES = 10000
+
+def connect_database(db_path: str, **kwargs) -> sqlite3.Connection:
+    """Open a connection to the application database in WAL mode with foreign keys enforced
+
+    A new file is created with auto_vacuum=INCREMENTAL; the pragma has no
+    effect on existing files, which need DatabaseCleanup.enable_incremental_vacuum.
+    """
+    conn = sqlite3.connect(db_path, **kwargs)
+    # Must precede journal_mode, which writes the header of a new file
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA wal_autocheckpoint = {WAL_AUTOCHECKPOINT_PAGES}")
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+# Table definitions, shared by create_tables and the foreign key migration.
+# Dependent records go with their student through ON DELETE CASCADE;
+# columns naming the user who wrote a record keep their value when the
+# user is deleted, so they carry no foreign key. A class that still has
+# class history cannot be deleted (no ON DELETE action).
+TABLE_SCHEMAS = {
+    'users': '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL,
+        full_name TEXT NOT NULL,
+        email TEXT,
+        family_student_id INTEGER,
+        theme_preference TEXT DEFAULT 'Chính thức',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        dark_mode BOOLEAN DEFAULT FALSE,
+        original_password TEXT,
+        FOREIGN KEY (family_student_id) REFERENCES students (id) ON DELETE SET NULL
+    )
+    ''',
+    'classes': '''
+    CREATE TABLE IF NOT EXISTS classes (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        teacher_id INTEGER NOT NULL,
+        academic_year TEXT NOT NULL,
+        notes TEXT
+    )
+    ''',
+    'students': '''
+    CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY,
+        full_name TEXT NOT NULL,
+        birth_date DATE,
+        gender TEXT,
+        phone TEXT,
+        address TEXT,
+        email TEXT,
+        admission_date DATE,
+        class_id INTEGER,
+        year TEXT,
+        parent_name TEXT,
+        profile_image BLOB,
+        decision_number TEXT,
+        nha_chu_t_info TEXT,
+        health_on_admission TEXT,
+        initial_characteristics TEXT,
+        FOREIGN KEY (class_id) REFERENCES classes (id) ON DELETE SET NULL
+    )
+    ''',
+    'families': '''
+    CREATE TABLE IF NOT EXISTS families (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER NOT NULL,
+        guardian_name TEXT NOT NULL,
+        relationship TEXT NOT NULL,
+        occupation TEXT,
+        address TEXT,
+        phone TEXT,
+        household_status TEXT,
+        support_status TEXT,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE
+    )
+    ''',
+    'veterans': '''
+    CREATE TABLE IF NOT EXISTS veterans (
+        id INTEGER PRIMARY KEY,
+        full_name TEXT NOT NULL,
+        birth_date DATE NOT NULL,
+        service_period TEXT,
+        health_condition TEXT,
+        address TEXT,
+        email TEXT,
+        contact_info TEXT,
+        profile_image BLOB,
+        initial_characteristics TEXT
+    )
+    ''',
+    'periodic_assessments': '''
+    CREATE TABLE IF NOT EXISTS periodic_assessments (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER NOT NULL,
+        assessment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        academic_performance TEXT,
+        health_condition TEXT,
+        social_behavior TEXT,
+        teacher_notes TEXT,
+        doctor_notes TEXT,
+        counselor_notes TEXT,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE
+    )
+    ''',
+    'supports': '''
+    CREATE TABLE IF NOT EXISTS supports (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER NOT NULL,
+        support_type TEXT NOT NULL,
+        amount REAL,
+        start_date DATE NOT NULL,
+        end_date DATE,
+        approval_status TEXT NOT NULL,
+        approved_by INTEGER NOT NULL,
+        notes TEXT,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE
+    )
+    ''',
+    'medical_records': '''
+    CREATE TABLE IF NOT EXISTS medical_records (
+        id INTEGER PRIMARY KEY,
+        patient_id INTEGER NOT NULL,
+        patient_type TEXT NOT NULL,
+        diagnosis TEXT,
+        treatment TEXT,
+        doctor_id INTEGER NOT NULL,
+        date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        notes TEXT,
+        notification_sent BOOLEAN DEFAULT FALSE,
+        is_routine_checkup BOOLEAN DEFAULT FALSE,
+        requested_by_family BOOLEAN DEFAULT FALSE,
+        emergency_case BOOLEAN DEFAULT FALSE
+    )
+    ''',
+    'psychological_evaluations': '''
+    CREATE TABLE IF NOT EXISTS psychological_evaluations (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER NOT NULL,
+        evaluation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        evaluator_id INTEGER NOT NULL,
+        assessment TEXT,
+        recommendations TEXT,
+        follow_up_date DATE,
+        notification_sent BOOLEAN DEFAULT FALSE,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE
+    )
+    ''',
+    'sidebar_preferences': '''
+    CREATE TABLE IF NOT EXISTS sidebar_preferences (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        page_order TEXT,  -- JSON array of page names in order
+        hidden_pages TEXT, -- JSON array of hidden page names
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    ''',
+    'student_class_history': '''
+    CREATE TABLE IF NOT EXISTS student_class_history (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER NOT NULL,
+        class_id INTEGER NOT NULL,
+        start_date DATE NOT NULL,
+        end_date DATE,
+        notes TEXT,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
+        FOREIGN KEY (class_id) REFERENCES classes (id)
+    )
+    ''',
+    'student_notes': '''
+    CREATE TABLE IF NOT EXISTS student_notes (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER NOT NULL,
+        teacher_id INTEGER NOT NULL,
+        class_id INTEGER,
+        content TEXT NOT NULL,
+        note_type TEXT DEFAULT 'Khác',
+        is_important BOOLEAN DEFAULT 0,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
+        FOREIGN KEY (class_id) REFERENCES classes (id) ON DELETE SET NULL
+    )
+    ''',
+    'document_files': '''
+    CREATE TABLE IF NOT EXISTS document_files (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER NOT NULL,
+        file_name TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        file_data BLOB NOT NULL,
+        upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        uploaded_by INTEGER NOT NULL,
+        description TEXT,
+        category TEXT DEFAULT 'profile',
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE
+    )
+    ''',
+    'merge_log': '''
+    CREATE TABLE IF NOT EXISTS merge_log (
+        id INTEGER PRIMARY KEY,
+        person_type TEXT NOT NULL,
+        keep_id INTEGER NOT NULL,
+        drop_ids TEXT NOT NULL,
+        rows_moved TEXT,
+        merged_by INTEGER,
+        merged_at TEXT NOT NULL
+    )
+    ''',
+    'change_log': '''
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        changed_at TEXT NOT NULL
+    )
+    ''',
+    'change_consumers': '''
+    CREATE TABLE IF NOT EXISTS change_consumers (
+        name TEXT PRIMARY KEY,
+        acked_seq INTEGER NOT NULL,
+        acked_at TEXT NOT NULL
+    )
+    ''',
+}
+
+# Medical records point at a student or a veteran depending on patient_type,
+# which a foreign key cannot express; these triggers do the cascade instead
+PATIENT_CASCADE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_students_delete_medical_records
+    AFTER DELETE ON students
+    BEGIN
+        DELETE FROM medical_records WHERE patient_type = 'student' AND patient_id = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_veterans_delete_medical_records
+    AFTER DELETE ON veterans
+    BEGIN
+        DELETE FROM medical_records WHERE patient_type = 'veteran' AND patient_id = OLD.id;
+    END
+    """,
+]
+
+# Tables whose row changes are appended to change_log by triggers, the
+# change feed read by the Postgres replica, caches and exports. Rows are
+# identified by rowid (= id) and op is 'I', 'U' or 'D'; readers fetch the
+# current row, so no values are logged.
+CHANGE_LOG_TABLES = [
+    'users', 'classes', 'students', 'families', 'veterans', 'periodic_assessments', 'supports',
+    'medical_records', 'psychological_evaluations', 'student_class_history', 'student_notes',
+    'document_files',
+]
+
+def change_log_triggers(table: str) -> List[str]:
+    """AFTER INSERT/UPDATE/DELETE triggers logging a table's changed rowids"""
+    now = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_log_insert
+        AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, op, changed_at) VALUES ('{table}', NEW.rowid, 'I', {now});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_log_update
+        AFTER UPDATE ON {table}
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, op, changed_at)
+            SELECT '{table}', OLD.rowid, 'D', {now} WHERE OLD.rowid IS NOT NEW.rowid;
+            INSERT INTO change_log (table_name, row_id, op, changed_at) VALUES ('{table}', NEW.rowid, 'U', {now});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_log_delete
+        AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, op, changed_at) VALUES ('{table}', OLD.rowid, 'D', {now});
+        END
+        """,
+    ]
+
+def log_changes(conn: sqlite3.Connection, table: str, row_ids: List[int], op: str):
+    """Log changes the triggers cannot see: rows of the archive.db tables
+
+    Consumers that read the <table>_all views (the Postgres replica) need
+    these to follow archived rows that were repointed, renumbered or purged.
+    """
+    conn.executemany(
+        "INSERT INTO main.change_log (table_name, row_id, op, changed_at) "
+        "VALUES (?, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'))",
+        [(table, row_id, op) for row_id in row_ids]
+    )
+
+def create_change_log(conn: sqlite3.Connection):
+    """Create change_log, its consumers table and triggers if they do not exist yet"""
+    conn.execute(TABLE_SCHEMAS['change_log'])
+    conn.execute(TABLE_SCHEMAS['change_consumers'])
+    for table in CHANGE_LOG_TABLES:
+        for trigger in change_log_triggers(table):
+            conn.execute(trigger)
+
+# Entries returned per changes_since call
+CHANGE_FEED_PAGE_SIZE = 1000
+
+# Entries are dropped after this long even if a registered consumer has
+# not acknowledged them; that consumer then gets reset=True and rescans
+CHANGE_LOG_RETENTION_DAYS = 7
+
+def change_log_bounds(conn: sqlite3.Connection) -> tuple:
+    """(first seq still in the log, last seq ever logged)"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    last_seq = row[0] if row else 0
+    first_seq = conn.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+    return (first_seq if first_seq is not None else last_seq + 1), last_seq
+
+def read_changes(conn: sqlite3.Connection, cursor: int, limit: int = CHANGE_FEED_PAGE_SIZE,
+                 tables: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Change log entries after cursor, oldest first
+
+    Returns {'changes': [(seq, table, row_id, op, changed_at)], 'cursor',
+    'has_more', 'reset'}. reset is True when the entries after cursor are
+    no longer all in the log (truncated, or a restored older file); the
+    caller then rescans what it tracks and continues from the returned
+    cursor. With tables, other tables' entries are skipped but the cursor
+    still moves past them.
+    """
+    first_seq, last_seq = change_log_bounds(conn)
+    if cursor > last_seq or first_seq > cursor + 1:
+        return {'changes': [], 'cursor': last_seq, 'has_more': False, 'reset': True}
+
+    rows = conn.execute(
+        "SELECT seq, table_name, row_id, op, changed_at FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?",
+        (cursor, limit)
+    ).fetchall()
+    if rows:
+        cursor = rows[-1][0]
+    if tables is not None:
+        rows = [row for row in rows if row[1] in tables]
+    return {'changes': rows, 'cursor': cursor, 'has_more': cursor < last_seq, 'reset': False}
+
+def register_change_consumer(conn: sqlite3.Connection, name: str) -> int:
+    """Register a consumer starting at the end of the log; returns its cursor
+
+    The log keeps entries until every registered consumer has
+    acknowledged them. Registering again keeps the existing cursor.
+    """
+    _, last_seq = change_log_bounds(conn)
+    with conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO change_consumers (name, acked_seq, acked_at) VALUES (?, ?, ?)",
+            (name, last_seq, datetime.now().isoformat())
+        )
+    return conn.execute("SELECT acked_seq FROM change_consumers WHERE name = ?", (name,)).fetchone()[0]
+
+def truncate_change_log(conn: sqlite3.Connection, max_age_days: int = CHANGE_LOG_RETENTION_DAYS) -> int:
+    """Drop entries every consumer has acknowledged, and entries past the retention age
+
+    With no registered consumer nothing reads the log, so it is emptied.
+    Returns the number of entries removed.
+    """
+    with conn:
+        removed = conn.execute("""
+            DELETE FROM change_log
+            WHERE seq <= COALESCE((SELECT MIN(acked_seq) FROM change_consumers), seq)
+        """).rowcount
+        removed += conn.execute(
+            "DELETE FROM change_log WHERE changed_at < strftime('%Y-%m-%d %H:%M:%f', 'now', ?)",
+            (f'-{max_age_days} days',)
+        ).rowcount
+    return removed
+
+def ack_changes(conn: sqlite3.Connection, name: str, cursor: int) -> int:
+    """Record that a consumer has processed everything up to cursor
+
+    Truncates what all consumers have now seen; returns the number of
+    entries removed.
+    """
+    with conn:
+        conn.execute("""
+            INSERT INTO change_consumers (name, acked_seq, acked_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET acked_seq = excluded.acked_seq, acked_at = excluded.acked_at
+        """, (name, cursor, datetime.now().isoformat()))
+    return truncate_change_log(conn)
+
+# Indexes on foreign key columns. Lookups of a student's records, orphan
+# scans in database_cleanup and ON DELETE actions all go through them.
+FOREIGN_KEY_INDEXES = [
+    ('idx_students_class_id', 'students', 'class_id'),
+    ('idx_users_family_student_id', 'users', 'family_student_id'),
+    ('idx_families_student_id', 'families', 'student_id'),
+    ('idx_periodic_assessments_student_id', 'periodic_assessments', 'student_id'),
+    ('idx_supports_student_id', 'supports', 'student_id'),
+    ('idx_medical_records_patient', 'medical_records', 'patient_type, patient_id'),
+    ('idx_psychological_evaluations_student_id', 'psychological_evaluations', 'student_id'),
+    ('idx_student_class_history_student_id', 'student_class_history', 'student_id'),
+    ('idx_student_class_history_class_id', 'student_class_history', 'class_id'),
+    ('idx_student_notes_student_id', 'student_notes', 'student_id'),
+    ('idx_student_notes_class_id', 'student_notes', 'class_id'),
+    ('idx_document_files_student_id', 'document_files', 'student_id'),
+]
+
+# Columns pointing at a person, rewritten when duplicates are merged:
+# person_type -> [(table, column, row filter)]
+PERSON_REFERENCES = {
+    'student': [
+        ('families', 'student_id', None),
+        ('periodic_assessments', 'student_id', None),
+        ('supports', 'student_id', None),
+        ('medical_records', 'patient_id', "patient_type = 'student'"),
+        ('psychological_evaluations', 'student_id', None),
+        ('student_class_history', 'student_id', None),
+        ('student_notes', 'student_id', None),
+        ('document_files', 'student_id', None),
+        ('users', 'family_student_id', None),
+    ],
+    'veteran': [
+        ('medical_records', 'patient_id', "patient_type = 'veteran'"),
+    ],
+}
+
+# Tables of the attached archive database that also point at people
+ARCHIVE_PERSON_REFERENCES = {
+    'student': [
+        ('medical_records', 'patient_id', "patient_type = 'student'"),
+        ('student_class_history', 'student_id', None),
+    ],
+    'veteran': [
+        ('medical_records', 'patient_id', "patient_type = 'veteran'"),
+    ],
+}
+
+PERSON_TABLES = {'student': 'students', 'veteran': 'veterans'}
+
+# Dropped ids rewritten per UPDATE while merging
+MERGE_BATCH_SIZE = 500
+
+def create_foreign_key_indexes(conn: sqlite3.Connection):
+    """Create the foreign key column indexes if they do not exist yet"""
+    for name, table, columns in FOREIGN_KEY_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+# PRAGMA user_version once the tables carry the current ON DELETE actions.
+# 2: student_class_history.class_id no longer cascades
+FOREIGN_KEY_SCHEMA_VERSION = 2
+
+def rebuild_table(conn: sqlite3.Connection, table: str):
+    """Recreate a table from TABLE_SCHEMAS, keeping its rows and column order
+
+    This is the table rebuild procedure from the SQLite ALTER TABLE docs;
+    it has to run with foreign key enforcement off, inside a transaction.
+    Columns the old table has beyond TABLE_SCHEMAS are carried over.
+    """
+    ddl = TABLE_SCHEMAS[table]
+    body = ddl[ddl.index('(') + 1:ddl.rindex(')')]
+    lines = [line.strip().rstrip(',') for line in body.strip().splitlines() if line.strip()]
+    column_defs = {line.split()[0]: line for line in lines if not line.startswith('FOREIGN KEY')}
+    constraints = [line for line in lines if line.startswith('FOREIGN KEY')]
+
+    old_columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    definitions = []
+    for _, name, col_type, not_null, default, _ in old_columns:
+        if name in column_defs:
+            definitions.append(column_defs.pop(name))
+        else:
+            definitions.append(f"{name} {col_type}" + (f" DEFAULT {default}" if default is not None else ""))
+    definitions.extend(column_defs.values())
+
+    column_list = ', '.join(column[1] for column in old_columns)
+    conn.execute(f"CREATE TABLE {table}__new (\n    " + ',\n    '.join(definitions + constraints) + "\n)")
+    conn.execute(f"INSERT INTO {table}__new ({column_list}) SELECT {column_list} FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}__new RENAME TO {table}")
+
+def repair_foreign_keys(conn: sqlite3.Connection) -> int:
+    """Fix rows that break a foreign key, as the ON DELETE action would have
+
+    Returns the number of rows changed. Used once, before enforcement starts.
+    """
+    actions = {}
+    repaired = 0
+    for table, rowid, _, fk_id in conn.execute("PRAGMA foreign_key_check").fetchall():
+        if table not in actions:
+            actions[table] = {row[0]: (row[3], row[6]) for row in conn.execute(f"PRAGMA foreign_key_list({table})")}
+        column, on_delete = actions[table][fk_id]
+        if on_delete == 'SET NULL':
+            conn.execute(f"UPDATE {table} SET {column} = NULL WHERE rowid = ?", (rowid,))
+        else:
+            conn.execute(f"DELETE FROM {table} WHERE rowid = ?", (rowid,))
+        repaired += 1
+
+    for patient_type, parent in (('student', 'students'), ('veteran', 'veterans')):
+        cursor = conn.execute(f"""
+            DELETE FROM medical_records
+            WHERE patient_type = ?
+              AND NOT EXISTS (SELECT 1 FROM {parent} p WHERE p.id = medical_records.patient_id)
+        """, (patient_type,))
+        repaired += cursor.rowcount
+    return repaired
+
+def migrate_foreign_keys(conn: sqlite3.Connection) -> bool:
+    """One-time migration to enforced foreign keys with ON DELETE actions
+
+    Rebuilds the tables from TABLE_SCHEMAS, adds the patient cascade
+    triggers and repairs existing orphans, all in one transaction.
+    Returns True if the migration ran.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= FOREIGN_KEY_SCHEMA_VERSION:
+        return False
+
+    conn.commit()
+    # Renaming a table fails while any view is broken, and the temp views
+    # over archived rows break when their table is dropped; they are
+    # recreated by attach_archive afterwards
+    for (view,) in conn.execute("SELECT name FROM temp.sqlite_master WHERE type = 'view'").fetchall():
+        conn.execute(f"DROP VIEW temp.{view}")
+    # Enforcement can only be switched outside a transaction
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table in TABLE_SCHEMAS:
+            if table in existing:
+                rebuild_table(conn, table)
+            else:
+                conn.execute(TABLE_SCHEMAS[table])
+        create_foreign_key_indexes(conn)
+        for trigger in PATIENT_CASCADE_TRIGGERS:
+            conn.execute(trigger)
+        create_change_log(conn)
+
+        repaired = repair_foreign_keys(conn)
+        violations = conn.execute("PRAGMA foreign_key_check").fetchall()
+        if violations:
+            raise sqlite3.IntegrityError(f"Foreign key violations left after repair: {violations[:5]}")
+
+        conn.execute(f"PRAGMA user_version = {FOREIGN_KEY_SCHEMA_VERSION}")
+        conn.commit()
+        print(f"Foreign key migration done, {repaired} orphaned rows repaired")
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+
+# Pages of the app: id -> (name, group translation key, default group name, path)
+PAGES = {
+    "01_Quản_lý_Hệ_thống": ("Quản lý Hệ thống", "groups.management", "Quản trị hệ thống", "pages/01_Quản_lý_Hệ_thống.py"),
+    "02_Quản_lý_hồ_sơ": ("Quản lý hồ sơ", "groups.users", "Quản lý người dùng", "pages/02_Quản_lý_hồ_sơ.py"),
+    "03_Y_tế": ("Y tế", "groups.support", "Hỗ trợ & Theo dõi", "pages/03_Y_tế.py"),
+    "04_Lớp_học": ("Lớp học", "groups.users", "Quản lý người dùng", "pages/04_Lớp_học.py"),
+}
+
+# Pages each role can open, in sidebar order
+ROLE_PAGE_IDS = {
+    # Admin users have access to all pages
+    'admin': ("01_Quản_lý_Hệ_thống", "02_Quản_lý_hồ_sơ", "03_Y_tế", "04_Lớp_học"),
+    'administrative': ("01_Quản_lý_Hệ_thống", "02_Quản_lý_hồ_sơ", "03_Y_tế", "04_Lớp_học"),
+    # Teachers can access class management and student profiles
+    'teacher': ("02_Quản_lý_hồ_sơ", "04_Lớp_học"),
+    # Medical staff can access medical records and student profiles
+    'doctor': ("02_Quản_lý_hồ_sơ", "03_Y_tế"),
+    'nurse': ("02_Quản_lý_hồ_sơ", "03_Y_tế"),
+    # Counselors can access student profiles for psychological evaluations
+    'counselor': ("02_Quản_lý_hồ_sơ",),
+    # Family users only see their child's class information
+    'family': ("04_Lớp_học",),
+}
+
+_role_pages_cache = {}
+
+def get_pages_for_role(user_role: str) -> List[Dict[str, str]]:
+    """Page entries (id, name, group, path) of a role, built once per role and language
+
+    The returned list is shared between callers and must not be modified.
+    """
+    key = (user_role, get_current_language())
+    pages = _role_pages_cache.get(key)
+    if pages is None:
+        from translations import get_text
+        pages = []
+        for page_id in ROLE_PAGE_IDS.get(user_role, ()):
+            name, group_key, group_default, path = PAGES[page_id]
+            pages.append({"id": page_id, "name": name, "group": get_text(group_key, group_default), "path": path})
+        _role_pages_cache[key] = pages
+    return pages
+
 class SidebarPreference:
     def __init__(self, id: int, user_id: int, page_order: str, hidden_pages: str):
         self.id = id
@@ -77,7 +705,8 @@ class Database:
             self.db_path = 'lang_huu_nghi.db'
             self.backup_dir = 'database_backups'
             os.makedirs(self.backup_dir, exist_ok=True)
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn_lock = threading.Lock()
+            self.conn = self._connect()
             print("Creating tables...")
             self.create_tables()
             print("Creating initial admin...")
@@ -96,24 +725,44 @@ class Database:
                 self.conn.close()
             raise
 
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the application database, with archive.db attached"""
+        from record_archive import attach_archive
+        conn = connect_database(self.db_path, check_same_thread=False)
+        attach_archive(conn, self.db_path, create=True)
+        return conn
+
+    def reconnect(self):
+        """Replace the shared connection with a fresh one.
+
+        Used after the database file has been restored underneath the app.
+        New queries go to the new connection straight away. The old one is
+        not closed here: session threads may still be running a query or
+        holding a cursor on it. It is closed by garbage collection once the
+        last cursor using it is gone.
+        """
+        with self._conn_lock:
+            self.conn = self._connect()
+
+        # A restored backup may predate the foreign key migration
+        from record_archive import attach_archive
+        if migrate_foreign_keys(self.conn):
+            attach_archive(self.conn, self.db_path, create=True)
+        # or the change log
+        create_change_log(self.conn)
+        self.conn.commit()
+
+    @classmethod
+    def reconnect_all(cls):
+        """Reconnect the shared instance, if the app has initialized one"""
+        if cls._initialized and cls._instance is not None:
+            cls._instance.reconnect()
+
     def create_tables(self):
         cursor = self.conn.cursor()
 
         # Users table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            role TEXT NOT NULL,
-            full_name TEXT NOT NULL,
-            email TEXT,
-            family_student_id INTEGER,
-            theme_preference TEXT DEFAULT 'Chính thức',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (family_student_id) REFERENCES students (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['users'])
 
         # Execute the ALTER TABLE statement within a try-except block
         try:
@@ -127,198 +776,50 @@ class Database:
                 print(f"Note: {str(e)}")
 
         # Classes table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS classes (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            teacher_id INTEGER NOT NULL,
-            academic_year TEXT NOT NULL,
-            notes TEXT,
-            FOREIGN KEY (teacher_id) REFERENCES users (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['classes'])
 
         # Students table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS students (
-            id INTEGER PRIMARY KEY,
-            full_name TEXT NOT NULL,
-            birth_date DATE,
-            gender TEXT,
-            phone TEXT,
-            address TEXT,
-            email TEXT,
-            admission_date DATE,
-            class_id INTEGER,
-            year TEXT,
-            parent_name TEXT,
-            profile_image BLOB,
-            decision_number TEXT,
-            nha_chu_t_info TEXT,
-            health_on_admission TEXT,
-            initial_characteristics TEXT,
-            FOREIGN KEY (class_id) REFERENCES classes (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['students'])
 
         # Family information table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS families (
-            id INTEGER PRIMARY KEY,
-            student_id INTEGER NOT NULL,
-            guardian_name TEXT NOT NULL,
-            relationship TEXT NOT NULL,
-            occupation TEXT,
-            address TEXT,
-            phone TEXT,
-            household_status TEXT,
-            support_status TEXT,
-            FOREIGN KEY (student_id) REFERENCES students (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['families'])
 
         # Veterans table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS veterans (
-            id INTEGER PRIMARY KEY,
-            full_name TEXT NOT NULL,
-            birth_date DATE NOT NULL,
-            service_period TEXT,
-            health_condition TEXT,
-            address TEXT,
-            email TEXT,
-            contact_info TEXT,
-            profile_image BLOB,
-            initial_characteristics TEXT
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['veterans'])
 
         # Periodic assessments table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS periodic_assessments (
-            id INTEGER PRIMARY KEY,
-            student_id INTEGER NOT NULL,
-            assessment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            academic_performance TEXT,
-            health_condition TEXT,
-            social_behavior TEXT,
-            teacher_notes TEXT,
-            doctor_notes TEXT,
-            counselor_notes TEXT,
-            FOREIGN KEY (student_id) REFERENCES students (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['periodic_assessments'])
 
         # Support records table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS supports (
-            id INTEGER PRIMARY KEY,
-            student_id INTEGER NOT NULL,
-            support_type TEXT NOT NULL,
-            amount REAL,
-            start_date DATE NOT NULL,
-            end_date DATE,
-            approval_status TEXT NOT NULL,
-            approved_by INTEGER NOT NULL,
-            notes TEXT,
-            FOREIGN KEY (student_id) REFERENCES students (id),
-            FOREIGN KEY (approved_by) REFERENCES users (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['supports'])
 
         # Medical records table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS medical_records (
-            id INTEGER PRIMARY KEY,
-            patient_id INTEGER NOT NULL,
-            patient_type TEXT NOT NULL,
-            diagnosis TEXT,
-            treatment TEXT,
-            doctor_id INTEGER NOT NULL,
-            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            notes TEXT,
-            notification_sent BOOLEAN DEFAULT FALSE,
-            is_routine_checkup BOOLEAN DEFAULT FALSE,
-            requested_by_family BOOLEAN DEFAULT FALSE,
-            emergency_case BOOLEAN DEFAULT FALSE,
-            FOREIGN KEY (doctor_id) REFERENCES users (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['medical_records'])
 
         # Psychological evaluations table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS psychological_evaluations (
-            id INTEGER PRIMARY KEY,
-            student_id INTEGER NOT NULL,
-            evaluation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            evaluator_id INTEGER NOT NULL,
-            assessment TEXT,
-            recommendations TEXT,
-            follow_up_date DATE,
-            notification_sent BOOLEAN DEFAULT FALSE,
-            FOREIGN KEY (student_id) REFERENCES students (id),
-            FOREIGN KEY (evaluator_id) REFERENCES users (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['psychological_evaluations'])
 
         # Sidebar preferences table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sidebar_preferences (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            page_order TEXT,  -- JSON array of page names in order
-            hidden_pages TEXT, -- JSON array of hidden page names
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['sidebar_preferences'])
 
         # Add student class history table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS student_class_history (
-            id INTEGER PRIMARY KEY,
-            student_id INTEGER NOT NULL,
-            class_id INTEGER NOT NULL,
-            start_date DATE NOT NULL,
-            end_date DATE,
-            notes TEXT,
-            FOREIGN KEY (student_id) REFERENCES students (id),
-            FOREIGN KEY (class_id) REFERENCES classes (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['student_class_history'])
 
         # Student notes table for teacher notes about students
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS student_notes (
-            id INTEGER PRIMARY KEY,
-            student_id INTEGER NOT NULL,
-            teacher_id INTEGER NOT NULL,
-            class_id INTEGER,
-            content TEXT NOT NULL,
-            note_type TEXT DEFAULT 'Khác',
-            is_important BOOLEAN DEFAULT 0,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (student_id) REFERENCES students (id),
-            FOREIGN KEY (teacher_id) REFERENCES users (id),
-            FOREIGN KEY (class_id) REFERENCES classes (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['student_notes'])
 
         # Document files table for hồ sơ quá trình
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS document_files (
-            id INTEGER PRIMARY KEY,
-            student_id INTEGER NOT NULL,
-            file_name TEXT NOT NULL,
-            file_type TEXT NOT NULL,
-            file_data BLOB NOT NULL,
-            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            uploaded_by INTEGER NOT NULL,
-            description TEXT,
-            category TEXT DEFAULT 'profile',
-            FOREIGN KEY (student_id) REFERENCES students (id),
-            FOREIGN KEY (uploaded_by) REFERENCES users (id)
-        )
-        ''')
+        cursor.execute(TABLE_SCHEMAS['document_files'])
+
+        # Audit trail of merged duplicate records
+        cursor.execute(TABLE_SCHEMAS['merge_log'])
+
+        # Feed of changed rows and the cursors of its consumers
+        cursor.execute(TABLE_SCHEMAS['change_log'])
+        cursor.execute(TABLE_SCHEMAS['change_consumers'])
+
+        # Supabase latency samples moved to monitoring.db (supabase_monitor)
+        cursor.execute("DROP TABLE IF EXISTS supabase_latency")
 
         # Add new columns to existing tables
         try:
@@ -353,8 +854,19 @@ class Database:
             if "duplicate column name" not in str(e).lower():
                 print(f"Note: {str(e)}")
 
+        create_foreign_key_indexes(self.conn)
+        for trigger in PATIENT_CASCADE_TRIGGERS:
+            cursor.execute(trigger)
+        create_change_log(self.conn)
+
         self.conn.commit()
 
+        migrate_foreign_keys(self.conn)
+
+        # Views over live and archived rows for historical queries
+        from record_archive import attach_archive
+        attach_archive(self.conn, self.db_path, create=True)
+
     def backup_database(self, backup_name: Optional[str] = None) -> str:
         """Create a backup of the current database"""
         try:
@@ -362,55 +874,45 @@ class Database:
             backup_file = backup_name or f"backup_{timestamp}.db"
             backup_path = os.path.join(self.backup_dir, backup_file)
 
-            # Close current connection
-            self.conn.close()
-
-            # Copy database file
-            shutil.copy2(self.db_path, backup_path)
+            # Online copy through the live connection: other sessions keep
+            # working and writes made between steps are folded into the copy
+            backup_conn = sqlite3.connect(backup_path)
+            try:
+                self.conn.backup(backup_conn, pages=1024)
+            finally:
+                backup_conn.close()
 
-            # Reopen connection
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            # Register the snapshot in the shared backup catalog
+            from local_backup import BackupCatalog, catalog_entry
+            BackupCatalog(self.backup_dir).add(catalog_entry(backup_path, {'type': 'snapshot'}, backup_path))
 
             return backup_path
         except Exception as e:
             print(f"Backup error: {str(e)}")
-            # Ensure connection is reopened even if backup fails
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
             raise e
 
     def restore_database(self, backup_path: str) -> bool:
-        """Restore database from a backup file"""
+        """Restore database from a backup file without restarting the app"""
         try:
             if not os.path.exists(backup_path):
                 raise FileNotFoundError("Backup file not found")
 
-            # Close current connection
-            self.conn.close()
-
-            # Replace current database with backup
-            shutil.copy2(backup_path, self.db_path)
-
-            # Reopen connection
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            # Validates the backup, writes it in with the backup API and
+            # reconnects this instance
+            from local_backup import hot_restore
+            hot_restore(backup_path, self.db_path)
 
             return True
         except Exception as e:
             print(f"Restore error: {str(e)}")
-            # Ensure connection is reopened even if restore fails
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
             raise e
 
     def get_available_backups(self) -> List[tuple]:
-        """Get list of available database backups"""
+        """Get list of available database backups from the backup catalog"""
         try:
-            backups = []
-            for file in os.listdir(self.backup_dir):
-                if file.endswith('.db'):
-                    path = os.path.join(self.backup_dir, file)
-                    timestamp = datetime.fromtimestamp(os.path.getctime(path))
-                    size = os.path.getsize(path) / (1024 * 1024)  # Size in MB
-                    backups.append((file, timestamp, f"{size:.2f} MB"))
-            return sorted(backups, key=lambda x: x[1], reverse=True)
+            from local_backup import backup_service
+            backups = backup_service.get_backup_info(types=None)
+            return [(b['filename'], b['created_datetime'], b['size']) for b in backups]
         except Exception as e:
             print(f"Error listing backups: {str(e)}")
             return []
@@ -477,8 +979,8 @@ class Database:
         column_names = [description[0] for description in cursor.description]
         print(f"DB Columns: {column_names}")
         
-        # Lấy tất cả các hàng
-        rows = cursor.fetchall()
+        # Lấy tất cả các hàng, dịch gender nếu ngôn ngữ là tiếng Anh
+        rows = translate_column(cursor.fetchall(), column_names.index('gender'))
         
         # Tạo danh sách học sinh
         students = []
@@ -486,12 +988,6 @@ class Database:
             # Tạo một map để truy cập dữ liệu theo tên cột
             row_data = dict(zip(column_names, row))
             
-            # Chuyển đổi ngôn ngữ nếu cần
-            if get_current_language() == 'en':
-                # Dịch gender
-                if row_data['gender']:
-                    row_data['gender'] = translate_value(row_data['gender'])
-            
             # Tạo đối tượng Student với các tham số đúng theo thứ tự khai báo trong class
             student = Student(
                 id=row_data['id'],
@@ -524,19 +1020,8 @@ class Database:
         cursor = self.conn.cursor()
         cursor.execute("SELECT * FROM veterans")
         
-        # Chuyển đổi dữ liệu nếu ngôn ngữ là tiếng Anh
-        if get_current_language() == 'en':
-            veterans = []
-            for row in cursor.fetchall():
-                # Tạo danh sách mới với các giá trị đã được dịch
-                translated_row = list(row)
-                # Dịch health_condition (index 4)
-                if row[4]:
-                    translated_row[4] = translate_value(row[4])
-                veterans.append(Veteran(*translated_row))
-            return veterans
-        else:
-            return [Veteran(*row) for row in cursor.fetchall()]
+        # Dịch health_condition (index 4) nếu ngôn ngữ là tiếng Anh
+        return [Veteran(*row) for row in translate_column(cursor.fetchall(), 4)]
 
     def get_students_for_selection(self, user_role: Optional[str] = None, family_student_id: Optional[int] = None) -> List[tuple]:
         """Get a list of students with their IDs for selection"""
@@ -941,20 +1426,8 @@ class Database:
             cursor = self.conn.cursor()
             cursor.execute(sql, params)
             
-            # Chuyển đổi dữ liệu nếu ngôn ngữ là tiếng Anh
-            if get_current_language() == 'en':
-                students = []
-                for row in cursor.fetchall():
-                    # Tạo danh sách mới với các giá trị đã được dịch
-                    translated_row = list(row)
-                    # Dịch gender
-                    if row[2]:
-                        translated_row[2] = translate_value(row[2]) 
-                        translated_row[10] = translate_value(row[10])
-                    students.append(Student(*translated_row))
-                return students
-            else:
-                return [Student(*row) for row in cursor.fetchall()]
+            # Dịch các cột 2 và 10 nếu ngôn ngữ là tiếng Anh
+            return [Student(*row) for row in translate_column(cursor.fetchall(), 2, 10)]
         except Exception as e:
             print(f"Search students error: {str(e)}")
             return []
@@ -1007,24 +1480,14 @@ class Database:
             cursor.execute(sql, params)
             
             # Chuyển đổi dữ liệu nếu ngôn ngữ là tiếng Anh
-            if get_current_language() == 'en':
-                veterans = []
-                for row in cursor.fetchall():
-                    # Tạo danh sách mới với các giá trị đã được dịch
-                    translated_row = list(row)
-                    # Dịch health_condition (index 4)
-                    if row[4]:
-                        translated_row[4] = translate_value(row[4])
-                    veterans.append(Veteran(*translated_row))
-                return veterans
-            else:
-                return [Veteran(*row) for row in cursor.fetchall()]
+            # Dịch health_condition (index 4) nếu ngôn ngữ là tiếng Anh
+            return [Veteran(*row) for row in translate_column(cursor.fetchall(), 4)]
         except Exception as e:
             print(f"Search veterans error: {str(e)}")
             return []
 
     def search_medical_records(self, query: dict) -> List[dict]:
-        """Search medical records with filters"""
+        """Search medical records with filters, archived records included"""
         try:
             sql = """
                 SELECT mr.*, 
@@ -1033,7 +1496,7 @@ class Database:
                         WHEN mr.patient_type = 'student' THEN s.full_name
                         WHEN mr.patient_type = 'veteran' THEN v.full_name
                     END as patient_name
-                FROM medical_records mr
+                FROM medical_records_all mr
                 JOIN users u ON mr.doctor_id = u.id
                 LEFT JOIN students s ON mr.patient_id = s.id AND mr.patient_type = 'student'
                 LEFT JOIN veterans v ON mr.patient_id = v.id AND mr.patient_type = 'veteran'
@@ -1151,12 +1614,36 @@ class Database:
             existing_student = cursor.fetchone()
             
             if existing_student:
-                # Nếu học sinh đã tồn tại, xóa bản ghi cũ và thêm mới
+                # Nếu học sinh đã tồn tại, cập nhật bản ghi cũ tại chỗ để giữ
+                # nguyên hồ sơ liên quan (xóa sẽ kéo theo xóa dây chuyền)
                 student_id = existing_student[0]
                 print(f"Tìm thấy học sinh trùng tên: {student_name} (ID: {student_id}). Cập nhật thông tin mới.")
                 
-                # Xóa bản ghi cũ
-                cursor.execute("DELETE FROM students WHERE id = ?", (student_id,))
+                cursor.execute("""
+                    UPDATE students SET
+                        birth_date = ?, address = ?, email = ?, admission_date = ?,
+                        class_id = ?, gender = ?, phone = ?, year = ?, parent_name = ?,
+                        decision_number = ?, nha_chu_t_info = ?, health_on_admission = ?,
+                        initial_characteristics = ?
+                    WHERE id = ?
+                """, (
+                    student_data.get("birth_date"),
+                    student_data.get("address", ""),
+                    student_data.get("email", ""),
+                    student_data["admission_date"],
+                    student_data.get("class_id"),
+                    student_data.get("gender", ""),
+                    student_data.get("phone", ""),
+                    student_data.get("year", ""),
+                    student_data.get("parent_name", ""),
+                    student_data.get("decision_number", ""),
+                    student_data.get("nha_chu_t_info", ""),
+                    student_data.get("health_on_admission", ""),
+                    student_data.get("initial_characteristics", ""),
+                    student_id
+                ))
+                self.conn.commit()
+                return student_id
 
             # In ra thứ tự trường dữ liệu khi thêm mới
             print("INSERT students order:")
@@ -1277,8 +1764,8 @@ class Database:
         column_names = [description[0] for description in cursor.description]
         print(f"DB Columns (get_students_by_class): {column_names}")
         
-        # Lấy tất cả các hàng
-        rows = cursor.fetchall()
+        # Lấy tất cả các hàng, dịch gender nếu ngôn ngữ là tiếng Anh
+        rows = translate_column(cursor.fetchall(), column_names.index('gender'))
         
         # Tạo danh sách học sinh
         students = []
@@ -1286,12 +1773,6 @@ class Database:
             # Tạo một map để truy cập dữ liệu theo tên cột
             row_data = dict(zip(column_names, row))
             
-            # Chuyển đổi ngôn ngữ nếu cần
-            if get_current_language() == 'en':
-                # Dịch gender
-                if row_data['gender']:
-                    row_data['gender'] = translate_value(row_data['gender'])
-            
             # Tạo đối tượng Student với các tham số đúng theo thứ tự khai báo trong class
             student = Student(
                 id=row_data['id'],
@@ -1489,51 +1970,7 @@ class Database:
 
     def get_available_pages(self, user_role: str) -> List[Dict[str, str]]:
         """Get list of available pages based on user role"""
-        from translations import get_text, get_current_language
-        pages = []
-
-        # Translation keys for groups
-        group_management = get_text("groups.management", "Quản trị hệ thống")
-        group_support = get_text("groups.support", "Hỗ trợ & Theo dõi")
-        group_users = get_text("groups.users", "Quản lý người dùng")
-        
-        # Pages based on user roles - dynamically filtered
-        if user_role in ['admin', 'administrative']:
-            # Admin users have access to all pages
-            pages.extend([
-                {"id": "01_Quản_lý_Hệ_thống", "name": "Quản lý Hệ thống", "group": group_management, "path": "pages/01_Quản_lý_Hệ_thống.py"},
-                {"id": "02_Quản_lý_hồ_sơ", "name": "Quản lý hồ sơ", "group": group_users, "path": "pages/02_Quản_lý_hồ_sơ.py"},
-                {"id": "03_Y_tế", "name": "Y tế", "group": group_support, "path": "pages/03_Y_tế.py"},
-                {"id": "04_Lớp_học", "name": "Lớp học", "group": group_users, "path": "pages/04_Lớp_học.py"},
-            ])
-        
-        elif user_role == 'teacher':
-            # Teachers can access class management and student profiles
-            pages.extend([
-                {"id": "02_Quản_lý_hồ_sơ", "name": "Quản lý hồ sơ", "group": group_users, "path": "pages/02_Quản_lý_hồ_sơ.py"},
-                {"id": "04_Lớp_học", "name": "Lớp học", "group": group_users, "path": "pages/04_Lớp_học.py"},
-            ])
-        
-        elif user_role in ['doctor', 'nurse']:
-            # Medical staff can access medical records and student profiles
-            pages.extend([
-                {"id": "02_Quản_lý_hồ_sơ", "name": "Quản lý hồ sơ", "group": group_users, "path": "pages/02_Quản_lý_hồ_sơ.py"},
-                {"id": "03_Y_tế", "name": "Y tế", "group": group_support, "path": "pages/03_Y_tế.py"},
-            ])
-        
-        elif user_role == 'counselor':
-            # Counselors can access student profiles for psychological evaluations
-            pages.extend([
-                {"id": "02_Quản_lý_hồ_sơ", "name": "Quản lý hồ sơ", "group": group_users, "path": "pages/02_Quản_lý_hồ_sơ.py"},
-            ])
-        
-        elif user_role == 'family':
-            # Family users only see their child's class information
-            pages.extend([
-                {"id": "04_Lớp_học", "name": "Lớp học", "group": group_users, "path": "pages/04_Lớp_học.py"},
-            ])
-        
-        return pages
+        return get_pages_for_role(user_role)
 
     def update_class(self, class_id: int, class_data: dict) -> bool:
         """Update class information"""
@@ -1676,7 +2113,7 @@ class Database:
                     c.name as class_name,
                     c.academic_year,
                     u.full_name as teacher_name
-                FROM student_class_history sch
+                FROM student_class_history_all sch
                 JOIN classes c ON sch.class_id = c.id
                 JOIN users u ON c.teacher_id = u.id
                 WHERE sch.student_id = ?
@@ -1684,12 +2121,9 @@ class Database:
             """, (student_id,))
 
             history = []
+            # Sử dụng translate_value để dịch 'Hiện tại' nếu language là tiếng Anh
+            current_label = translate_value('Hiện tại')
             for row in cursor.fetchall():
-                # Sử dụng translate_value để dịch 'Hiện tại' nếu language là tiếng Anh
-                current_label = 'Hiện tại'
-                if get_current_language() == 'en':
-                    current_label = translate_value(current_label)
-                    
                 history.append({
                     'start_date': row[0],
                     'end_date': row[1] if row[1] else current_label,
@@ -1911,6 +2345,175 @@ class Database:
             print(f"Error deleting user: {e}")
             self.conn.rollback()
             return False
+
+    def delete_student(self, student_id: int) -> bool:
+        """Delete a student together with all of their records
+
+        Dependent rows go through the ON DELETE CASCADE foreign keys and the
+        medical record trigger, in the same transaction.
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM students WHERE id = ?", (student_id,))
+            self.conn.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Error deleting student: {e}")
+            self.conn.rollback()
+            return False
+
+    def delete_veteran(self, veteran_id: int) -> bool:
+        """Delete a veteran together with their medical records"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM veterans WHERE id = ?", (veteran_id,))
+            self.conn.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Error deleting veteran: {e}")
+            self.conn.rollback()
+            return False
+
+    def merge_people(self, person_type: str, merges: List[tuple], merged_by: Optional[int] = None) -> Dict[str, int]:
+        """Merge duplicate students or veterans into the records kept
+
+        merges is a list of (keep_id, drop_ids). Every row pointing at a
+        dropped record is repointed at the kept one, empty fields of the
+        kept record are filled from the dropped ones, the dropped records
+        are deleted and each merge is written to merge_log, all in one
+        transaction. Rows are rewritten through a temporary id map, one
+        indexed UPDATE per table for each batch of dropped ids.
+        Archived rows in archive.db are repointed in the same transaction,
+        but in WAL mode a crash during the commit can keep one file's side
+        only. If the live side was lost nothing was merged and the merge can
+        simply be run again; if the archive side was lost, the archive job
+        replays merge_log onto it (record_archive.repair_merged_references).
+        Returns the number of rows repointed per table.
+        """
+        person_table = PERSON_TABLES[person_type]
+        merges = [(keep_id, sorted(set(drop_ids) - {keep_id})) for keep_id, drop_ids in merges]
+        merges = [(keep_id, drop_ids) for keep_id, drop_ids in merges if drop_ids]
+        if not merges:
+            return {}
+
+        pairs = [(drop_id, keep_id) for keep_id, drop_ids in merges for drop_id in drop_ids]
+        dropped = [drop_id for drop_id, _ in pairs]
+        if len(set(dropped)) != len(dropped) or set(dropped) & {keep_id for keep_id, _ in merges}:
+            raise ValueError("A record can only be dropped once and cannot be both kept and dropped")
+
+        schemas = [row[1] for row in self.conn.execute("PRAGMA database_list").fetchall()]
+        references = [('main', *ref) for ref in PERSON_REFERENCES[person_type]]
+        if 'archive' in schemas:
+            references += [('archive', *ref) for ref in ARCHIVE_PERSON_REFERENCES[person_type]]
+        columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({person_table})").fetchall() if row[1] != 'id']
+
+        cursor = self.conn.cursor()
+        try:
+            self.conn.commit()
+            cursor.execute("BEGIN IMMEDIATE")
+            ids = dropped + [keep_id for keep_id, _ in merges]
+            found = 0
+            for start in range(0, len(ids), MERGE_BATCH_SIZE):
+                chunk = ids[start:start + MERGE_BATCH_SIZE]
+                found += cursor.execute(
+                    f"SELECT COUNT(*) FROM {person_table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchone()[0]
+            if found != len(ids):
+                raise ValueError(f"Some {person_table} to merge do not exist")
+
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS merge_map (drop_id INTEGER PRIMARY KEY, keep_id INTEGER NOT NULL)")
+            cursor.execute("DELETE FROM temp.merge_map")
+            moved = {}
+            for start in range(0, len(pairs), MERGE_BATCH_SIZE):
+                cursor.executemany("INSERT INTO temp.merge_map (drop_id, keep_id) VALUES (?, ?)",
+                                   pairs[start:start + MERGE_BATCH_SIZE])
+
+                for schema, table, column, row_filter in references:
+                    condition = f" AND {row_filter}" if row_filter else ""
+                    if schema == 'archive':
+                        # Archived rows have no change_log triggers
+                        log_changes(self.conn, table, [row[0] for row in cursor.execute(f"""
+                            SELECT id FROM {schema}.{table}
+                            WHERE {column} IN (SELECT drop_id FROM temp.merge_map){condition}
+                        """).fetchall()], 'U')
+                    cursor.execute(f"""
+                        UPDATE {schema}.{table}
+                        SET {column} = (SELECT m.keep_id FROM temp.merge_map m WHERE m.drop_id = {table}.{column})
+                        WHERE {column} IN (SELECT drop_id FROM temp.merge_map){condition}
+                    """)
+                    key = table if schema == 'main' else f"{schema}.{table}"
+                    moved[key] = moved.get(key, 0) + cursor.rowcount
+
+                # Keep the first non-empty value of each field the kept record lacks
+                assignments = ', '.join(f"""
+                    {column} = COALESCE(NULLIF({column}, ''), (
+                        SELECT d.{column} FROM {person_table} d
+                        JOIN temp.merge_map m ON d.id = m.drop_id
+                        WHERE m.keep_id = {person_table}.id AND d.{column} IS NOT NULL AND d.{column} != ''
+                        ORDER BY d.id LIMIT 1
+                    ))""" for column in columns)
+                cursor.execute(f"""
+                    UPDATE {person_table} SET {assignments}
+                    WHERE id IN (SELECT keep_id FROM temp.merge_map)
+                """)
+                cursor.execute(f"DELETE FROM {person_table} WHERE id IN (SELECT drop_id FROM temp.merge_map)")
+                cursor.execute("DELETE FROM temp.merge_map")
+
+            # Row counts are those of the whole operation when several groups are merged at once
+            merged_at = datetime.now().isoformat()
+            cursor.executemany(
+                "INSERT INTO merge_log (person_type, keep_id, drop_ids, rows_moved, merged_by, merged_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(person_type, keep_id, json.dumps(drop_ids), json.dumps(moved), merged_by, merged_at)
+                 for keep_id, drop_ids in merges]
+            )
+            self.conn.commit()
+            return moved
+        except Exception as e:
+            print(f"Error merging {person_table}: {e}")
+            self.conn.rollback()
+            raise
+
+    def merge_students(self, keep_id: int, drop_ids: List[int], merged_by: Optional[int] = None) -> Dict[str, int]:
+        """Merge duplicate student records into keep_id"""
+        return self.merge_people('student', [(keep_id, drop_ids)], merged_by)
+
+    def merge_veterans(self, keep_id: int, drop_ids: List[int], merged_by: Optional[int] = None) -> Dict[str, int]:
+        """Merge duplicate veteran records into keep_id"""
+        return self.merge_people('veteran', [(keep_id, drop_ids)], merged_by)
+
+    def changes_since(self, cursor: int = 0, limit: int = CHANGE_FEED_PAGE_SIZE,
+                      tables: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Rows changed after cursor, for caches, exports and sync jobs
+
+        Pass the returned cursor to the next call and to acknowledge_changes
+        once the changes are handled. See read_changes for the result.
+        """
+        return read_changes(self.conn, cursor, limit, tables)
+
+    def register_change_consumer(self, name: str) -> int:
+        """Start tracking a consumer of the change feed; returns its cursor"""
+        return register_change_consumer(self.conn, name)
+
+    def acknowledge_changes(self, name: str, cursor: int) -> int:
+        """Mark the changes up to cursor as handled by a consumer"""
+        return ack_changes(self.conn, name, cursor)
+
+    def remove_change_consumer(self, name: str) -> bool:
+        """Stop keeping change log entries for a consumer"""
+        with self.conn:
+            removed = self.conn.execute("DELETE FROM change_consumers WHERE name = ?", (name,)).rowcount
+        truncate_change_log(self.conn)
+        return removed > 0
+
+    def get_change_consumers(self) -> List[Dict]:
+        """Registered consumers with their cursor and how many entries they are behind"""
+        _, last_seq = change_log_bounds(self.conn)
+        rows = self.conn.execute(
+            "SELECT name, acked_seq, acked_at FROM change_consumers ORDER BY name"
+        ).fetchall()
+        return [{'name': name, 'cursor': acked_seq, 'acked_at': acked_at, 'behind': last_seq - acked_seq}
+                for name, acked_seq, acked_at in rows]
+
     def search_student_class_history(self, student_id: Optional[int] = None, 
                                    student_name: Optional[str] = None,
                                    from_date: Optional[str] = None,
@@ -1926,7 +2529,7 @@ class Database:
                     c.name as class_name,
                     c.academic_year,
                     u.full_name as teacher_name
-                FROM student_class_history sch
+                FROM student_class_history_all sch
                 JOIN students s ON sch.student_id = s.id
                 JOIN classes c ON sch.class_id = c.id
                 JOIN users u ON c.teacher_id = u.id
@@ -1954,12 +2557,9 @@ class Database:
 
             cursor.execute(sql, params)
             results = []
+            # Sử dụng translate_value để dịch 'Hiện tại' nếu language là tiếng Anh
+            current_label = translate_value('Hiện tại')
             for row in cursor.fetchall():
-                # Sử dụng translate_value để dịch 'Hiện tại' nếu language là tiếng Anh
-                current_label = 'Hiện tại'
-                if get_current_language() == 'en':
-                    current_label = translate_value(current_label)
-                    
                 results.append({
                     'student_name': row[0],
                     'start_date': row[1],
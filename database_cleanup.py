@@ -2,17 +2,57 @@
 #!/usr/bin/env python3
 """
 Database Cleanup Utility
-Removes unused records and optimizes the database
+Removes unused records and optimizes the database. Routine maintenance
+(incremental vacuum in short slices, statistics refresh after large write
+batches) runs in the background instead of a blocking VACUUM.
 """
 
 import sqlite3
 import os
+import time
+import threading
+import logging
 from datetime import datetime, timedelta
+from database import connect_database, create_foreign_key_indexes, truncate_change_log, FOREIGN_KEY_SCHEMA_VERSION
+from duplicate_detection import find_duplicates
+
+logger = logging.getLogger(__name__)
+
+# Pages released per PRAGMA incremental_vacuum step, and how long one
+# maintenance run may keep releasing them
+INCREMENTAL_VACUUM_PAGES = 256
+MAINTENANCE_TIME_BUDGET_SECONDS = 2.0
+
+# Rows written before query planner statistics are refreshed
+OPTIMIZE_WRITE_THRESHOLD = 500
+
+MAINTENANCE_INTERVAL_MINUTES = 15
+
+# Child tables checked for orphans: (table, column, parent table, row filter)
+ORPHAN_CHECKS = [
+    ('student_class_history', 'student_id', 'students', None),
+    ('student_notes', 'student_id', 'students', None),
+    ('families', 'student_id', 'students', None),
+    ('supports', 'student_id', 'students', None),
+    ('periodic_assessments', 'student_id', 'students', None),
+    ('psychological_evaluations', 'student_id', 'students', None),
+    ('document_files', 'student_id', 'students', None),
+    ('medical_records', 'patient_id', 'students', "patient_type = 'student'"),
+    ('medical_records', 'patient_id', 'veterans', "patient_type = 'veteran'"),
+]
+
+# Orphan keys looked up per read and rows deleted per write transaction
+ORPHAN_BATCH_SIZE = 500
+# Pause between write transactions so interactive writes get the lock
+ORPHAN_BATCH_PAUSE_SECONDS = 0.01
+
+# PRAGMA auto_vacuum values
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
 
 class DatabaseCleanup:
     def __init__(self, db_path='lang_huu_nghi.db'):
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path)
+        self.conn = connect_database(db_path)
         
     def analyze_unused_records(self):
         """Analyze database for potentially unused records"""
@@ -36,7 +76,7 @@ class DatabaseCleanup:
         cursor.execute("SELECT COUNT(*) FROM medical_records WHERE date < ?", (five_years_ago.isoformat(),))
         old_medical = cursor.fetchone()[0]
         if old_medical > 0:
-            issues.append(f"Found {old_medical} medical records older than 5 years")
+            issues.append(f"Found {old_medical} medical records older than 5 years (moved to archive.db by the nightly archive job)")
         
         # Check for orphaned class history records
         cursor.execute("""
@@ -47,16 +87,11 @@ class DatabaseCleanup:
         if orphaned_history > 0:
             issues.append(f"Found {orphaned_history} orphaned class history records")
         
-        # Check for duplicate students (same name)
-        cursor.execute("""
-            SELECT full_name, COUNT(*) as count 
-            FROM students 
-            GROUP BY full_name 
-            HAVING COUNT(*) > 1
-        """)
-        duplicates = cursor.fetchall()
-        if duplicates:
-            issues.append(f"Found {len(duplicates)} sets of duplicate student names")
+        # Check for probable duplicate people (spelling and accent variants included)
+        for table, label in (('students', 'student'), ('veterans', 'veteran')):
+            duplicates = find_duplicates(self.conn, table)
+            if duplicates:
+                issues.append(f"Found {len(duplicates)} sets of probable duplicate {label} records")
         
         return issues
     
@@ -68,52 +103,189 @@ class DatabaseCleanup:
         self.conn.commit()
         return deleted
     
-    def clean_orphaned_records(self):
-        """Remove orphaned records that reference non-existent parent records"""
-        cursor = self.conn.cursor()
+    def find_orphan_keys(self, table, column, parent, row_filter=None, after=None, limit=ORPHAN_BATCH_SIZE):
+        """Distinct values of table.column that have no row in parent, in key order
+        
+        The scan walks the index on the foreign key column, so each distinct
+        key is probed against the parent's primary key once, however many
+        child rows share it. It only reads, so it never blocks writers.
+        """
+        conditions = [f"NOT EXISTS (SELECT 1 FROM {parent} p WHERE p.id = c.{column})"]
+        params = []
+        if row_filter:
+            conditions.append(f"c.{row_filter}")
+        if after is not None:
+            conditions.append(f"c.{column} > ?")
+            params.append(after)
+        params.append(limit)
+        
+        cursor = self.conn.execute(f"""
+            SELECT DISTINCT c.{column} FROM {table} c
+            WHERE {' AND '.join(conditions)}
+            ORDER BY c.{column}
+            LIMIT ?
+        """, params)
+        return [row[0] for row in cursor.fetchall()]
+    
+    def delete_orphan_rows(self, table, column, parent, keys, row_filter=None, batch_size=ORPHAN_BATCH_SIZE):
+        """Delete the child rows of orphan keys, at most batch_size rows per transaction"""
+        placeholders = ', '.join('?' * len(keys))
+        filter_sql = f"AND c.{row_filter}" if row_filter else ""
+        deleted = 0
+        while True:
+            # The parent is re-checked inside the write in case it was just re-created
+            cursor = self.conn.execute(f"""
+                DELETE FROM {table} WHERE id IN (
+                    SELECT c.id FROM {table} c
+                    WHERE c.{column} IN ({placeholders}) {filter_sql}
+                      AND NOT EXISTS (SELECT 1 FROM {parent} p WHERE p.id = c.{column})
+                    LIMIT ?
+                )
+            """, list(keys) + [batch_size])
+            self.conn.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+            time.sleep(ORPHAN_BATCH_PAUSE_SECONDS)
+    
+    def foreign_keys_enforced(self):
+        """Whether the schema has been migrated to foreign keys with ON DELETE actions"""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        return version >= FOREIGN_KEY_SCHEMA_VERSION
+    
+    def clean_orphaned_records(self, batch_size=ORPHAN_BATCH_SIZE, progress=None):
+        """Remove orphaned records that reference non-existent parent records
+        
+        Orphans are found with indexed NOT EXISTS anti-joins and deleted in
+        short transactions of at most batch_size rows, so interactive writes
+        wait a few milliseconds at most. progress, if given, is called as
+        progress(table, deleted_so_far) after every batch.
+        """
+        create_foreign_key_indexes(self.conn)
         deleted_count = 0
         
-        # Remove orphaned class history
-        cursor.execute("""
-            DELETE FROM student_class_history 
-            WHERE student_id NOT IN (SELECT id FROM students)
-        """)
-        deleted_count += cursor.rowcount
+        for table, column, parent, row_filter in ORPHAN_CHECKS:
+            table_deleted = 0
+            after = None
+            while True:
+                keys = self.find_orphan_keys(table, column, parent, row_filter, after, batch_size)
+                if not keys:
+                    break
+                table_deleted += self.delete_orphan_rows(table, column, parent, keys, row_filter, batch_size)
+                after = keys[-1]
+                if progress:
+                    progress(table, table_deleted)
+                time.sleep(ORPHAN_BATCH_PAUSE_SECONDS)
+            
+            if table_deleted:
+                logger.info(f"Removed {table_deleted} orphaned rows from {table} ({parent})")
+            deleted_count += table_deleted
         
-        # Remove orphaned student notes
-        cursor.execute("""
-            DELETE FROM student_notes 
-            WHERE student_id NOT IN (SELECT id FROM students)
-        """)
-        deleted_count += cursor.rowcount
+        return deleted_count
+    
+    def fragmentation_report(self):
+        """Report how much of the database file is unused
         
-        # Remove orphaned medical records
-        cursor.execute("""
-            DELETE FROM medical_records 
-            WHERE patient_type = 'student' AND patient_id NOT IN (SELECT id FROM students)
-        """)
-        deleted_count += cursor.rowcount
+        Free pages are whole pages on the freelist that incremental vacuum
+        can return to the OS. Unused bytes inside pages are only available
+        when SQLite is built with the dbstat table.
+        """
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = self.conn.execute("PRAGMA auto_vacuum").fetchone()[0]
         
-        cursor.execute("""
-            DELETE FROM medical_records 
-            WHERE patient_type = 'veteran' AND patient_id NOT IN (SELECT id FROM veterans)
-        """)
-        deleted_count += cursor.rowcount
+        report = {
+            'page_size': page_size,
+            'page_count': page_count,
+            'freelist_count': freelist_count,
+            'database_size': page_count * page_size,
+            'free_bytes': freelist_count * page_size,
+            'free_ratio': freelist_count / page_count if page_count else 0.0,
+            'auto_vacuum': AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum)),
+            'unused_bytes': None
+        }
+        
+        try:
+            unused = self.conn.execute("SELECT SUM(unused) FROM dbstat").fetchone()[0]
+            report['unused_bytes'] = unused or 0
+        except sqlite3.OperationalError:
+            pass
         
+        return report
+    
+    def enable_incremental_vacuum(self):
+        """Switch the database to auto_vacuum=INCREMENTAL
+        
+        Changing the mode of an existing database needs one VACUUM to
+        rebuild the file; after that, free pages are released in small
+        incremental steps and a full VACUUM is never needed again.
+        The VACUUM locks the database for the whole rebuild, so this is a
+        one-time action started by an admin (or the cleanup script), never
+        by the background maintenance job.
+        Returns True if the conversion was done now.
+        """
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        
+        # The rebuild is larger than the autocheckpoint size; leave it to the WAL archiver
+        self.conn.execute("PRAGMA wal_autocheckpoint = 0")
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
         self.conn.commit()
-        return deleted_count
+        self.conn.execute("VACUUM")
+        logger.info("Database converted to auto_vacuum=INCREMENTAL")
+        return True
     
-    def optimize_database(self):
-        """Optimize database by running VACUUM"""
-        # Get size before optimization
-        size_before = os.path.getsize(self.db_path)
+    def incremental_vacuum(self, time_budget=MAINTENANCE_TIME_BUDGET_SECONDS, pages=INCREMENTAL_VACUUM_PAGES):
+        """Release free pages in short transactions until none are left or time runs out
         
-        cursor = self.conn.cursor()
-        cursor.execute("VACUUM")
+        Each step holds the write lock only for the few milliseconds it
+        takes to move `pages` pages, so other users are never blocked for
+        long. Returns the number of pages released.
+        """
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        
+        released = 0
+        deadline = time.monotonic() + time_budget
+        while time.monotonic() < deadline:
+            free_before = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free_before == 0:
+                break
+            # The pragma only does its work while its result rows are stepped through
+            self.conn.execute(f"PRAGMA incremental_vacuum({pages})").fetchall()
+            self.conn.commit()
+            free_after = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            released += free_before - free_after
+            if free_after >= free_before:
+                break
+        return released
+    
+    def refresh_statistics(self):
+        """Refresh the query planner statistics
+        
+        The first run does a full ANALYZE; later runs use PRAGMA optimize,
+        which only re-analyzes tables whose contents changed noticeably.
+        """
+        has_stats = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).fetchone()
+        if has_stats:
+            self.conn.execute("PRAGMA optimize")
+        else:
+            self.conn.execute("ANALYZE")
         self.conn.commit()
+    
+    def optimize_database(self):
+        """Optimize database by releasing free pages and refreshing statistics"""
+        # Sizes come from the page count: in WAL mode the file only shrinks at the next checkpoint
+        size_before = self.fragmentation_report()['database_size']
         
-        # Get size after optimization
-        size_after = os.path.getsize(self.db_path)
+        self.enable_incremental_vacuum()
+        self.incremental_vacuum()
+        self.refresh_statistics()
+        
+        size_after = self.fragmentation_report()['database_size']
         
         return size_before, size_after
     
@@ -143,11 +315,15 @@ class DatabaseCleanup:
         
         # Clean orphaned records
         print("\n🔗 Cleaning orphaned records...")
-        deleted_orphaned = self.clean_orphaned_records()
-        if deleted_orphaned > 0:
-            print(f"   ✅ Removed {deleted_orphaned} orphaned records")
+        if self.foreign_keys_enforced():
+            print("   ✅ Foreign keys are enforced with cascades, no orphan scan needed")
         else:
-            print("   ✅ No orphaned records found")
+            deleted_orphaned = self.clean_orphaned_records(
+                progress=lambda table, deleted: print(f"   … {table}: {deleted} removed so far"))
+            if deleted_orphaned > 0:
+                print(f"   ✅ Removed {deleted_orphaned} orphaned records")
+            else:
+                print("   ✅ No orphaned records found")
         
         # Optimize database
         print("\n⚡ Optimizing database...")
@@ -161,12 +337,131 @@ class DatabaseCleanup:
         else:
             print("   ℹ️ No space saved (database was already optimized)")
         
+        report = self.fragmentation_report()
+        print(f"   📊 Free pages: {report['freelist_count']}/{report['page_count']} "
+              f"({report['free_ratio']:.1%}), auto_vacuum={report['auto_vacuum']}")
+        
         print("\n✅ Database cleanup completed!")
         
     def close(self):
         """Close database connection"""
         self.conn.close()
 
+class MaintenanceScheduler:
+    """Run database maintenance continuously in the background
+    
+    Every few minutes a time-boxed incremental vacuum releases free pages,
+    and statistics are refreshed once enough rows have been written.
+    """
+    def __init__(self, db_path='lang_huu_nghi.db'):
+        self.db_path = db_path
+        self.pending_writes = 0
+        self.writes_lock = threading.Lock()
+        self.last_run = None
+        self.last_report = None
+    
+    def record_writes(self, row_count):
+        """Count rows written by a bulk operation; refresh statistics soon after a large batch"""
+        with self.writes_lock:
+            self.pending_writes += row_count
+            due = self.pending_writes >= OPTIMIZE_WRITE_THRESHOLD
+        if due:
+            from job_scheduler import job_scheduler
+            job_scheduler.run_once('write_batch_maintenance', self.run_maintenance, 60,
+                                   name="Bảo trì sau khi ghi dữ liệu lớn")
+    
+    def side_database_paths(self):
+        """archive.db and monitoring.db next to the database, where they exist"""
+        from record_archive import archive_path_for
+        from supabase_monitor import monitoring_path_for
+        paths = [archive_path_for(self.db_path), monitoring_path_for(self.db_path)]
+        return [path for path in paths if os.path.exists(path)]
+    
+    def run_maintenance(self):
+        """One maintenance pass; returns the fragmentation report after it"""
+        cleanup = DatabaseCleanup(self.db_path)
+        try:
+            # Files created before auto_vacuum=INCREMENTAL was set at creation
+            # are skipped until an admin converts them; the conversion is a
+            # blocking VACUUM and never runs from here
+            released = cleanup.incremental_vacuum()
+            for path in self.side_database_paths():
+                side_cleanup = DatabaseCleanup(path)
+                try:
+                    released += side_cleanup.incremental_vacuum()
+                finally:
+                    side_cleanup.close()
+            
+            with self.writes_lock:
+                writes = self.pending_writes
+                if writes >= OPTIMIZE_WRITE_THRESHOLD:
+                    self.pending_writes = 0
+            if writes >= OPTIMIZE_WRITE_THRESHOLD:
+                cleanup.refresh_statistics()
+                logger.info(f"Statistics refreshed after {writes} written rows")
+            
+            # Acknowledged and expired change feed entries
+            pruned = truncate_change_log(cleanup.conn)
+            if pruned:
+                logger.info(f"Truncated {pruned} change log entries")
+            
+            report = cleanup.fragmentation_report()
+            if released:
+                logger.info(f"Incremental vacuum released {released} pages, "
+                            f"{report['freelist_count']} free pages left")
+            self.last_run = datetime.now()
+            self.last_report = report
+            return report
+        except Exception as e:
+            logger.error(f"Database maintenance failed: {e}")
+            return None
+        finally:
+            cleanup.close()
+    
+    def run_archive(self):
+        """Move records past the archive age to archive.db"""
+        from record_archive import RecordArchive
+        archive = RecordArchive(self.db_path)
+        try:
+            return archive.archive_old_records()
+        except Exception as e:
+            logger.error(f"Record archiving failed: {e}")
+            return None
+        finally:
+            archive.close()
+    
+    def register_jobs(self):
+        """Register the maintenance jobs with the process-wide scheduler"""
+        from job_scheduler import job_scheduler
+        job_scheduler.register('database_maintenance', self.run_maintenance, 'interval',
+                               name="Bảo trì cơ sở dữ liệu", minutes=MAINTENANCE_INTERVAL_MINUTES)
+        
+        # Move old medical and class-history records out of the live tables nightly
+        job_scheduler.register('record_archive', self.run_archive, 'cron',
+                               name="Lưu trữ hồ sơ cũ", hour=3, minute=0)
+        logger.info(f"Maintenance jobs registered - runs every {MAINTENANCE_INTERVAL_MINUTES} minutes")
+    
+    def start_scheduler(self):
+        """Start the periodic maintenance job"""
+        from job_scheduler import job_scheduler
+        try:
+            self.register_jobs()
+            job_scheduler.start()
+        except Exception as e:
+            logger.error(f"Failed to start maintenance scheduler: {e}")
+
+# Global maintenance instance
+maintenance_service = MaintenanceScheduler()
+
+def start_automatic_maintenance():
+    """Start background database maintenance"""
+    maintenance_service.start_scheduler()
+    return True
+
+def notify_bulk_write(row_count):
+    """Tell the maintenance service that a bulk operation wrote row_count rows"""
+    maintenance_service.record_writes(row_count)
+
 if __name__ == "__main__":
     cleanup = DatabaseCleanup()
     try:
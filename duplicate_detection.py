@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Duplicate Detection
+Finds student and veteran records that probably describe the same person,
+including spelling, accent and word-order variants of a name. Records are
+grouped by blocking keys (normalized name tokens, birth year, phone digits)
+and only records sharing a key are compared, so the cost grows with the
+size of the blocks instead of the square of the number of people.
+"""
+
+import re
+import logging
+import unicodedata
+from difflib import SequenceMatcher
+
+logger = logging.getLogger(__name__)
+
+# Minimum score for two records to be listed as a probable duplicate
+DUPLICATE_THRESHOLD = 0.9
+
+# Blocks larger than this carry too little information to be worth
+# comparing pairwise (e.g. a very common given name with no birth date)
+MAX_BLOCK_SIZE = 250
+
+# Phone numbers are compared on their last digits, ignoring the
+# country code and leading zero
+PHONE_DIGITS = 9
+
+# Score adjustments from the fields other than the name
+SAME_BIRTH_DATE_BONUS = 0.08
+SAME_PHONE_BONUS = 0.08
+DIFFERENT_BIRTH_DATE_PENALTY = 0.12
+DIFFERENT_BIRTH_YEAR_PENALTY = 0.25
+
+# Columns loaded per table: (table, phone column, columns counted for completeness)
+PERSON_TABLES = {
+    'students': ('phone', ['birth_date', 'gender', 'phone', 'address', 'email', 'admission_date',
+                           'class_id', 'parent_name', 'decision_number']),
+    'veterans': ('contact_info', ['birth_date', 'service_period', 'health_condition', 'address',
+                                  'email', 'contact_info']),
+}
+
+def normalize_name(name):
+    """Lowercase ASCII tokens of a name: 'Nguyễn  Văn Đức' -> ['nguyen', 'van', 'duc']"""
+    if not name:
+        return []
+    text = str(name).replace('đ', 'd').replace('Đ', 'D')
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+def exact_name(name):
+    """Name as compared for automatic import decisions: case and spacing ignored, accents kept"""
+    return ' '.join(unicodedata.normalize('NFC', str(name or '')).casefold().split())
+
+def phone_digits(phone):
+    digits = re.sub(r'\D', '', str(phone or ''))
+    return digits[-PHONE_DIGITS:] if len(digits) >= PHONE_DIGITS else ''
+
+def birth_year(birth_date):
+    match = re.search(r'(\d{4})', str(birth_date or ''))
+    return match.group(1) if match else ''
+
+class PersonKey:
+    """The normalized fields of one record used for blocking and scoring"""
+    __slots__ = ('id', 'full_name', 'birth_date', 'phone', 'filled', 'tokens', 'name', 'year', 'digits')
+
+    def __init__(self, person_id, full_name, birth_date=None, phone=None, filled=0):
+        self.id = person_id
+        self.full_name = full_name
+        self.birth_date = str(birth_date)[:10] if birth_date else ''
+        self.phone = phone
+        self.filled = filled
+        self.tokens = normalize_name(full_name)
+        self.name = ' '.join(self.tokens)
+        self.year = birth_year(birth_date)
+        self.digits = phone_digits(phone)
+
+    def blocking_keys(self):
+        """Keys of the blocks this record is compared within
+
+        Vietnamese names put the given name last and share few family
+        names, so the given name is combined with the birth date; the
+        initials key catches typos inside any word and the sorted-token
+        key catches reordered names.
+        """
+        keys = []
+        if self.tokens:
+            keys.append('n:' + ' '.join(sorted(self.tokens)))
+            initials = ''.join(token[0] for token in self.tokens)
+            if self.year:
+                keys.append(f'g:{self.tokens[-1]}:{self.birth_date or self.year}')
+                keys.append(f'i:{initials}:{self.year}')
+            else:
+                keys.append(f'g:{self.tokens[-1]}:{initials}')
+        if self.digits:
+            keys.append('p:' + self.digits)
+        return keys
+
+def similarity(a, b):
+    """Score in [0, 1] for two PersonKeys being the same person"""
+    if not a.name or not b.name:
+        return 0.0
+    if sorted(a.tokens) == sorted(b.tokens):
+        score = 1.0
+    else:
+        matcher = SequenceMatcher(None, a.name, b.name, autojunk=False)
+        # The cheap upper bounds rule out most pairs before the full ratio
+        if matcher.real_quick_ratio() < DUPLICATE_THRESHOLD - SAME_BIRTH_DATE_BONUS - SAME_PHONE_BONUS:
+            return 0.0
+        if matcher.quick_ratio() < DUPLICATE_THRESHOLD - SAME_BIRTH_DATE_BONUS - SAME_PHONE_BONUS:
+            return 0.0
+        score = matcher.ratio()
+
+    if a.birth_date and a.birth_date == b.birth_date:
+        score += SAME_BIRTH_DATE_BONUS
+    elif a.year and b.year and a.year != b.year:
+        score -= DIFFERENT_BIRTH_YEAR_PENALTY
+    elif len(a.birth_date) == len(b.birth_date) == 10:
+        score -= DIFFERENT_BIRTH_DATE_PENALTY
+    if a.digits and a.digits == b.digits:
+        score += SAME_PHONE_BONUS
+    return max(0.0, min(score, 1.0))
+
+def build_blocks(people):
+    """Map blocking key -> list of PersonKeys"""
+    blocks = {}
+    for person in people:
+        for key in person.blocking_keys():
+            blocks.setdefault(key, []).append(person)
+    return blocks
+
+def find_duplicate_pairs(people, threshold=DUPLICATE_THRESHOLD):
+    """(score, a, b) for every pair of PersonKeys scoring at least threshold"""
+    pairs = []
+    compared = set()
+    skipped = 0
+    for key, block in build_blocks(people).items():
+        if len(block) < 2:
+            continue
+        if len(block) > MAX_BLOCK_SIZE:
+            skipped += 1
+            continue
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                pair = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+                if pair in compared:
+                    continue
+                compared.add(pair)
+                score = similarity(a, b)
+                if score >= threshold:
+                    pairs.append((score, a, b))
+    if skipped:
+        logger.info(f"Skipped {skipped} blocks larger than {MAX_BLOCK_SIZE} records")
+    return pairs
+
+def group_duplicates(pairs):
+    """Merge list from scored pairs: connected groups of probable duplicates
+
+    The suggested record to keep is the most complete one, then the oldest.
+    """
+    parent = {}
+    people = {}
+
+    def find(person_id):
+        while parent[person_id] != person_id:
+            parent[person_id] = parent[parent[person_id]]
+            person_id = parent[person_id]
+        return person_id
+
+    for score, a, b in pairs:
+        for person in (a, b):
+            people[person.id] = person
+            parent.setdefault(person.id, person.id)
+        root_a, root_b = find(a.id), find(b.id)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups = {}
+    for person_id in people:
+        groups.setdefault(find(person_id), []).append(people[person_id])
+    group_scores = {}
+    for score, a, b in pairs:
+        root = find(a.id)
+        group_scores[root] = min(score, group_scores.get(root, 1.0))
+
+    merge_list = []
+    for root, members in groups.items():
+        members.sort(key=lambda p: (-p.filled, p.id))
+        merge_list.append({
+            'keep_id': members[0].id,
+            'drop_ids': sorted(p.id for p in members[1:]),
+            'score': round(group_scores[root], 3),
+            'members': [
+                {'id': p.id, 'full_name': p.full_name, 'birth_date': p.birth_date, 'phone': p.phone}
+                for p in members
+            ],
+        })
+    merge_list.sort(key=lambda group: (-group['score'], group['keep_id']))
+    return merge_list
+
+def load_people(conn, table):
+    """PersonKeys for every row of students or veterans"""
+    phone_column, completeness_columns = PERSON_TABLES[table]
+    filled = ' + '.join(f"({column} IS NOT NULL AND {column} != '')" for column in completeness_columns)
+    cursor = conn.execute(f"SELECT id, full_name, birth_date, {phone_column}, {filled} FROM {table}")
+    return [PersonKey(*row) for row in cursor]
+
+def find_duplicates(conn, table, threshold=DUPLICATE_THRESHOLD):
+    """Reviewable merge list of probable duplicate students or veterans"""
+    return group_duplicates(find_duplicate_pairs(load_people(conn, table), threshold))
+
+class DuplicateIndex:
+    """Blocking index over existing records for checking incoming rows
+
+    Built once per import instead of rescanning the table for every row;
+    rows added during the import are indexed too, so duplicates within
+    the imported file are found as well. Only exact_match is safe to act
+    on automatically; match also finds spelling and accent variants, which
+    can be different people and are for review only.
+    """
+
+    def __init__(self, people=(), threshold=DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.blocks = {}
+        self.exact = {}
+        for person in people:
+            self.add(person)
+
+    @classmethod
+    def from_table(cls, conn, table, threshold=DUPLICATE_THRESHOLD):
+        return cls(load_people(conn, table), threshold)
+
+    def add(self, person):
+        for key in person.blocking_keys():
+            self.blocks.setdefault(key, []).append(person)
+        if person.birth_date:
+            self.exact.setdefault((exact_name(person.full_name), person.birth_date), person)
+
+    def exact_match(self, full_name, birth_date):
+        """Existing PersonKey with the same name and birth date, or None without a birth date"""
+        candidate = PersonKey(None, full_name, birth_date)
+        if not candidate.birth_date:
+            return None
+        return self.exact.get((exact_name(full_name), candidate.birth_date))
+
+    def match(self, full_name, birth_date=None, phone=None):
+        """Best existing PersonKey for an incoming record, or None"""
+        candidate = PersonKey(None, full_name, birth_date, phone)
+        best, best_score = None, self.threshold
+        seen = set()
+        for key in candidate.blocking_keys():
+            for person in self.blocks.get(key, ()):
+                if id(person) in seen:
+                    continue
+                seen.add(id(person))
+                score = similarity(candidate, person)
+                if score >= best_score:
+                    best, best_score = person, score
+        return best
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Health Server
+Serves the cached Supabase health status as JSON on its own small HTTP
+server (port 8001, exposed as 3000), so uptime pingers get an answer
+without running a Streamlit script, opening a database connection or
+writing anything. A background job refreshes the status every few
+minutes with read-only checks.
+
+It runs as its own process, started next to Streamlit by the deployment
+(`python health_server.py`, see .replit), so it answers from the moment
+the deployment starts, before anyone has opened the app.
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PORT = int(os.environ.get('HEALTH_PORT', 8001))
+HEALTH_PATHS = ('/', '/health', '/keep_alive')
+
+# Minutes between status refreshes; a request never refreshes more often
+HEALTH_REFRESH_MINUTES = 5
+
+SERVICE_NAME = "Supabase Keep-Alive"
+SERVICE_VERSION = "1.0.0"
+
+_status = {'response': None, 'refreshed_at': None}
+_status_lock = threading.Lock()
+# Held while a refresh runs, so concurrent requests never start a second one
+_refresh_lock = threading.Lock()
+_server = None
+_server_lock = threading.Lock()
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+def refresh_health_status():
+    """Run the read-only health checks and cache the response"""
+    with _refresh_lock:
+        return _refresh_health_status()
+
+def _refresh_health_status():
+    now = datetime.now()
+    if not os.environ.get('DATABASE_URL'):
+        response = {
+            "success": False,
+            "timestamp": now.isoformat(),
+            "error": "DATABASE_URL environment variable not set",
+            "status": "Configuration error - please set DATABASE_URL in Replit Secrets",
+        }
+    else:
+        try:
+            from supabase_monitor import SupabaseMonitor
+            health = SupabaseMonitor().check_health(max_age=0)
+            success = health['status'] == "healthy"
+            response = {
+                "success": success,
+                "timestamp": now.isoformat(),
+                "status": "Database healthy" if success else f"Database {health['status']}",
+                "checks": {name: health[name] for name in ('connection', 'latency', 'keep_alive_table') if name in health},
+            }
+        except Exception as e:
+            response = {
+                "success": False,
+                "timestamp": now.isoformat(),
+                "error": str(e),
+                "status": "Health check error",
+            }
+    response.update(service=SERVICE_NAME, version=SERVICE_VERSION)
+
+    with _status_lock:
+        _status.update(response=response, refreshed_at=now)
+    return response
+
+def get_health_status(max_age_minutes=HEALTH_REFRESH_MINUTES):
+    """The cached status, refreshed first only if it is missing or stale
+
+    One request refreshes a stale status; requests arriving meanwhile get
+    the last cached one instead of running the checks again. Before the
+    first refresh has finished they wait for it.
+    """
+    with _status_lock:
+        response, refreshed_at = _status['response'], _status['refreshed_at']
+    if response is not None and (datetime.now() - refreshed_at).total_seconds() <= max_age_minutes * 60:
+        return response
+    if response is None:
+        with _refresh_lock:
+            with _status_lock:
+                response = _status['response']
+            return response if response is not None else _refresh_health_status()
+    if not _refresh_lock.acquire(blocking=False):
+        return response
+    try:
+        return _refresh_health_status()
+    finally:
+        _refresh_lock.release()
+
+class HealthRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0].rstrip('/') not in [p.rstrip('/') for p in HEALTH_PATHS]:
+            self.send_error(404)
+            return
+        response = get_health_status()
+        body = json.dumps(response, default=_json_default, ensure_ascii=False).encode('utf-8')
+        self.send_response(200 if response.get('success') else 503)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+def start_health_server(port=HEALTH_PORT):
+    """Serve the health status in a background thread, once per process"""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return False
+        try:
+            _server = ThreadingHTTPServer(('0.0.0.0', port), HealthRequestHandler)
+        except OSError as e:
+            logger.error(f"Health server could not listen on port {port}: {e}")
+            return False
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name='health-server', daemon=True).start()
+        logger.info(f"Health server listening on port {port}")
+        return True
+
+def main(port=HEALTH_PORT):
+    """Run the health server process: refresh job plus the HTTP server"""
+    from job_scheduler import job_scheduler
+    job_scheduler.register('health_status_refresh', refresh_health_status, 'interval',
+                           name="Cập nhật trạng thái health", minutes=HEALTH_REFRESH_MINUTES,
+                           next_run_time=datetime.now())
+    job_scheduler.start()
+    if not start_health_server(port):
+        raise SystemExit(f"Health server could not start on port {port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Job Scheduler
+One process-wide scheduler for every background job: backups and WAL
+archiving, database maintenance, the Supabase keep-alive and latency
+sampling, Postgres replication and notification retries. Jobs are registered by id, so
+registering again (e.g. on a Streamlit rerun) replaces a job instead of
+adding a second copy, and a job never runs twice at the same time.
+"""
+
+import os
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Worker threads shared by all jobs; the scheduler itself runs on one timer thread
+JOB_WORKERS = 4
+
+# A job that missed its time by less than this (e.g. while a long backup
+# held every worker) still runs once
+MISFIRE_GRACE_SECONDS = 300
+
+class JobScheduler:
+    def __init__(self):
+        self.scheduler = BackgroundScheduler(
+            executors={'default': ThreadPoolExecutor(JOB_WORKERS)},
+            job_defaults={'max_instances': 1, 'coalesce': True, 'misfire_grace_time': MISFIRE_GRACE_SECONDS}
+        )
+        self.lock = threading.Lock()
+        self.job_locks = {}
+        self.status = {}
+
+    def start(self):
+        """Start the timer thread; does nothing if it is already running"""
+        with self.lock:
+            if not self.scheduler.running:
+                self.scheduler.start()
+                atexit.register(self.shutdown)
+                logger.info("Job scheduler started")
+
+    def shutdown(self):
+        with self.lock:
+            if self.scheduler.running:
+                self.scheduler.shutdown(wait=False)
+                logger.info("Job scheduler stopped")
+
+    def _wrap(self, job_id, func):
+        """Record the status of each run and skip a run while the previous one is still going
+
+        max_instances covers runs started by the scheduler; the lock also
+        covers run_now and one-off jobs sharing an id.
+        """
+        job_lock = self.job_locks.setdefault(job_id, threading.Lock())
+
+        def run(*args, **kwargs):
+            if not job_lock.acquire(blocking=False):
+                logger.info(f"Job {job_id} is still running, skipping this run")
+                return None
+            status = self.status.setdefault(job_id, {'runs': 0, 'failures': 0})
+            status.update(running=True, last_start=datetime.now())
+            try:
+                result = func(*args, **kwargs)
+                status.update(last_success=datetime.now(), last_error=None)
+                return result
+            except Exception as e:
+                status['failures'] += 1
+                status['last_error'] = str(e)
+                logger.error(f"Job {job_id} failed: {e}")
+                return None
+            finally:
+                status['runs'] += 1
+                status.update(running=False, last_end=datetime.now())
+                job_lock.release()
+
+        return run
+
+    def register(self, job_id, func, trigger, name=None, **trigger_args):
+        """Add or replace a recurring job (trigger 'interval' or 'cron')"""
+        self.scheduler.add_job(
+            func=self._wrap(job_id, func),
+            trigger=trigger,
+            id=job_id,
+            name=name or job_id,
+            replace_existing=True,
+            **trigger_args
+        )
+
+    def run_once(self, job_id, func, delay_seconds=0, name=None, replace=True):
+        """Schedule a one-off job; with replace=False an already pending job is kept"""
+        if not replace and self.scheduler.get_job(job_id):
+            return False
+        self.scheduler.add_job(
+            func=self._wrap(job_id, func),
+            trigger='date',
+            run_date=datetime.now() + timedelta(seconds=delay_seconds),
+            id=job_id,
+            name=name or job_id,
+            replace_existing=True
+        )
+        return True
+
+    def run_now(self, job_id):
+        """Run a registered job right away, outside its schedule"""
+        job = self.scheduler.get_job(job_id)
+        if job is None:
+            raise KeyError(f"No job {job_id}")
+        job.modify(next_run_time=datetime.now())
+
+    def has_job(self, job_id):
+        return self.scheduler.get_job(job_id) is not None
+
+    def remove(self, job_id):
+        if self.scheduler.get_job(job_id):
+            self.scheduler.remove_job(job_id)
+
+    def get_status(self):
+        """Schedule and last-run status of every job, pending or finished"""
+        jobs = {job.id: job for job in self.scheduler.get_jobs()}
+        rows = []
+        for job_id in sorted(set(jobs) | set(self.status)):
+            job = jobs.get(job_id)
+            status = self.status.get(job_id, {})
+            rows.append({
+                'id': job_id,
+                'name': job.name if job else job_id,
+                'next_run_time': getattr(job, 'next_run_time', None),
+                'running': status.get('running', False),
+                'runs': status.get('runs', 0),
+                'failures': status.get('failures', 0),
+                'last_start': status.get('last_start'),
+                'last_success': status.get('last_success'),
+                'last_error': status.get('last_error'),
+            })
+        return rows
+
+# Global scheduler instance
+job_scheduler = JobScheduler()
+
+_jobs_registered = False
+_register_lock = threading.Lock()
+
+def start_background_jobs():
+    """Register every background job and start the scheduler, once per process"""
+    global _jobs_registered
+    with _register_lock:
+        if _jobs_registered:
+            return False
+
+        from local_backup import backup_service
+        backup_service.register_jobs()
+
+        from database_cleanup import maintenance_service
+        maintenance_service.register_jobs()
+
+        # Keep-alive only runs in deployments
+        if os.environ.get('REPLIT_DEPLOYMENT'):
+            from keep_alive_daemon import daemon
+            daemon.register_jobs()
+
+        # Latency samples for the Supabase connection trends on the admin page
+        if os.environ.get('DATABASE_URL'):
+            from supabase_monitor import SupabaseMonitor, LATENCY_SAMPLE_INTERVAL_MINUTES
+            monitor = SupabaseMonitor()
+            job_scheduler.register('supabase_latency_sample', monitor.record_latency_sample, 'interval',
+                                   name="Đo độ trễ Supabase", minutes=LATENCY_SAMPLE_INTERVAL_MINUTES,
+                                   next_run_time=datetime.now())
+
+        # Off-box Postgres replica of the local database, if one is configured
+        if os.environ.get('REPLICA_DATABASE_URL'):
+            from postgres_replication import PostgresReplicator
+            PostgresReplicator().register_jobs()
+
+        # The health endpoint for uptime pingers is a separate process
+        # (python health_server.py), started with the deployment
+
+        job_scheduler.start()
+        _jobs_registered = True
+        logger.info(f"Background jobs registered: {', '.join(job.id for job in job_scheduler.scheduler.get_jobs())}")
+        return True
+
+def schedule_notification_retry(kind, record_id, send, delay_seconds=600):
+    """Retry a notification that could not be sent, once, after delay_seconds
+
+    Registering the same record again replaces the pending retry.
+    """
+    return job_scheduler.run_once(f"notification_retry_{kind}_{record_id}", send, delay_seconds,
+                                  name=f"Gửi lại thông báo {kind} #{record_id}")
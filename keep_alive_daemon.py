@@ -2,14 +2,15 @@
 #!/usr/bin/env python3
 """
 Keep-Alive Daemon Service
-Runs continuously in deployed environments to keep Supabase active
+Runs the Supabase keep-alive as a job of the process-wide scheduler in
+deployed environments
 """
 
 import os
 import time
-import threading
 from datetime import datetime
 from supabase_keepalive import SupabaseKeepAlive
+from job_scheduler import job_scheduler
 
 class KeepAliveDaemon:
     def __init__(self, interval_hours=6):
@@ -19,69 +20,59 @@ class KeepAliveDaemon:
             interval_hours: Hours between keep-alive operations (default: 6)
         """
         self.interval_hours = interval_hours
-        self.interval_seconds = interval_hours * 3600
-        self.running = False
-        self.thread = None
+        self.retry_count = 0
+        self.max_retries = 3
+        self.retry_delay_seconds = 300
+        # Reused across runs; its queries go through the shared connection pool
+        self.keep_alive = None
+        
+    def register_jobs(self):
+        """Register the keep-alive job with the process-wide scheduler"""
+        job_scheduler.register('supabase_keep_alive', self.run_keep_alive, 'interval',
+                               name="Giữ kết nối Supabase", hours=self.interval_hours,
+                               next_run_time=datetime.now())
         
     def start(self):
-        """Start the daemon in a background thread"""
-        if self.running:
-            return
-            
-        self.running = True
-        self.thread = threading.Thread(target=self._run_daemon, daemon=True)
-        self.thread.start()
+        """Start the keep-alive job"""
+        self.register_jobs()
+        job_scheduler.start()
         print(f"🚀 Keep-alive daemon started (every {self.interval_hours} hours)")
         
     def stop(self):
-        """Stop the daemon"""
-        self.running = False
-        if self.thread:
-            self.thread.join()
+        """Stop the keep-alive job"""
+        job_scheduler.remove('supabase_keep_alive')
+        job_scheduler.remove('supabase_keep_alive_retry')
         print("🛑 Keep-alive daemon stopped")
         
-    def _run_daemon(self):
-        """Main daemon loop with retry logic"""
-        retry_count = 0
-        max_retries = 3
+    def run_keep_alive(self):
+        """One keep-alive run; failures are retried as one-off jobs"""
+        try:
+            if self.keep_alive is None:
+                self.keep_alive = SupabaseKeepAlive()
+            print(f"🔄 Running keep-alive at {datetime.now()}")
+            success, messages = self.keep_alive.run_keep_alive()
+            
+            if success:
+                print("✅ Keep-alive successful")
+                self.retry_count = 0  # Reset retry count on success
+                return True
+            print("❌ Keep-alive failed")
+            for msg in messages:
+                print(f"   {msg}")
+        except Exception as e:
+            print(f"❌ Keep-alive daemon error: {e}")
+            self.keep_alive = None
         
-        while self.running:
-            try:
-                keep_alive = SupabaseKeepAlive()
-                print(f"🔄 Running keep-alive at {datetime.now()}")
-                success, messages = keep_alive.run_keep_alive()
-                
-                if success:
-                    print("✅ Keep-alive successful")
-                    retry_count = 0  # Reset retry count on success
-                else:
-                    print("❌ Keep-alive failed")
-                    for msg in messages:
-                        print(f"   {msg}")
-                    
-                    # Retry logic
-                    retry_count += 1
-                    if retry_count <= max_retries:
-                        print(f"🔄 Retrying in 5 minutes... (attempt {retry_count}/{max_retries})")
-                        time.sleep(300)  # Wait 5 minutes before retry
-                        continue
-                    else:
-                        print(f"❌ Max retries ({max_retries}) reached, waiting for next interval")
-                        retry_count = 0
-                        
-            except Exception as e:
-                print(f"❌ Keep-alive daemon error: {e}")
-                retry_count += 1
-                if retry_count <= max_retries:
-                    print(f"🔄 Retrying in 5 minutes due to error... (attempt {retry_count}/{max_retries})")
-                    time.sleep(300)
-                    continue
-                else:
-                    print(f"❌ Max retries ({max_retries}) reached after error, waiting for next interval")
-                    retry_count = 0
-                
-            # Wait for next interval
-            time.sleep(self.interval_seconds)
+        # Retry logic
+        self.retry_count += 1
+        if self.retry_count <= self.max_retries:
+            print(f"🔄 Retrying in 5 minutes... (attempt {self.retry_count}/{self.max_retries})")
+            job_scheduler.run_once('supabase_keep_alive_retry', self.run_keep_alive,
+                                   self.retry_delay_seconds, name="Thử lại giữ kết nối Supabase")
+        else:
+            print(f"❌ Max retries ({self.max_retries}) reached, waiting for next interval")
+            self.retry_count = 0
+        return False
 
 # Global daemon instance
 daemon = KeepAliveDaemon(interval_hours=6)
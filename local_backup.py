@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 """
 Local Automatic Backup System
-Backs up the database locally on a daily schedule with maximum 10 backups
+Backs up the database locally on a daily schedule with GFS retention
+(daily/weekly/monthly). Scheduled backups are incremental: a weekly full
+base plus page-level deltas, and days without changes are skipped.
+The database runs in WAL mode and committed WAL frames are archived every
+minute, so it can be restored to any minute since the latest full base.
 """
 
 import os
@@ -9,32 +13,635 @@ import shutil
 import sqlite3
 import zipfile
 from datetime import datetime, timedelta
-from apscheduler.schedulers.background import BackgroundScheduler
 import json
 import logging
 import glob
+import hashlib
+import struct
+import tarfile
+import io
+import threading
+import atexit
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Number of pages copied per backup step (~4 MB with the default page size).
+# Other connections can read and write between steps.
+BACKUP_PAGES_PER_STEP = 1024
+
+# Size in bytes of the per-page digests used to detect changed pages
+PAGE_DIGEST_SIZE = 16
+
+# New archives use multithreaded zstd when available, deflated zip otherwise
+ARCHIVE_EXTENSION = '.tar.zst' if ZSTD_AVAILABLE else '.zip'
+ZSTD_LEVEL = 3
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+# Serializes catalog updates from the scheduler thread and page reruns
+CATALOG_LOCK = threading.Lock()
+
+# WAL archiving: committed frames are shipped to database_backups/wal_archive
+# every minute, which is the granularity of point-in-time recovery
+WAL_ARCHIVE_DIR = 'wal_archive'
+WAL_ARCHIVE_INTERVAL_MINUTES = 1
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+WAL_SEGMENT_MAGIC = b'LHNWAL01'
+
+# Backup archive member holding the snapshot of archive.db (record_archive).
+# Not named *.db: readers take the first .db member as the main database
+RECORD_ARCHIVE_MEMBER = 'record_archive.sqlite3'
+
+def online_backup(db_path, dest_path, pages=BACKUP_PAGES_PER_STEP):
+    """Copy a live SQLite database to dest_path using the SQLite backup API.
+
+    The copy is done in steps so the application keeps serving requests, and
+    the result is always a consistent snapshot of a committed state.
+    """
+    source = sqlite3.connect(db_path)
+    dest = sqlite3.connect(dest_path)
+    try:
+        source.backup(dest, pages=pages)
+    finally:
+        dest.close()
+        source.close()
+
+def validate_database(db_path):
+    """Raise ValueError unless db_path is an intact SQLite database"""
+    conn = sqlite3.connect(db_path)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"Not a valid SQLite database: {e}")
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise ValueError(f"Integrity check failed: {result}")
+
+def hot_restore(source_path, db_path, reconnect=True):
+    """Replace the live database with source_path while the app keeps running
+    
+    The backup is validated with PRAGMA integrity_check, then written over
+    the live database with the SQLite backup API in a single step, so other
+    connections see either the old or the new database, never a mix. The
+    shared Database instance is reconnected afterwards, unless reconnect is
+    False (archive.db, restored just before the database it belongs to).
+    """
+    from database import Database, connect_database
+    
+    validate_database(source_path)
+    
+    source = sqlite3.connect(source_path)
+    # Waits for in-flight writes to finish instead of failing on a busy database
+    dest = connect_database(db_path, timeout=30)
+    # A restore can exceed the autocheckpoint size; leave its frames for the WAL archiver
+    dest.execute("PRAGMA wal_autocheckpoint = 0")
+    try:
+        source.backup(dest)
+    finally:
+        dest.close()
+        source.close()
+    
+    if reconnect:
+        Database.reconnect_all()
+
+def archive_stem(backup_path):
+    """Strip the archive extension (.tar.zst, .zip or .db) from a backup path"""
+    for extension in ('.tar.zst', '.zip', '.db'):
+        if backup_path.endswith(extension):
+            return backup_path[:-len(extension)]
+    return os.path.splitext(backup_path)[0]
+
+class BackupArchiveWriter:
+    """Stream members into a backup archive
+    
+    Archives are tar streams compressed with multithreaded zstd (.tar.zst)
+    when the zstandard package is available, and deflated zips otherwise.
+    Members are written straight from their source without temporary copies.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.zipf = None
+        if path.endswith('.tar.zst'):
+            self.file = open(path, 'wb')
+            # threads=-1 compresses jobs in parallel on every available core
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+            self.stream = compressor.stream_writer(self.file)
+            self.tar = tarfile.open(fileobj=self.stream, mode='w|')
+        else:
+            self.zipf = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+    
+    def add_bytes(self, name, data):
+        """Add an in-memory member"""
+        self.add_file(name, io.BytesIO(data), len(data))
+    
+    def add_file(self, name, fileobj, size):
+        """Add a member read from fileobj, which must provide exactly size bytes"""
+        if self.zipf:
+            with self.zipf.open(name, 'w', force_zip64=True) as out:
+                shutil.copyfileobj(fileobj, out, ARCHIVE_CHUNK_SIZE)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = int(datetime.now().timestamp())
+            self.tar.addfile(info, fileobj)
+    
+    def close(self):
+        if self.zipf:
+            self.zipf.close()
+        else:
+            self.tar.close()
+            self.stream.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def iter_archive_members(backup_path):
+    """Yield (name, fileobj) for each member of a backup archive, in order
+    
+    .tar.zst archives are read as a stream, so each fileobj is only valid
+    until the next member is requested.
+    """
+    if backup_path.endswith('.tar.zst'):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("zstandard is required to read .tar.zst backups")
+        with open(backup_path, 'rb') as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            with tarfile.open(fileobj=reader, mode='r|') as tar:
+                for member in tar:
+                    if member.isfile():
+                        yield member.name, tar.extractfile(member)
+    else:
+        with zipfile.ZipFile(backup_path, 'r') as zipf:
+            for name in zipf.namelist():
+                with zipf.open(name) as member:
+                    yield name, member
+
+class PageHashingReader:
+    """File wrapper that hashes every database page passing through read()"""
+    def __init__(self, fileobj, page_size):
+        self.fileobj = fileobj
+        self.page_size = page_size
+        self.hashes = []
+        self.pending = b''
+    
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        buffer = self.pending + data
+        whole = len(buffer) - len(buffer) % self.page_size
+        for offset in range(0, whole, self.page_size):
+            page = buffer[offset:offset + self.page_size]
+            self.hashes.append(hashlib.blake2b(page, digest_size=PAGE_DIGEST_SIZE).digest())
+        self.pending = buffer[whole:]
+        if not data and self.pending:
+            self.hashes.append(hashlib.blake2b(self.pending, digest_size=PAGE_DIGEST_SIZE).digest())
+            self.pending = b''
+        return data
+
+class PageSelectionReader:
+    """File-like object returning selected pages of a database file, in order"""
+    def __init__(self, fileobj, page_size, page_numbers):
+        self.fileobj = fileobj
+        self.page_size = page_size
+        self.page_numbers = iter(page_numbers)
+        self.buffer = b''
+    
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            page_no = next(self.page_numbers, None)
+            if page_no is None:
+                break
+            self.fileobj.seek(page_no * self.page_size)
+            self.buffer += self.fileobj.read(self.page_size)
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+class BackupCatalog:
+    """Persistent index of backup files (backup_catalog.json)
+    
+    Backup creation and cleanup keep the catalog up to date, so listing
+    backups never scans the directory or opens archives. Entries hold the
+    filename, type, creation time, size, SHA-256 checksum, row counts and
+    schema version of each backup.
+    """
+    def __init__(self, backup_dir):
+        self.path = os.path.join(backup_dir, 'backup_catalog.json')
+    
+    def load(self):
+        """Return the catalog entries, or None if no catalog exists yet"""
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)['backups']
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Backup catalog unreadable, it will be rebuilt: {e}")
+            return None
+    
+    def save(self, entries):
+        """Write the catalog atomically"""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'version': 1, 'backups': entries}, f, indent=2)
+        os.replace(temp_path, self.path)
+    
+    def add(self, entry):
+        """Add or replace the entry for entry['filename']"""
+        with CATALOG_LOCK:
+            entries = [e for e in (self.load() or []) if e['filename'] != entry['filename']]
+            entries.append(entry)
+            self.save(entries)
+    
+    def remove(self, filename):
+        """Drop the entry for a deleted backup file"""
+        with CATALOG_LOCK:
+            entries = self.load()
+            if entries is not None:
+                self.save([e for e in entries if e['filename'] != filename])
+
+def file_checksum(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(ARCHIVE_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def database_stats(db_path):
+    """Row count per table and schema version of a database file"""
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        row_counts = {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+        schema_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        return row_counts, schema_version
+    finally:
+        conn.close()
+
+def catalog_entry(backup_path, metadata, snapshot_path=None):
+    """Build a catalog entry for a backup file
+    
+    Row counts and schema version are read from snapshot_path (the
+    uncompressed database) when it is available.
+    """
+    row_counts, schema_version = database_stats(snapshot_path) if snapshot_path else (None, None)
+    filename = os.path.basename(backup_path)
+    created = metadata.get('created')
+    if not created:
+        # Fall back to the timestamp in the filename, then to the file mtime
+        timestamp_str = archive_stem(filename).split('backup_')[-1].replace('_incr', '')
+        try:
+            created = datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S').isoformat()
+        except ValueError:
+            created = datetime.fromtimestamp(os.path.getmtime(backup_path)).isoformat()
+    
+    return {
+        'filename': filename,
+        'type': metadata.get('type', 'full'),
+        'created': created,
+        'size_bytes': os.path.getsize(backup_path),
+        'checksum': file_checksum(backup_path),
+        'row_counts': row_counts,
+        'schema_version': schema_version,
+        'parent': metadata.get('parent'),
+        'base': metadata.get('base'),
+        'chain_length': metadata.get('chain_length'),
+        'page_size': metadata.get('page_size'),
+        'original_size': metadata.get('original_size'),
+        'changed_pages': metadata.get('changed_pages'),
+        'archive_checksum': metadata.get('archive_checksum')
+    }
+
+def wal_checksum(data, s0, s1, big_endian):
+    """Continue the SQLite WAL checksum over data (a multiple of 8 bytes)"""
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for i in range(0, len(words), 2):
+        s0 = (s0 + words[i] + s1) & 0xFFFFFFFF
+        s1 = (s1 + words[i + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+def read_wal_header(wal_path):
+    """Parse the header of a WAL file, or return None if there is no valid WAL"""
+    if not os.path.exists(wal_path):
+        return None
+    with open(wal_path, 'rb') as f:
+        header = f.read(WAL_HEADER_SIZE)
+    if len(header) < WAL_HEADER_SIZE:
+        return None
+    magic, _, page_size, _, salt1, salt2, cksum1, cksum2 = struct.unpack('>8I', header)
+    if magic not in (0x377f0682, 0x377f0683):
+        return None
+    big_endian = magic == 0x377f0683
+    if wal_checksum(header[:24], 0, 0, big_endian) != (cksum1, cksum2):
+        return None
+    return {
+        'page_size': page_size,
+        'salt': [salt1, salt2],
+        'checksum': (cksum1, cksum2),
+        'big_endian': big_endian
+    }
+
+def read_wal_frames(wal_path, header, start_frame):
+    """Read the committed frames of a WAL file from frame index start_frame
+    
+    Frames are validated the way SQLite recovers a WAL: the salts must match
+    the header and the running checksum must hold. Frames after the last
+    commit frame belong to an unfinished transaction and are left out.
+    Returns the raw frames and the index of the first frame not returned.
+    """
+    frame_size = WAL_FRAME_HEADER_SIZE + header['page_size']
+    salt = tuple(header['salt'])
+    frames = bytearray()
+    committed_length = 0
+    next_frame = start_frame
+    
+    with open(wal_path, 'rb') as f:
+        if start_frame == 0:
+            s0, s1 = header['checksum']
+        else:
+            # The checksum is cumulative; resume from the last archived frame
+            f.seek(WAL_HEADER_SIZE + (start_frame - 1) * frame_size)
+            previous = f.read(WAL_FRAME_HEADER_SIZE)
+            if len(previous) < WAL_FRAME_HEADER_SIZE or struct.unpack('>2I', previous[8:16]) != salt:
+                return b'', start_frame
+            s0, s1 = struct.unpack('>2I', previous[16:24])
+        
+        f.seek(WAL_HEADER_SIZE + start_frame * frame_size)
+        frame_no = start_frame
+        while True:
+            frame = f.read(frame_size)
+            if len(frame) < frame_size:
+                break
+            _, commit_size, salt1, salt2, cksum1, cksum2 = struct.unpack('>6I', frame[:WAL_FRAME_HEADER_SIZE])
+            if (salt1, salt2) != salt:
+                break
+            s0, s1 = wal_checksum(frame[:8], s0, s1, header['big_endian'])
+            s0, s1 = wal_checksum(frame[WAL_FRAME_HEADER_SIZE:], s0, s1, header['big_endian'])
+            if (s0, s1) != (cksum1, cksum2):
+                break
+            frames += frame
+            frame_no += 1
+            if commit_size:
+                committed_length = len(frames)
+                next_frame = frame_no
+    
+    return bytes(frames[:committed_length]), next_frame
+
+def apply_wal_segment(segment_path, db_file):
+    """Replay the frames of an archived WAL segment into an open database file"""
+    with open(segment_path, 'rb') as f:
+        magic, page_size, frame_count = struct.unpack('>8sII', f.read(16))
+        if magic != WAL_SEGMENT_MAGIC:
+            raise ValueError(f"Not a WAL segment: {segment_path}")
+        db_pages = None
+        for _ in range(frame_count):
+            page_no, commit_size = struct.unpack('>2I', f.read(WAL_FRAME_HEADER_SIZE)[:8])
+            db_file.seek((page_no - 1) * page_size)
+            db_file.write(f.read(page_size))
+            if commit_size:
+                db_pages = commit_size
+    if db_pages:
+        db_file.truncate(db_pages * page_size)
+
+def wal_segment_time(segment_path):
+    """Archive time of a WAL segment, from its file name"""
+    timestamp = os.path.basename(segment_path)[len('wal_'):-len('.seg')]
+    return datetime.strptime(timestamp, '%Y%m%d_%H%M%S_%f')
+
+class WalArchiver:
+    """Ship committed WAL frames to the backup directory for point-in-time recovery
+    
+    Each run takes the write lock, copies the frames committed since the
+    previous run into a timestamped segment, checkpoints and releases the
+    lock, so no frame can be checkpointed away before it is archived.
+    Segments are stored next to the full backup they follow; a restore
+    replays that backup and its segments up to the chosen time.
+    """
+    def __init__(self, backup_service):
+        self.backup_service = backup_service
+        self.archive_dir = os.path.join(backup_service.backup_dir, WAL_ARCHIVE_DIR)
+        self.state_path = os.path.join(self.archive_dir, 'state.json')
+        self.conn = None
+        self.lock = threading.Lock()
+    
+    @property
+    def wal_path(self):
+        return self.backup_service.db_path + '-wal'
+    
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def save_state(self, state):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(temp_path, self.state_path)
+    
+    def segment_dir(self, base_filename):
+        return os.path.join(self.archive_dir, archive_stem(base_filename))
+    
+    def list_segments(self, base_filename):
+        return sorted(glob.glob(os.path.join(self.segment_dir(base_filename), 'wal_*.seg')))
+    
+    def write_segment(self, base_filename, frames, page_size):
+        segment_dir = self.segment_dir(base_filename)
+        os.makedirs(segment_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        segment_path = os.path.join(segment_dir, f"wal_{timestamp}.seg")
+        frame_count = len(frames) // (WAL_FRAME_HEADER_SIZE + page_size)
+        
+        temp_path = segment_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(struct.pack('>8sII', WAL_SEGMENT_MAGIC, page_size, frame_count))
+            f.write(frames)
+        os.replace(temp_path, segment_path)
+        return segment_path
+    
+    def is_continuous(self, state, header):
+        """Whether the WAL still holds every frame committed since the last run
+        
+        The archiver is the only regular checkpointer, so between two runs
+        the WAL restarts at most once, right after the archiver's own
+        checkpoint, which bumps salt-1 by one. After a clean shutdown the
+        WAL was checkpointed and deleted with nothing left to archive.
+        """
+        base = state.get('base')
+        if not base or not os.path.exists(os.path.join(self.backup_service.backup_dir, base)):
+            return False
+        if header is None or not state.get('salt'):
+            return state.get('clean_shutdown', False) or not state.get('salt')
+        if header['salt'] == state['salt']:
+            return True
+        return state.get('clean_shutdown', False) or header['salt'][0] == (state['salt'][0] + 1) & 0xFFFFFFFF
+    
+    def base_is_due(self, state):
+        entry = next((e for e in self.backup_service.catalog_entries() if e['filename'] == state.get('base')), None)
+        if entry is None:
+            return True
+        age = datetime.now() - datetime.fromisoformat(entry['created'])
+        return age > timedelta(days=self.backup_service.full_backup_interval_days)
+    
+    def archive(self, clean_shutdown=False):
+        """Archive new committed frames and checkpoint; returns the segment path or None"""
+        with self.lock:
+            db_path = self.backup_service.db_path
+            if not os.path.exists(db_path):
+                return None
+            if self.conn is None:
+                from database import connect_database
+                # Kept open so the WAL is never checkpointed and deleted on a last close
+                self.conn = connect_database(db_path, timeout=30, check_same_thread=False,
+                                             isolation_level=None)
+            
+            state = self.load_state()
+            segment_path = None
+            
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                header = read_wal_header(self.wal_path)
+                continuous = self.is_continuous(state, header)
+                next_frame = 0
+                if header is not None:
+                    start = state.get('next_frame', 0) if header['salt'] == state.get('salt') else 0
+                    frames, next_frame = read_wal_frames(self.wal_path, header, start if continuous else 0)
+                    if continuous and frames:
+                        segment_path = self.write_segment(state['base'], frames, header['page_size'])
+                
+                # Checkpointing needs no write lock; writers stay blocked until it is done
+                checkpoint_conn = sqlite3.connect(db_path, timeout=30)
+                try:
+                    checkpoint_conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                finally:
+                    checkpoint_conn.close()
+                
+                state.update({
+                    'salt': header['salt'] if header else None,
+                    'next_frame': next_frame,
+                    'clean_shutdown': clean_shutdown
+                })
+            finally:
+                self.conn.execute("ROLLBACK")
+            
+            if not continuous or self.base_is_due(state):
+                if state.get('base') and not continuous:
+                    logger.warning("WAL frames were checkpointed before being archived, starting a new base")
+                # Frames committed while the base is taken are archived against it
+                # on the next run; replaying them over the base is harmless
+                state['base'] = None
+                self.save_state(state)
+                base_path = self.backup_service.create_database_backup()
+                if base_path:
+                    state['base'] = os.path.basename(base_path)
+                    logger.info(f"WAL archive base: {state['base']}")
+            
+            self.save_state(state)
+            return segment_path
+    
+    def shutdown(self):
+        """Archive the last frames before the process exits"""
+        try:
+            self.archive(clean_shutdown=True)
+        except Exception as e:
+            logger.error(f"Final WAL archive failed: {e}")
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+    
+    def list_bases(self):
+        """Catalog entries of the full backups that have WAL segments, oldest first"""
+        entries = [
+            e for e in self.backup_service.catalog_entries()
+            if os.path.isdir(self.segment_dir(e['filename']))
+            and os.path.exists(os.path.join(self.backup_service.backup_dir, e['filename']))
+        ]
+        return sorted(entries, key=lambda e: e['created'])
+    
+    def get_recovery_window(self):
+        """(earliest, latest) datetimes that can be restored to, or None"""
+        bases = self.list_bases()
+        if not bases:
+            return None
+        latest = datetime.fromisoformat(bases[-1]['created'])
+        for base in bases:
+            segments = self.list_segments(base['filename'])
+            if segments:
+                latest = max(latest, wal_segment_time(segments[-1]))
+        return datetime.fromisoformat(bases[0]['created']), latest
+    
+    def plan_recovery(self, target_time):
+        """The base backup and WAL segments that rebuild the database at target_time"""
+        bases = [b for b in self.list_bases() if datetime.fromisoformat(b['created']) <= target_time]
+        if not bases:
+            raise ValueError(f"No backup with archived WAL before {target_time}")
+        base = bases[-1]
+        segments = [s for s in self.list_segments(base['filename']) if wal_segment_time(s) <= target_time]
+        return os.path.join(self.backup_service.backup_dir, base['filename']), segments
+    
+    def remove_orphaned_segments(self):
+        """Delete segment directories whose base backup no longer exists"""
+        for segment_dir in glob.glob(os.path.join(self.archive_dir, '*')):
+            if not os.path.isdir(segment_dir):
+                continue
+            name = os.path.basename(segment_dir)
+            if not any(os.path.exists(os.path.join(self.backup_service.backup_dir, name + ext))
+                       for ext in ('.tar.zst', '.zip')):
+                shutil.rmtree(segment_dir)
+                logger.info(f"Deleted WAL segments of removed backup: {name}")
+
 class LocalBackup:
     def __init__(self):
-        self.scheduler = BackgroundScheduler()
         self.db_path = 'lang_huu_nghi.db'
         self.backup_dir = 'database_backups'
-        self.max_backups = 10  # Keep last 10 backups
+        # GFS retention: newest backup of each of the last N days/weeks/months
+        self.retention = {'daily': 7, 'weekly': 4, 'monthly': 6}
+        self.full_backup_interval_days = 7  # Start a new full base weekly
+        self.max_chain_length = 6  # Incremental backups per full base
+        
+        # Change tracking for skip-if-unchanged and burst-triggered backups
+        self.monitor_conn = None
+        self.last_data_version = None
+        self.pending_writes = 0
+        self.burst_write_threshold = 500  # Rows written before an extra backup
+        self.burst_backup_delay_minutes = 10  # Let the burst finish first
         
         # Ensure backup directory exists
         os.makedirs(self.backup_dir, exist_ok=True)
+        self.catalog = BackupCatalog(self.backup_dir)
+        self.wal_archiver = WalArchiver(self)
+        self.shutdown_registered = False
         
     def create_backup_filename(self):
         """Generate backup filename with timestamp"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         return f"lang_huu_nghi_backup_{timestamp}"
     
-    def create_database_backup(self):
-        """Create a local backup of the database with compression"""
+    def create_database_backup(self, incremental=False, skip_unchanged=False):
+        """Create a local backup of the database with compression
+
+        With incremental=True only the pages that changed since the previous
+        backup are stored, unless a new full base is due. With
+        skip_unchanged=True no archive is written when the snapshot is
+        identical to the latest backup, and that backup's path is returned.
+        """
         try:
             if not os.path.exists(self.db_path):
                 logger.error(f"Database file not found: {self.db_path}")
@@ -42,106 +649,532 @@ class LocalBackup:
             
             backup_name = self.create_backup_filename()
             backup_db_path = os.path.join(self.backup_dir, f"{backup_name}.db")
-            backup_zip_path = os.path.join(self.backup_dir, f"{backup_name}.zip")
             
-            # Create database copy
-            shutil.copy2(self.db_path, backup_db_path)
+            # Create a consistent snapshot of the live database. The data
+            # version is read first so commits racing the snapshot count as changes
+            data_version = self.get_data_version()
+            online_backup(self.db_path, backup_db_path)
+            # archive.db after the database: a row being archived meanwhile
+            # lands in both copies rather than in neither
+            archive_snapshot = self.snapshot_record_archive(backup_name)
             
-            # Create compressed backup
-            with zipfile.ZipFile(backup_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                zipf.write(backup_db_path, f"{backup_name}.db")
+            try:
+                page_size = self.read_page_size(backup_db_path)
+                parent = self.get_chain_parent(page_size) if incremental else None
+                
+                if parent:
+                    page_hashes = self.hash_pages(backup_db_path, page_size)
+                    identical = parent['page_hashes'] == page_hashes
+                    if not (skip_unchanged and identical):
+                        backup_path = self.write_incremental_archive(
+                            backup_db_path, backup_name, page_size, page_hashes, parent, archive_snapshot)
+                else:
+                    # Hashing happens in the same pass that compresses the snapshot
+                    backup_path, page_hashes = self.write_full_archive(
+                        backup_db_path, backup_name, archive_snapshot=archive_snapshot)
+                    identical = self.find_identical_backup(page_hashes, exclude=backup_path)
+                    if skip_unchanged and identical:
+                        os.remove(backup_path)
                 
-                # Add metadata
-                metadata = {
-                    'created': datetime.now().isoformat(),
-                    'original_size': os.path.getsize(self.db_path),
-                    'compressed_size': os.path.getsize(backup_zip_path),
-                    'version': '1.0'
-                }
-                zipf.writestr('backup_info.json', json.dumps(metadata, indent=2))
-            
-            # Remove uncompressed copy
-            os.remove(backup_db_path)
+                if skip_unchanged and identical:
+                    latest = self.get_latest_backup()['path']
+                    self.last_data_version = data_version
+                    logger.info(f"Database unchanged since {os.path.basename(latest)}, no new backup written")
+                    return latest
+                
+                # Page hashes are what the next incremental backup diffs against
+                self.save_page_hashes(backup_path, page_hashes)
+                self.catalog.add(catalog_entry(
+                    backup_path, self.read_backup_metadata(backup_path), backup_db_path))
+                self.last_data_version = data_version
+            finally:
+                # Remove uncompressed copies
+                os.remove(backup_db_path)
+                if archive_snapshot:
+                    os.remove(archive_snapshot)
             
             # Automatically cleanup old backups to maintain limit
             self.cleanup_old_backups()
             
-            logger.info(f"Created backup: {backup_zip_path}")
-            return backup_zip_path
+            logger.info(f"Created backup: {backup_path}")
+            return backup_path
             
         except Exception as e:
             logger.error(f"Failed to create backup: {e}")
             return None
     
+    def write_full_archive(self, snapshot_path, backup_name, extra_metadata=None, archive_snapshot=None):
+        """Stream a full database snapshot into a compressed backup archive
+        
+        The snapshot is read once: pages are hashed on their way into the
+        compressor. The archive.db snapshot, if given, is stored after it.
+        Returns (archive_path, page_hashes).
+        """
+        backup_path = os.path.join(self.backup_dir, f"{backup_name}{ARCHIVE_EXTENSION}")
+        page_size = self.read_page_size(snapshot_path)
+        
+        # Metadata goes first so it can be read without decompressing the database
+        metadata = {
+            'created': datetime.now().isoformat(),
+            'original_size': os.path.getsize(snapshot_path),
+            'version': '3.0',
+            'type': 'full',
+            'page_size': page_size
+        }
+        if archive_snapshot:
+            metadata.update({'archive_checksum': file_checksum(archive_snapshot), 'archive_stored': True})
+        metadata.update(extra_metadata or {})
+        
+        with BackupArchiveWriter(backup_path) as archive, open(snapshot_path, 'rb') as snapshot:
+            archive.add_bytes('backup_info.json', json.dumps(metadata, indent=2).encode())
+            reader = PageHashingReader(snapshot, page_size)
+            archive.add_file(f"{backup_name}.db", reader, metadata['original_size'])
+            reader.read()  # Hash any trailing partial page
+            if archive_snapshot:
+                with open(archive_snapshot, 'rb') as f:
+                    archive.add_file(RECORD_ARCHIVE_MEMBER, f, os.path.getsize(archive_snapshot))
+        
+        return backup_path, reader.hashes
+    
+    def write_incremental_archive(self, snapshot_path, backup_name, page_size, page_hashes, parent,
+                                  archive_snapshot=None):
+        """Store only the pages that differ from the parent backup
+
+        The archive.db snapshot is only stored when it changed since the
+        parent; otherwise the copy further up the chain is the current one.
+        """
+        backup_path = os.path.join(self.backup_dir, f"{backup_name}_incr{ARCHIVE_EXTENSION}")
+        parent_hashes = parent['page_hashes']
+        changed = [
+            page_no for page_no, digest in enumerate(page_hashes)
+            if page_no >= len(parent_hashes) or parent_hashes[page_no] != digest
+        ]
+        
+        metadata = {
+            'created': datetime.now().isoformat(),
+            'original_size': os.path.getsize(snapshot_path),
+            'version': '3.0',
+            'type': 'incremental',
+            'parent': os.path.basename(parent['path']),
+            'base': parent['base'],
+            'chain_length': parent['chain_length'] + 1,
+            'page_size': page_size,
+            'page_count': len(page_hashes),
+            'changed_pages': len(changed)
+        }
+        if archive_snapshot:
+            archive_checksum = file_checksum(archive_snapshot)
+            metadata.update({
+                'archive_checksum': archive_checksum,
+                'archive_stored': archive_checksum != parent.get('archive_checksum')
+            })
+        
+        with BackupArchiveWriter(backup_path) as archive, open(snapshot_path, 'rb') as snapshot:
+            archive.add_bytes('backup_info.json', json.dumps(metadata, indent=2).encode())
+            # Changed pages are written in page order, pages.idx holds their numbers
+            archive.add_bytes('pages.idx', struct.pack(f'>{len(changed)}I', *changed))
+            archive.add_file('pages.bin', PageSelectionReader(snapshot, page_size, changed),
+                             len(changed) * page_size)
+            if metadata.get('archive_stored'):
+                with open(archive_snapshot, 'rb') as f:
+                    archive.add_file(RECORD_ARCHIVE_MEMBER, f, os.path.getsize(archive_snapshot))
+        
+        logger.info(f"Incremental backup stores {len(changed)}/{len(page_hashes)} pages")
+        return backup_path
+    
+    @property
+    def record_archive_path(self):
+        from record_archive import archive_path_for
+        return archive_path_for(self.db_path)
+    
+    def snapshot_record_archive(self, backup_name):
+        """Consistent copy of archive.db to store with a backup, or None if there is no archive"""
+        if not os.path.exists(self.record_archive_path):
+            return None
+        snapshot_path = os.path.join(self.backup_dir, f"{backup_name}_archive.db")
+        online_backup(self.record_archive_path, snapshot_path)
+        return snapshot_path
+    
+    def restore_record_archive(self, backup_path):
+        """Put back the archive.db stored with a backup
+        
+        The copy is taken from the newest archive of the backup's chain that
+        stores one. Returns False, leaving archive.db as it is, for backups
+        made without an archive.
+        """
+        for path in reversed(self.get_backup_chain(backup_path)):
+            metadata = self.read_backup_metadata(path)
+            if not metadata.get('archive_checksum'):
+                break
+            if not metadata.get('archive_stored'):
+                continue
+            extracted_path = os.path.join(self.backup_dir, 'restore_in_progress_archive.db')
+            try:
+                for name, member in iter_archive_members(path):
+                    if name == RECORD_ARCHIVE_MEMBER:
+                        with open(extracted_path, 'wb') as dst:
+                            shutil.copyfileobj(member, dst, ARCHIVE_CHUNK_SIZE)
+                        break
+                else:
+                    raise ValueError(f"No archive.db copy found in {os.path.basename(path)}")
+                hot_restore(extracted_path, self.record_archive_path, reconnect=False)
+            finally:
+                if os.path.exists(extracted_path):
+                    os.remove(extracted_path)
+            return True
+        logger.warning(f"{os.path.basename(backup_path)} holds no archive.db copy, archive.db left as is")
+        return False
+    
+    def read_page_size(self, db_path):
+        """Read the page size from the SQLite file header"""
+        with open(db_path, 'rb') as f:
+            header = f.read(100)
+        page_size = struct.unpack('>H', header[16:18])[0]
+        # The value 1 encodes the maximum page size of 65536 bytes
+        return 65536 if page_size == 1 else page_size
+    
+    def hash_pages(self, db_path, page_size):
+        """Return one digest per database page"""
+        hashes = []
+        with open(db_path, 'rb') as f:
+            while True:
+                page = f.read(page_size)
+                if not page:
+                    break
+                hashes.append(hashlib.blake2b(page, digest_size=PAGE_DIGEST_SIZE).digest())
+        return hashes
+    
+    def page_hashes_path(self, backup_path):
+        """Sidecar file holding the page digests of a backup"""
+        return archive_stem(backup_path) + '.pages'
+    
+    def save_page_hashes(self, backup_path, page_hashes):
+        """Persist page digests next to the backup archive"""
+        with open(self.page_hashes_path(backup_path), 'wb') as f:
+            f.write(b''.join(page_hashes))
+    
+    def load_page_hashes(self, backup_path):
+        """Load page digests saved for a backup, or None if unavailable"""
+        hashes_path = self.page_hashes_path(backup_path)
+        if not os.path.exists(hashes_path):
+            return None
+        with open(hashes_path, 'rb') as f:
+            data = f.read()
+        return [data[i:i + PAGE_DIGEST_SIZE] for i in range(0, len(data), PAGE_DIGEST_SIZE)]
+    
+    def get_latest_backup(self, exclude=None):
+        """Return the newest regular (non pre-restore) backup, or None"""
+        for backup in self.get_backup_info():
+            if backup['path'] != exclude:
+                return backup
+        return None
+    
+    def find_identical_backup(self, page_hashes, exclude=None):
+        """Return the latest backup if its pages match page_hashes exactly"""
+        latest = self.get_latest_backup(exclude)
+        if latest and self.load_page_hashes(latest['path']) == page_hashes:
+            return latest['path']
+        return None
+    
+    def get_data_version(self):
+        """Return SQLite's data_version as seen by a long-lived monitor connection
+        
+        The value changes whenever any other connection commits, which makes
+        it a free change detector between scheduled backups.
+        """
+        try:
+            if self.monitor_conn is None:
+                self.monitor_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            return self.monitor_conn.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read data_version: {e}")
+            return None
+    
+    def has_changes_since_last_backup(self):
+        """Cheap check whether anything was committed since the last backup
+        
+        Returns True when unknown (e.g. after a restart); the page comparison
+        in create_database_backup then decides.
+        """
+        if self.last_data_version is None:
+            return True
+        return self.get_data_version() != self.last_data_version
+    
+    def record_writes(self, row_count):
+        """Count rows written in bulk and schedule an extra backup after a burst"""
+        self.pending_writes += row_count
+        if self.pending_writes < self.burst_write_threshold:
+            return
+        
+        try:
+            from job_scheduler import job_scheduler
+            # An already scheduled burst backup is kept, not pushed back
+            if job_scheduler.run_once('burst_backup', self.perform_backup,
+                                      self.burst_backup_delay_minutes * 60,
+                                      name="Sao lưu sau khi nhập dữ liệu lớn", replace=False):
+                logger.info(f"{self.pending_writes} rows written, extra backup scheduled "
+                            f"in {self.burst_backup_delay_minutes} minutes")
+        except Exception as e:
+            logger.error(f"Failed to schedule burst backup: {e}")
+    
+    def read_backup_metadata(self, backup_path):
+        """Read backup_info.json from a backup archive"""
+        try:
+            for name, member in iter_archive_members(backup_path):
+                if name == 'backup_info.json':
+                    return json.loads(member.read().decode())
+        except Exception as e:
+            logger.warning(f"Failed to read metadata for {backup_path}: {e}")
+        return {}
+    
+    def get_chain_parent(self, page_size):
+        """Find the backup the next incremental backup should build on
+        
+        Returns None when a new full base is due: no usable previous backup,
+        the base is older than full_backup_interval_days, the chain is already
+        max_chain_length long, or the page size changed.
+        """
+        latest = self.get_latest_backup()
+        if not latest:
+            return None
+        
+        metadata = latest['metadata']
+        page_hashes = self.load_page_hashes(latest['path'])
+        if page_hashes is None:
+            return None
+        
+        if metadata.get('type') == 'incremental':
+            base = metadata['base']
+            chain_length = metadata.get('chain_length') or 1
+        else:
+            base = latest['filename']
+            chain_length = 0
+        
+        latest_page_size = metadata.get('page_size') or self.read_archive_page_size(latest['path'])
+        if latest_page_size != page_size:
+            return None
+        
+        base_backup = next((b for b in self.get_backup_info() if b['filename'] == base), None)
+        if base_backup is None or not os.path.exists(base_backup['path']):
+            return None
+        if datetime.now() - base_backup['created_datetime'] > timedelta(days=self.full_backup_interval_days):
+            return None
+        if chain_length >= self.max_chain_length:
+            return None
+        
+        return {
+            'path': latest['path'],
+            'base': base,
+            'chain_length': chain_length,
+            'page_hashes': page_hashes,
+            'archive_checksum': metadata.get('archive_checksum')
+        }
+    
+    def read_archive_page_size(self, backup_path):
+        """Read the page size of the database stored in a full backup archive"""
+        for name, member in iter_archive_members(backup_path):
+            if name == 'backup_info.json':
+                page_size = json.loads(member.read().decode()).get('page_size')
+                if page_size:
+                    return page_size
+            elif name.endswith('.db'):
+                header = member.read(100)
+                page_size = struct.unpack('>H', header[16:18])[0]
+                return 65536 if page_size == 1 else page_size
+        return None
+    
+    def get_backup_chain(self, backup_path):
+        """Return the archives needed to rebuild a backup, base first"""
+        chain = [backup_path]
+        metadata = self.read_backup_metadata(backup_path)
+        while metadata.get('type') == 'incremental':
+            parent_path = os.path.join(os.path.dirname(backup_path) or self.backup_dir, metadata['parent'])
+            if not os.path.exists(parent_path):
+                parent_path = os.path.join(self.backup_dir, metadata['parent'])
+            if not os.path.exists(parent_path):
+                raise FileNotFoundError(f"Missing parent backup: {metadata['parent']}")
+            chain.append(parent_path)
+            metadata = self.read_backup_metadata(parent_path)
+        chain.reverse()
+        return chain
+    
+    def materialize_backup(self, backup_path, dest_path):
+        """Rebuild the database file of a backup at dest_path
+        
+        Full archives are extracted directly; incremental archives are
+        rebuilt by replaying every delta of their chain over the base.
+        """
+        chain = self.get_backup_chain(backup_path)
+        
+        for name, member in iter_archive_members(chain[0]):
+            if name.endswith('.db'):
+                with open(dest_path, 'wb') as dst:
+                    shutil.copyfileobj(member, dst, ARCHIVE_CHUNK_SIZE)
+                break
+        else:
+            raise ValueError("No database file found in backup")
+        
+        for delta_path in chain[1:]:
+            self.apply_incremental_archive(delta_path, dest_path)
+        
+        return dest_path
+    
+    def read_backup_image(self, backup_path):
+        """Rebuild the database image of a backup in memory, without temp files"""
+        if backup_path.endswith('.db'):
+            with open(backup_path, 'rb') as f:
+                return f.read()
+        
+        chain = self.get_backup_chain(backup_path)
+        image = io.BytesIO()
+        
+        for name, member in iter_archive_members(chain[0]):
+            if name.endswith('.db'):
+                shutil.copyfileobj(member, image, ARCHIVE_CHUNK_SIZE)
+                break
+        else:
+            raise ValueError("No database file found in backup")
+        
+        for delta_path in chain[1:]:
+            self.apply_pages(delta_path, image)
+        
+        return image.getvalue()
+    
+    def apply_incremental_archive(self, delta_path, db_file_path):
+        """Write the pages stored in an incremental archive into a database file"""
+        with open(db_file_path, 'r+b') as db_file:
+            self.apply_pages(delta_path, db_file)
+    
+    def apply_pages(self, delta_path, db_file):
+        """Write the pages of an incremental archive into an open binary file"""
+        metadata = self.read_backup_metadata(delta_path)
+        page_size = metadata['page_size']
+        page_numbers = ()
+        
+        # pages.idx always precedes pages.bin in the archive
+        for name, member in iter_archive_members(delta_path):
+            if name == 'pages.idx':
+                index = member.read()
+                page_numbers = struct.unpack(f'>{len(index) // 4}I', index)
+            elif name == 'pages.bin':
+                for page_no in page_numbers:
+                    db_file.seek(page_no * page_size)
+                    db_file.write(member.read(page_size))
+        db_file.truncate(metadata['page_count'] * page_size)
+    
+    def select_backups_to_keep(self, backups):
+        """Apply the GFS retention policy to a newest-first list of backups
+        
+        Keeps the newest backup of each of the most recent days, ISO weeks
+        and months configured in self.retention, plus the newest backup.
+        """
+        keep = {backups[0]['path']} if backups else set()
+        periods = {
+            'daily': lambda d: d.date(),
+            'weekly': lambda d: d.isocalendar()[:2],
+            'monthly': lambda d: (d.year, d.month),
+        }
+        for tier, period_of in periods.items():
+            seen = set()
+            for backup in backups:
+                period = period_of(backup['created_datetime'])
+                if period in seen:
+                    continue
+                if len(seen) >= self.retention[tier]:
+                    break
+                seen.add(period)
+                keep.add(backup['path'])
+        return keep
+    
     def cleanup_old_backups(self):
-        """Remove old backup files, keeping only the most recent ones"""
+        """Remove backups that fall outside the GFS retention policy
+        
+        Older archives that a kept incremental backup depends on are kept too.
+        """
         try:
-            # Get all backup files
-            backup_pattern = os.path.join(self.backup_dir, "lang_huu_nghi_backup_*.zip")
-            backup_files = glob.glob(backup_pattern)
+            backups = self.get_backup_info()
             
-            # Sort by modification time (newest first)
-            backup_files.sort(key=os.path.getmtime, reverse=True)
+            keep = set()
+            for file_path in self.select_backups_to_keep(backups):
+                try:
+                    keep.update(self.get_backup_chain(file_path))
+                except FileNotFoundError as e:
+                    logger.warning(f"Broken backup chain for {os.path.basename(file_path)}: {e}")
+                    keep.add(file_path)
             
-            # Remove old files beyond the limit
-            if len(backup_files) > self.max_backups:
-                files_to_delete = backup_files[self.max_backups:]
-                for file_path in files_to_delete:
+            for backup in backups:
+                file_path = backup['path']
+                if file_path in keep:
+                    continue
+                if os.path.exists(file_path):
                     os.remove(file_path)
-                    logger.info(f"Deleted old backup: {os.path.basename(file_path)}")
+                if os.path.exists(self.page_hashes_path(file_path)):
+                    os.remove(self.page_hashes_path(file_path))
+                self.catalog.remove(backup['filename'])
+                logger.info(f"Deleted old backup: {backup['filename']}")
+            
+            self.wal_archiver.remove_orphaned_segments()
             
         except Exception as e:
             logger.error(f"Failed to cleanup old backups: {e}")
     
-    def get_backup_info(self):
-        """Get information about existing backups"""
+    def rebuild_catalog(self):
+        """Recreate the catalog by scanning the backup directory
+        
+        Only needed once, for backups made before the catalog existed or
+        after the catalog file was lost. Row counts are not recovered.
+        """
+        # Archives from LocalBackup plus .db snapshots from Database.backup_database
+        backup_files = [
+            path for pattern in ("lang_huu_nghi_backup_*", "pre_restore_backup_*")
+            for path in glob.glob(os.path.join(self.backup_dir, pattern))
+            if path.endswith(('.zip', '.tar.zst'))
+        ]
+        backup_files += glob.glob(os.path.join(self.backup_dir, "backup_*.db"))
+        
+        entries = []
+        for file_path in sorted(backup_files):
+            try:
+                if file_path.endswith('.db'):
+                    metadata = {'type': 'snapshot'}
+                else:
+                    metadata = self.read_backup_metadata(file_path)
+                    if os.path.basename(file_path).startswith('pre_restore_backup_'):
+                        metadata.setdefault('type', 'pre_restore')
+                entries.append(catalog_entry(file_path, metadata))
+            except Exception as e:
+                logger.warning(f"Failed to catalog {file_path}: {e}")
+        
+        with CATALOG_LOCK:
+            self.catalog.save(entries)
+        logger.info(f"Backup catalog rebuilt with {len(entries)} entries")
+        return entries
+    
+    def catalog_entries(self):
+        """Catalog entries, rebuilding the catalog if it is missing or unreadable"""
+        entries = self.catalog.load()
+        if entries is None:
+            entries = self.rebuild_catalog()
+        return entries
+    
+    def get_backup_info(self, types=('full', 'incremental')):
+        """Get information about existing backups from the catalog, newest first"""
         try:
-            backup_pattern = os.path.join(self.backup_dir, "lang_huu_nghi_backup_*.zip")
-            backup_files = glob.glob(backup_pattern)
-            backup_files.sort(key=os.path.getmtime, reverse=True)
+            entries = self.catalog_entries()
             
             backups = []
-            for file_path in backup_files:
-                try:
-                    file_stat = os.stat(file_path)
-                    size_mb = file_stat.st_size / (1024 * 1024)
-                    
-                    # Extract timestamp from filename
-                    filename = os.path.basename(file_path)
-                    # Extract timestamp: lang_huu_nghi_backup_YYYYMMDD_HHMMSS.zip
-                    timestamp_str = filename.replace('lang_huu_nghi_backup_', '').replace('.zip', '')
-                    
-                    try:
-                        # Parse timestamp from filename
-                        backup_datetime = datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S')
-                        display_date = backup_datetime.strftime('%d/%m/%Y lúc %H:%M')
-                        sort_date = backup_datetime
-                    except ValueError:
-                        # Fallback to file modification time if filename parsing fails
-                        sort_date = datetime.fromtimestamp(file_stat.st_mtime)
-                        display_date = sort_date.strftime('%d/%m/%Y lúc %H:%M')
-                    
-                    # Try to read metadata from zip
-                    metadata = {}
-                    try:
-                        with zipfile.ZipFile(file_path, 'r') as zipf:
-                            if 'backup_info.json' in zipf.namelist():
-                                metadata = json.loads(zipf.read('backup_info.json').decode())
-                    except:
-                        pass
-                    
-                    backup_info = {
-                        'filename': filename,
-                        'path': file_path,
-                        'size': f"{size_mb:.2f} MB",
-                        'created': display_date,
-                        'created_datetime': sort_date,
-                        'metadata': metadata
-                    }
-                    backups.append(backup_info)
-                except Exception as e:
-                    logger.warning(f"Failed to read backup info for {file_path}: {e}")
+            for entry in entries:
+                if types and entry.get('type', 'full') not in types:
                     continue
+                created = datetime.fromisoformat(entry['created'])
+                backups.append({
+                    'filename': entry['filename'],
+                    'path': os.path.join(self.backup_dir, entry['filename']),
+                    'size': f"{entry['size_bytes'] / (1024 * 1024):.2f} MB",
+                    'created': created.strftime('%d/%m/%Y lúc %H:%M'),
+                    'created_datetime': created,
+                    'metadata': entry
+                })
             
             # Sort by actual creation time
             backups.sort(key=lambda x: x['created_datetime'], reverse=True)
@@ -161,62 +1194,51 @@ class LocalBackup:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             pre_restore_name = f"pre_restore_backup_{timestamp}"
             backup_db_path = os.path.join(self.backup_dir, f"{pre_restore_name}.db")
-            backup_zip_path = os.path.join(self.backup_dir, f"{pre_restore_name}.zip")
             
-            # Create database copy
-            shutil.copy2(self.db_path, backup_db_path)
+            # Create a consistent snapshot of the live database
+            online_backup(self.db_path, backup_db_path)
+            archive_snapshot = self.snapshot_record_archive(pre_restore_name)
             
-            # Create compressed backup
-            with zipfile.ZipFile(backup_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                zipf.write(backup_db_path, f"{pre_restore_name}.db")
-                
-                # Add metadata
-                metadata = {
-                    'created': datetime.now().isoformat(),
-                    'original_size': os.path.getsize(self.db_path),
-                    'compressed_size': os.path.getsize(backup_zip_path),
-                    'version': '1.0',
-                    'type': 'pre_restore'
-                }
-                zipf.writestr('backup_info.json', json.dumps(metadata, indent=2))
-            
-            # Remove uncompressed copy
-            os.remove(backup_db_path)
-            
-            logger.info(f"Created pre-restore backup: {backup_zip_path}")
-            return backup_zip_path
+            try:
+                backup_path, _ = self.write_full_archive(
+                    backup_db_path, pre_restore_name, {'type': 'pre_restore'}, archive_snapshot)
+                self.catalog.add(catalog_entry(
+                    backup_path, self.read_backup_metadata(backup_path), backup_db_path))
+            finally:
+                # Remove uncompressed copies
+                os.remove(backup_db_path)
+                if archive_snapshot:
+                    os.remove(archive_snapshot)
+            
+            logger.info(f"Created pre-restore backup: {backup_path}")
+            return backup_path
             
         except Exception as e:
             logger.error(f"Failed to create pre-restore backup: {e}")
             return None
 
     def restore_backup(self, backup_path):
-        """Restore database from backup"""
+        """Restore database from backup without restarting the app"""
         try:
             if not os.path.exists(backup_path):
                 logger.error(f"Backup file not found: {backup_path}")
                 return False
             
-            # Handle both .zip and .db files
-            if backup_path.endswith('.zip'):
-                # Extract and restore from zip
-                with zipfile.ZipFile(backup_path, 'r') as zipf:
-                    # Find the database file in the zip
-                    db_files = [name for name in zipf.namelist() if name.endswith('.db')]
-                    if not db_files:
-                        logger.error("No database file found in backup")
-                        return False
-                    
-                    # Extract database file
-                    zipf.extract(db_files[0], self.backup_dir)
-                    extracted_path = os.path.join(self.backup_dir, db_files[0])
-                    
-                    # Replace current database
-                    shutil.move(extracted_path, self.db_path)
+            # Handle .tar.zst, .zip and .db files
+            if backup_path.endswith(('.tar.zst', '.zip')):
+                # Rebuild the database file (replaying deltas for incremental backups)
+                extracted_path = os.path.join(self.backup_dir, 'restore_in_progress.db')
+                try:
+                    self.materialize_backup(backup_path, extracted_path)
+                    self.restore_record_archive(backup_path)
+                    hot_restore(extracted_path, self.db_path)
+                finally:
+                    if os.path.exists(extracted_path):
+                        os.remove(extracted_path)
             
             elif backup_path.endswith('.db'):
                 # Direct database file restore
-                shutil.copy2(backup_path, self.db_path)
+                hot_restore(backup_path, self.db_path)
             
             else:
                 logger.error(f"Unsupported backup file format: {backup_path}")
@@ -229,13 +1251,67 @@ class LocalBackup:
             logger.error(f"Failed to restore backup: {e}")
             return False
     
-    def perform_backup(self):
-        """Perform complete backup process"""
-        logger.info("Starting automatic database backup...")
+    def restore_to_point_in_time(self, target_time):
+        """Restore the database as it was at target_time without restarting the app
+        
+        The newest full backup taken before target_time is rebuilt and the
+        WAL segments archived after it are replayed up to target_time.
+        archive.db has no WAL archive; it is restored from the newest backup
+        before target_time, and the archive job backs up right after every
+        run, so that copy holds the rows archived by then.
+        """
+        try:
+            base_path, segments = self.wal_archiver.plan_recovery(target_time)
+            extracted_path = os.path.join(self.backup_dir, 'restore_in_progress.db')
+            try:
+                self.materialize_backup(base_path, extracted_path)
+                with open(extracted_path, 'r+b') as db_file:
+                    for segment_path in segments:
+                        apply_wal_segment(segment_path, db_file)
+                archive_backup = next((
+                    b for b in self.get_backup_info(types=None)
+                    if b['created_datetime'] <= target_time and b['metadata'].get('archive_checksum')
+                ), None)
+                if archive_backup:
+                    self.restore_record_archive(archive_backup['path'])
+                hot_restore(extracted_path, self.db_path)
+            finally:
+                if os.path.exists(extracted_path):
+                    os.remove(extracted_path)
+            
+            logger.info(f"Database restored to {target_time} from {os.path.basename(base_path)} "
+                        f"and {len(segments)} WAL segments")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Point-in-time restore failed: {e}")
+            return False
+    
+    def get_recovery_window(self):
+        """Earliest and latest time the database can be restored to, or None"""
+        try:
+            return self.wal_archiver.get_recovery_window()
+        except Exception as e:
+            logger.error(f"Failed to read WAL archive: {e}")
+            return None
+    
+    def perform_backup(self, skip_unchanged=True):
+        """Perform complete backup process
+        
+        Scheduled runs skip the backup if nothing changed; user-initiated
+        backups pass skip_unchanged=False and always write one.
+        """
+        logger.info("Starting database backup...")
         
         try:
-            # Create backup
-            backup_path = self.create_database_backup()
+            if skip_unchanged and not self.has_changes_since_last_backup():
+                logger.info("No changes since last backup, skipping")
+                return True
+            
+            self.pending_writes = 0
+            
+            # Create backup (incremental unless a new full base is due)
+            backup_path = self.create_database_backup(incremental=True, skip_unchanged=skip_unchanged)
             if not backup_path:
                 logger.error("Failed to create backup")
                 return False
@@ -264,44 +1340,46 @@ class LocalBackup:
         with open('last_backup.json', 'w') as f:
             json.dump(metadata, f, indent=2)
     
+    def register_jobs(self):
+        """Register the backup jobs with the process-wide scheduler"""
+        from job_scheduler import job_scheduler
+        
+        # Schedule backup every day at 2 AM
+        job_scheduler.register('daily_backup', self.perform_backup, 'cron',
+                               name="Sao lưu hằng ngày", hour=2, minute=0)
+        
+        # Ship WAL frames continuously for point-in-time recovery
+        job_scheduler.register('wal_archive', self.wal_archiver.archive, 'interval',
+                               name="Lưu trữ nhật ký WAL", minutes=WAL_ARCHIVE_INTERVAL_MINUTES,
+                               next_run_time=datetime.now())
+        if not self.shutdown_registered:
+            atexit.register(self.wal_archiver.shutdown)
+            self.shutdown_registered = True
+        logger.info("Backup jobs registered - backups run daily at 2:00 AM, WAL archived every minute")
+    
     def start_scheduler(self):
-        """Start the daily backup scheduler"""
+        """Start the daily backup and WAL archive jobs"""
+        from job_scheduler import job_scheduler
         try:
-            # Check if scheduler is already running
-            if self.scheduler.running:
-                logger.info("Backup scheduler is already running")
-                return
-                
-            # Schedule backup every day at 2 AM
-            self.scheduler.add_job(
-                func=self.perform_backup,
-                trigger="cron",
-                hour=2,
-                minute=0,
-                id='daily_backup'
-            )
-            
-            self.scheduler.start()
-            logger.info("Backup scheduler started - backups will run daily at 2:00 AM")
-            
+            self.register_jobs()
+            job_scheduler.start()
         except Exception as e:
-            if "conflicts with an existing job" in str(e):
-                logger.info("Backup scheduler job already exists")
-            else:
-                logger.error(f"Failed to start scheduler: {e}")
+            logger.error(f"Failed to start scheduler: {e}")
     
     def stop_scheduler(self):
-        """Stop the backup scheduler"""
+        """Remove the backup jobs from the scheduler"""
+        from job_scheduler import job_scheduler
         try:
-            self.scheduler.shutdown()
-            logger.info("Backup scheduler stopped")
+            for job_id in ('daily_backup', 'wal_archive', 'burst_backup'):
+                job_scheduler.remove(job_id)
+            logger.info("Backup jobs stopped")
         except Exception as e:
             logger.error(f"Failed to stop scheduler: {e}")
     
     def manual_backup(self):
         """Perform immediate manual backup"""
         logger.info("Performing manual backup...")
-        return self.perform_backup()
+        return self.perform_backup(skip_unchanged=False)
 
 # Global backup instance
 backup_service = LocalBackup()
@@ -311,6 +1389,10 @@ def start_automatic_backups():
     backup_service.start_scheduler()
     return True
 
+def notify_bulk_write(row_count):
+    """Tell the backup service that a bulk operation wrote row_count rows"""
+    backup_service.record_writes(row_count)
+
 def perform_manual_backup():
     """Perform manual backup"""
     return backup_service.manual_backup()
@@ -205,7 +205,7 @@ def database_management_section():
                                 label="⬇️ Tải xuống backup",
                                 data=backup_data,
                                 file_name=os.path.basename(backup_path),
-                                mime="application/zip"
+                                mime="application/zstd" if backup_path.endswith('.zst') else "application/zip"
                             )
                     else:
                         st.error("❌ Sao lưu thất bại!")
@@ -226,7 +226,8 @@ def database_management_section():
                     col_date, col_restore = st.columns([3, 1])
                     
                     with col_date:
-                        st.write(f"• {backup['created']} ({backup['size']})")
+                        kind = "tăng dần" if backup['metadata'].get('type') == 'incremental' else "đầy đủ"
+                        st.write(f"• {backup['created']} ({backup['size']}, {kind})")
                     
                     with col_restore:
                         if st.button("🔄", key=f"restore_{i}", help="Khôi phục backup này"):
@@ -361,8 +362,8 @@ def database_management_section():
         # Upload and restore backup
         uploaded_file = st.file_uploader(
             "Chọn file backup để khôi phục",
-            type=['zip', 'db'],
-            help="Chọn file backup (.zip hoặc .db) để khôi phục dữ liệu"
+            type=['zst', 'zip', 'db'],
+            help="Chọn file backup (.tar.zst, .zip hoặc .db) để khôi phục dữ liệu"
         )
         
         if uploaded_file:
@@ -395,7 +396,7 @@ def database_management_section():
                             
                             if success:
                                 st.success("✅ Khôi phục thành công!")
-                                st.success("🔄 Vui lòng tải lại trang để thấy dữ liệu mới")
+                                st.success("🔄 Dữ liệu mới đã có hiệu lực ngay, không cần khởi động lại ứng dụng")
                                 
                                 # Store restore info for revert option
                                 st.session_state.restore_completed = True
@@ -413,14 +414,336 @@ def database_management_section():
                             if 'temp_path' in locals() and os.path.exists(temp_path):
                                 os.remove(temp_path)
     
+    # Backup browser - compare a backup with live data and restore one student
+    if not st.session_state.get('show_restore_confirm', False):
+        st.subheader("🔍 So sánh backup với dữ liệu hiện tại")
+
+        try:
+            from local_backup import LocalBackup
+            backup_service = LocalBackup()
+            backups = backup_service.get_backup_info()
+        except Exception:
+            backups = []
+
+        if backups:
+            backup_labels = {b['path']: f"{b['created']} ({b['size']})" for b in backups}
+            selected_backup = st.selectbox(
+                "Chọn bản sao lưu",
+                options=list(backup_labels.keys()),
+                format_func=lambda path: backup_labels[path],
+                key="browse_backup_path"
+            )
+
+            if st.button("🔍 So sánh", key="browse_backup_diff"):
+                with st.spinner("Đang đọc bản sao lưu..."):
+                    try:
+                        from backup_browser import BackupBrowser
+                        with BackupBrowser(selected_backup, backup_service=backup_service) as browser:
+                            st.session_state.backup_diff = browser.diff()
+                            st.session_state.backup_students = browser.list_students()
+                            st.session_state.backup_diff_path = selected_backup
+                    except Exception as e:
+                        st.error(f"❌ Không thể đọc bản sao lưu: {str(e)}")
+
+            if st.session_state.get('backup_diff_path') == selected_backup:
+                rows = []
+                for item in st.session_state.backup_diff:
+                    if item.get('missing'):
+                        status = "Không có trong dữ liệu hiện tại" if item['missing'] == 'live' else "Không có trong backup"
+                    elif item['only_in_backup'] or item['only_in_live'] or item['changed']:
+                        status = "Khác biệt"
+                    else:
+                        status = "Giống nhau"
+                    rows.append({
+                        "Bảng": item['table'],
+                        "Số dòng (backup)": item.get('backup_rows'),
+                        "Số dòng (hiện tại)": item.get('live_rows'),
+                        "Chỉ có trong backup": item.get('only_in_backup', 0),
+                        "Chỉ có hiện tại": item.get('only_in_live', 0),
+                        "Đã thay đổi": item.get('changed', 0),
+                        "Trạng thái": status
+                    })
+                st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+                students = st.session_state.get('backup_students', [])
+                if students:
+                    st.write("**♻️ Khôi phục hồ sơ một học sinh từ bản sao lưu này:**")
+                    student_labels = {sid: f"{name} (ID: {sid})" for sid, name in students}
+                    selected_student = st.selectbox(
+                        "Chọn học sinh",
+                        options=list(student_labels.keys()),
+                        format_func=lambda sid: student_labels[sid],
+                        key="browse_backup_student"
+                    )
+                    st.caption("Hồ sơ hiện tại của học sinh này (gia đình, y tế, đánh giá, ghi chú, tài liệu) sẽ được thay bằng dữ liệu trong backup. Dữ liệu của học sinh khác không bị ảnh hưởng.")
+
+                    if st.button("♻️ Khôi phục hồ sơ học sinh", key="browse_backup_restore_student"):
+                        with st.spinner("Đang khôi phục hồ sơ..."):
+                            try:
+                                from backup_browser import BackupBrowser
+                                with BackupBrowser(selected_backup, backup_service=backup_service) as browser:
+                                    restored = browser.restore_student(selected_student)
+                                    warnings = browser.warnings
+                                st.success(f"✅ Đã khôi phục {sum(restored.values())} bản ghi của {student_labels[selected_student]}")
+                                for warning in warnings:
+                                    st.warning(f"⚠️ {warning}")
+                                del st.session_state.backup_diff_path
+                            except Exception as e:
+                                st.error(f"❌ Lỗi khôi phục hồ sơ: {str(e)}")
+        else:
+            st.write("📭 Chưa có bản sao lưu nào")
+
+    # Point-in-time recovery from the WAL archive
+    if not st.session_state.get('show_restore_confirm', False):
+        st.subheader("⏱️ Khôi phục theo thời điểm")
+
+        from local_backup import LocalBackup
+        backup_service = LocalBackup()
+        window = backup_service.get_recovery_window()
+
+        if window:
+            earliest, latest = window
+            st.write(f"Có thể khôi phục về bất kỳ thời điểm nào từ **{earliest.strftime('%d/%m/%Y %H:%M')}** "
+                     f"đến **{latest.strftime('%d/%m/%Y %H:%M')}** (chính xác đến từng phút)")
+
+            col_date, col_time = st.columns(2)
+            with col_date:
+                target_date = st.date_input("Ngày", value=latest.date(), min_value=earliest.date(),
+                                            max_value=latest.date(), key="pitr_date")
+            with col_time:
+                target_clock = st.time_input("Giờ", value=latest.time().replace(second=0, microsecond=0),
+                                             step=60, key="pitr_time")
+            target_time = datetime.combine(target_date, target_clock).replace(second=59)
+
+            if st.button("⏱️ Khôi phục về thời điểm này", key="pitr_restore"):
+                if target_time < earliest:
+                    st.error("❌ Thời điểm này nằm trước bản sao lưu cũ nhất")
+                else:
+                    with st.spinner("Đang khôi phục dữ liệu..."):
+                        pre_restore_backup = backup_service.create_pre_restore_backup()
+                        if pre_restore_backup:
+                            st.session_state.last_pre_restore_backup = pre_restore_backup
+
+                        if backup_service.restore_to_point_in_time(target_time):
+                            st.success(f"✅ Đã khôi phục dữ liệu về {target_time.strftime('%d/%m/%Y %H:%M')}")
+                            st.session_state.restore_completed = True
+                            st.session_state.restored_from = target_time.strftime('%d/%m/%Y %H:%M')
+                            time.sleep(2)
+                            st.rerun()
+                        else:
+                            st.error("❌ Khôi phục thất bại!")
+        else:
+            st.write("📭 Chưa có dữ liệu WAL được lưu trữ")
+
+    # Supabase connection latency
+    st.subheader("📈 Độ trễ kết nối Supabase")
+    try:
+        from supabase_monitor import LatencyStore, LATENCY_WINDOWS, LATENCY_SAMPLE_INTERVAL_MINUTES
+        latency_store = LatencyStore()
+        latency_stats = latency_store.get_percentiles()
+        if not latency_stats['7d']['samples']:
+            st.info(f"Chưa có số liệu độ trễ. Hệ thống đo mỗi {LATENCY_SAMPLE_INTERVAL_MINUTES} phút khi có DATABASE_URL.")
+        else:
+            metric_labels = {'connect_ms': "Kết nối", 'query_ms': "Truy vấn đầu", 'rtt_ms': "Khứ hồi"}
+            rows = []
+            for window in LATENCY_WINDOWS:
+                window_stats = latency_stats[window]
+                for metric, label in metric_labels.items():
+                    rows.append({
+                        "Khoảng thời gian": window,
+                        "Chỉ số": label,
+                        "p50 (ms)": window_stats[f'{metric}_p50'],
+                        "p95 (ms)": window_stats[f'{metric}_p95'],
+                        "p99 (ms)": window_stats[f'{metric}_p99'],
+                        "Số mẫu": window_stats['samples'],
+                        "Lỗi": window_stats['errors'],
+                    })
+            if latency_store.is_degraded(latency_stats):
+                st.warning("⚠️ Độ trễ p95 trong 1 giờ qua cao hơn nhiều so với 24 giờ qua — kết nối Supabase có thể đang chậm đi")
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+            series = latency_store.get_series(LATENCY_WINDOWS['24h'])
+            if series:
+                chart = pd.DataFrame(series)
+                chart['sampled_at'] = pd.to_datetime(chart['sampled_at'])
+                chart = chart.set_index('sampled_at')[list(metric_labels)].rename(columns=metric_labels)
+                st.line_chart(chart)
+    except Exception as e:
+        st.write(f"⚠️ Không thể đọc số liệu độ trễ: {str(e)}")
+
+    # Background jobs
+    st.subheader("⏲️ Tác vụ nền")
+    try:
+        from job_scheduler import job_scheduler
+
+        def format_time(value):
+            return value.strftime('%d/%m/%Y %H:%M') if value else "—"
+
+        jobs = job_scheduler.get_status()
+        if jobs:
+            st.dataframe(pd.DataFrame([{
+                "Tác vụ": job['name'],
+                "Lần chạy tới": format_time(job['next_run_time']),
+                "Đang chạy": "✅" if job['running'] else "",
+                "Số lần chạy": job['runs'],
+                "Lỗi": job['failures'],
+                "Thành công gần nhất": format_time(job['last_success']),
+                "Lỗi gần nhất": job['last_error'] or "",
+            } for job in jobs]), use_container_width=True, hide_index=True)
+        else:
+            st.info("Chưa có tác vụ nền nào được đăng ký")
+    except Exception as e:
+        st.write(f"⚠️ Không thể đọc trạng thái tác vụ nền: {str(e)}")
+
+    try:
+        consumers = Database().get_change_consumers()
+        if consumers:
+            st.caption("Luồng thay đổi dữ liệu (bản sao Postgres, bộ nhớ đệm, xuất dữ liệu)")
+            st.dataframe(pd.DataFrame([{
+                "Bên nhận": consumer['name'],
+                "Đã xử lý đến": consumer['cursor'],
+                "Còn chờ": consumer['behind'],
+                "Xác nhận gần nhất": consumer['acked_at'][:16].replace('T', ' '),
+            } for consumer in consumers]), use_container_width=True, hide_index=True)
+    except Exception as e:
+        st.write(f"⚠️ Không thể đọc luồng thay đổi dữ liệu: {str(e)}")
+
+    # Database file health
+    st.subheader("🧹 Tình trạng tệp cơ sở dữ liệu")
+    try:
+        from database_cleanup import DatabaseCleanup, maintenance_service
+        cleanup = DatabaseCleanup()
+        try:
+            report = cleanup.fragmentation_report()
+        finally:
+            cleanup.close()
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Kích thước dữ liệu", f"{report['database_size'] / 1024 / 1024:.2f} MB")
+        with col2:
+            st.metric("Trang trống", f"{report['freelist_count']}/{report['page_count']}",
+                      f"{report['free_ratio']:.1%}", delta_color="off")
+        with col3:
+            st.metric("Chế độ auto_vacuum", report['auto_vacuum'])
+        if maintenance_service.last_run:
+            st.caption(f"Bảo trì tự động gần nhất: {maintenance_service.last_run.strftime('%d/%m/%Y %H:%M')}")
+
+        if report['auto_vacuum'] != 'incremental':
+            st.info("Bảo trì tự động chỉ giải phóng trang trống khi cơ sở dữ liệu ở chế độ auto_vacuum incremental. "
+                    "Việc chuyển đổi cần chạy VACUUM một lần và sẽ khóa cơ sở dữ liệu trong lúc chạy; "
+                    "hãy thực hiện khi ít người dùng.")
+            if st.button("🔧 Chuyển sang auto_vacuum incremental", key="enable_incremental_vacuum"):
+                with st.spinner("Đang chạy VACUUM..."):
+                    cleanup = DatabaseCleanup()
+                    try:
+                        cleanup.enable_incremental_vacuum()
+                    finally:
+                        cleanup.close()
+                st.success("✅ Đã chuyển sang auto_vacuum incremental")
+                st.rerun()
+    except Exception as e:
+        st.write(f"⚠️ Không thể đọc thông tin cơ sở dữ liệu: {str(e)}")
+
+    # Archived records
+    st.subheader("🗄️ Lưu trữ hồ sơ cũ")
+    try:
+        from record_archive import RecordArchive, ARCHIVE_AFTER_DAYS
+        archive = RecordArchive()
+        try:
+            stats = archive.get_archive_stats()
+            archivable = archive.count_archivable()
+
+            table_labels = {'medical_records': "Hồ sơ y tế", 'student_class_history': "Lịch sử lớp học"}
+            cols = st.columns(len(stats))
+            for col, (table, counts) in zip(cols, stats.items()):
+                with col:
+                    st.metric(table_labels.get(table, table), f"{counts['live']} đang dùng",
+                              f"{counts['archived']} đã lưu trữ", delta_color="off")
+            st.caption(f"Hồ sơ cũ hơn {ARCHIVE_AFTER_DAYS // 365} năm được chuyển sang archive.db lúc 3:00 AM hằng ngày "
+                       f"và vẫn hiển thị trong lịch sử.")
+
+            if sum(archivable.values()) > 0:
+                if st.button(f"🗄️ Lưu trữ ngay {sum(archivable.values())} hồ sơ cũ", key="archive_old_records"):
+                    with st.spinner("Đang chuyển hồ sơ cũ sang kho lưu trữ..."):
+                        moved = archive.archive_old_records()
+                    st.success(f"✅ Đã lưu trữ {sum(moved.values())} hồ sơ")
+        finally:
+            archive.close()
+    except Exception as e:
+        st.write(f"⚠️ Không thể đọc kho lưu trữ: {str(e)}")
+
+    # Probable duplicate people
+    st.subheader("👯 Hồ sơ có thể bị trùng lặp")
+    person_types = {"Học sinh": 'students', "Cựu chiến binh": 'veterans'}
+    selected_type = st.radio("Loại hồ sơ:", list(person_types.keys()), horizontal=True, key="duplicate_person_type")
+    if st.button("🔍 Tìm hồ sơ trùng lặp", key="find_duplicates"):
+        with st.spinner("Đang so sánh hồ sơ..."):
+            try:
+                from duplicate_detection import find_duplicates
+                st.session_state.duplicate_groups = find_duplicates(Database().conn, person_types[selected_type])
+                st.session_state.duplicate_groups_type = selected_type
+            except Exception as e:
+                st.error(f"❌ Không thể tìm hồ sơ trùng lặp: {str(e)}")
+
+    if st.session_state.get('duplicate_groups_type') == selected_type:
+        groups = st.session_state.duplicate_groups
+        if not groups:
+            st.success("✅ Không phát hiện hồ sơ trùng lặp")
+        else:
+            rows = []
+            for number, group in enumerate(groups, start=1):
+                rows.append({
+                    "Nhóm": number,
+                    "Giữ lại (ID)": group['keep_id'],
+                    "Gộp vào (ID)": ', '.join(str(i) for i in group['drop_ids']),
+                    "Độ tương đồng": f"{group['score']:.0%}",
+                    "Hồ sơ": '; '.join(
+                        f"{m['full_name']} ({m['birth_date'] or '?'})" for m in group['members']
+                    ),
+                })
+            st.write(f"Tìm thấy **{len(groups)}** nhóm hồ sơ có thể trùng lặp:")
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+            st.download_button(
+                "📥 Tải danh sách gộp (CSV)",
+                pd.DataFrame(rows).to_csv(index=False).encode('utf-8-sig'),
+                file_name=f"trung_lap_{person_types[selected_type]}.csv",
+                mime="text/csv",
+                key="download_duplicates"
+            )
+
+            st.write("**🔗 Gộp hồ sơ trùng lặp:**")
+            st.caption("Hồ sơ y tế, đánh giá, ghi chú, tài liệu, lịch sử lớp và thông tin gia đình của các bản ghi bị gộp "
+                       "được chuyển sang bản ghi giữ lại. Thao tác được ghi vào nhật ký gộp hồ sơ.")
+            selected_groups = st.multiselect(
+                "Chọn các nhóm cần gộp:",
+                options=list(range(1, len(groups) + 1)),
+                key="duplicate_groups_to_merge"
+            )
+            if selected_groups and st.button(f"🔗 Gộp {len(selected_groups)} nhóm", type="primary", key="merge_duplicates"):
+                try:
+                    merges = [(groups[n - 1]['keep_id'], groups[n - 1]['drop_ids']) for n in selected_groups]
+                    person_type = 'student' if person_types[selected_type] == 'students' else 'veteran'
+                    moved = Database().merge_people(person_type, merges, merged_by=st.session_state.user.id)
+                    st.success(f"✅ Đã gộp {len(merges)} nhóm, chuyển {sum(moved.values())} bản ghi liên quan")
+                    del st.session_state.duplicate_groups_type
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"❌ Không thể gộp hồ sơ: {str(e)}")
+
     # Information section
     st.subheader("ℹ️ Thông tin hệ thống sao lưu")
     st.info("""
     **Hệ thống sao lưu cục bộ:**
     • Tự động sao lưu hàng ngày lúc 2:00 AM
-    • Tạo file backup nén (.zip) với metadata
-    • Tự động dọn dẹp các backup cũ (giữ tối đa 10 bản)
+    • Tạo file backup nén zstd đa luồng (.tar.zst) với metadata
+    • Sao lưu tăng dần: bản đầy đủ hàng tuần, các ngày khác chỉ lưu các trang dữ liệu thay đổi
+    • Bỏ qua các ngày không có thay đổi, tự động sao lưu thêm sau khi nhập dữ liệu lớn
+    • Tự động dọn dẹp các backup cũ (giữ bản mới nhất của 7 ngày, 4 tuần và 6 tháng gần nhất)
+    • Lưu trữ nhật ký WAL mỗi phút, cho phép khôi phục về từng phút
     • Hỗ trợ khôi phục từ file backup
+    • So sánh backup với dữ liệu hiện tại và khôi phục riêng hồ sơ một học sinh
+    • Hồ sơ y tế và lịch sử lớp học cũ được chuyển sang archive.db (lưu kèm trong mỗi bản backup)
     • Backup bao gồm toàn bộ dữ liệu hệ thống
     """)
 
@@ -1087,6 +1410,7 @@ def excel_import_section():
                             duplicate_count = 0
                             updated_count = 0
                             error_details = []
+                            review_details = []
                             
                             # Progress tracking
                             progress_bar = st.progress(0)
@@ -1094,6 +1418,10 @@ def excel_import_section():
                             
                             total_rows = len(df)
                             
+                            # Index existing students once; rows are matched by blocking keys
+                            from duplicate_detection import DuplicateIndex, PersonKey
+                            duplicate_index = DuplicateIndex.from_table(db.conn, 'students')
+                            
                             for idx, row in df.iterrows():
                                 # Update progress
                                 progress = (idx + 1) / total_rows
@@ -1145,19 +1473,14 @@ def excel_import_section():
                                         if not processed_birth_date:
                                             error_details.append(f"Dòng {idx + 1}: Ngày sinh không hợp lệ '{raw_birth}'")
                                     
-                                    # Check for duplicates
+                                    # Duplicates are handled automatically only on the same name and birth date;
+                                    # spelling and accent variants may be other people and are listed for review
                                     existing_student = None
-                                    if raw_name and processed_birth_date:
-                                        # Check for existing student with same name and birth date
-                                        try:
-                                            students = db.get_all_students()
-                                            for student in students:
-                                                if (student.full_name.lower() == raw_name.lower() and 
-                                                    student.birth_date == processed_birth_date):
-                                                    existing_student = student
-                                                    break
-                                        except:
-                                            pass
+                                    possible_duplicate = None
+                                    if raw_name:
+                                        existing_student = duplicate_index.exact_match(raw_name, processed_birth_date)
+                                        if existing_student is None:
+                                            possible_duplicate = duplicate_index.match(raw_name, processed_birth_date, raw_phone)
                                     
                                     # Prepare student data
                                     student_data = {
@@ -1176,7 +1499,7 @@ def excel_import_section():
                                             continue
                                         elif duplicate_handling == "Update existing":
                                             # Update existing student
-                                            if db.update_student(existing_student.id, **student_data):
+                                            if db.update_student(existing_student.id, student_data):
                                                 updated_count += 1
                                             else:
                                                 error_count += 1
@@ -1195,8 +1518,15 @@ def excel_import_section():
                                         continue
                                     
                                     # Create student
-                                    if db.create_student(**student_data):
+                                    new_student_id = db.add_student(student_data)
+                                    if new_student_id:
                                         success_count += 1
+                                        duplicate_index.add(PersonKey(new_student_id, raw_name, processed_birth_date, raw_phone))
+                                        if possible_duplicate:
+                                            review_details.append(
+                                                f"Dòng {idx + 1}: '{raw_name}' (#{new_student_id}) có thể trùng với "
+                                                f"'{possible_duplicate.full_name}' (#{possible_duplicate.id})"
+                                            )
                                     else:
                                         error_count += 1
                                         error_details.append(f"Dòng {idx + 1}: Không thể tạo học sinh '{raw_name}'")
@@ -1209,6 +1539,12 @@ def excel_import_section():
                             progress_bar.progress(1.0)
                             status_text.text("Hoàn thành!")
                             
+                            # Large imports trigger an extra backup and a statistics refresh shortly afterwards
+                            from local_backup import notify_bulk_write
+                            notify_bulk_write(success_count + updated_count)
+                            from database_cleanup import notify_bulk_write as notify_maintenance
+                            notify_maintenance(success_count + updated_count)
+                            
                             # Show results
                             st.success(f"✅ Nhập dữ liệu hoàn thành!")
                             
@@ -1223,6 +1559,17 @@ def excel_import_section():
                             with col4:
                                 st.metric("❌ Lỗi", error_count)
                             
+                            # Probable duplicates go to the reviewable merge list, not automatic skip/update
+                            if review_details:
+                                st.session_state.pop('duplicate_groups_type', None)
+                                with st.expander(f"🔍 Có thể trùng lặp, cần xem xét ({len(review_details)} mục)", expanded=True):
+                                    st.info("Các học sinh này đã được thêm mới. Dùng \"🔍 Tìm hồ sơ trùng lặp\" "
+                                            "trong mục quản lý dữ liệu để xem xét và gộp nếu đúng là cùng một người.")
+                                    for detail in review_details[:50]:
+                                        st.warning(detail)
+                                    if len(review_details) > 50:
+                                        st.warning(f"... và {len(review_details) - 50} mục khác")
+                            
                             # Show error details if any
                             if error_details:
                                 with st.expander(f"⚠️ Chi tiết lỗi ({len(error_details)} mục)", expanded=False):
@@ -49,10 +49,10 @@ def export_student_comprehensive_report(db, student_id):
     if not student_data:
         return None
     
-    # Lấy lịch sử y tế
+    # Lấy lịch sử y tế (gồm cả hồ sơ đã lưu trữ)
     medical_records = db.conn.execute("""
         SELECT mr.date, mr.diagnosis, mr.treatment, u.full_name as doctor_name, mr.notes
-        FROM medical_records mr
+        FROM medical_records_all mr
         LEFT JOIN users u ON mr.doctor_id = u.id
         WHERE mr.patient_id = ? AND mr.patient_type = 'student'
         ORDER BY mr.date DESC
@@ -92,7 +92,7 @@ def export_student_comprehensive_report(db, student_id):
         SELECT c.name, c.academic_year, 
                sch.start_date, sch.end_date, sch.notes,
                u.full_name as teacher_name
-        FROM student_class_history sch
+        FROM student_class_history_all sch
         JOIN classes c ON sch.class_id = c.id
         LEFT JOIN users u ON c.teacher_id = u.id
         WHERE sch.student_id = ?
@@ -1171,7 +1171,8 @@ def render_statistics_section(db):
     total_students = len(db.get_students())
     total_veterans = len(db.get_veterans())
     
-    medical_records = db.conn.execute("SELECT COUNT(*) FROM medical_records").fetchone()[0]
+    # Gồm cả hồ sơ đã chuyển sang archive.db
+    medical_records = db.conn.execute("SELECT COUNT(*) FROM medical_records_all").fetchone()[0]
     psych_evals = db.conn.execute("SELECT COUNT(*) FROM psychological_evaluations").fetchone()[0]
     
     with col1:
@@ -2002,7 +2003,7 @@ def render_export_section(db):
                                 ELSE ''
                             END as follow_up_date,
                             COALESCE(u.full_name, '') as doctor_name
-                        FROM medical_records mr
+                        FROM medical_records_all mr
                         LEFT JOIN students s ON mr.patient_id = s.id AND mr.patient_type = 'student'
                         LEFT JOIN veterans v ON mr.patient_id = v.id AND mr.patient_type = 'veteran'
                         LEFT JOIN users u ON mr.doctor_id = u.id
@@ -3,6 +3,8 @@ from auth import init_auth, check_auth, check_role, check_page_access
 from database import Database
 from utils import show_success, show_error, apply_theme
 from datetime import datetime
+from functools import partial
+from job_scheduler import schedule_notification_retry
 from translations import get_text
 
 def render():
@@ -199,7 +201,8 @@ def render():
                                                 show_success("Đã gửi thông báo thành công!")
                                                 st.rerun()
                                             else:
-                                                show_error("Không thể gửi thông báo")
+                                                schedule_notification_retry('medical', record[0], partial(db.send_medical_record_notification, record[0]))
+                                                show_error("Không thể gửi thông báo, hệ thống sẽ tự gửi lại sau 10 phút")
                                 else:
                                     st.error("❌ Không có email bệnh nhân")
             else:
@@ -289,7 +292,8 @@ def render():
                                 if db.send_medical_record_notification(record_id):
                                     show_success("📤 Đã gửi thông báo thành công!")
                                 else:
-                                    show_error("❌ Không thể gửi thông báo")
+                                    schedule_notification_retry('medical', record_id, partial(db.send_medical_record_notification, record_id))
+                                    show_error("❌ Không thể gửi thông báo, hệ thống sẽ tự gửi lại sau 10 phút")
                             st.rerun()
                         else:
                             show_error("❌ Không thể thêm hồ sơ y tế")
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Postgres Replication
+Keeps an off-box Postgres copy of the local SQLite database for reporting.
+It is a consumer of the change feed (change_log in database.py): a
+background job reads the feed in batches and applies the current state of
+those rows to Postgres with batched upserts, so the Streamlit app itself
+never writes to the remote database.
+
+The replica cursor (the last change_log seq applied) is stored in Postgres
+in the same transaction as the rows, so an interrupted run resumes where
+the last committed batch ended. A fresh replica, or one whose cursor no
+longer matches the log (pruned log, restored backup), is rebuilt with COPY.
+
+Set REPLICA_DATABASE_URL to enable the job. Tables go to the schema in
+REPLICA_SCHEMA (default lang_huu_nghi) and carry no foreign keys, so
+batches can be applied in any order. Images, uploaded files and passwords
+stay local. Records moved to archive.db stay in the replica: those tables
+are read through their <table>_all views.
+"""
+
+import io
+import os
+import sys
+import logging
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+from database import (connect_database, CHANGE_LOG_TABLES, change_log_bounds, read_changes,
+                      register_change_consumer, ack_changes)
+from record_archive import attach_archive, ARCHIVED_TABLES
+from supabase_pool import pooled_connection
+
+logger = logging.getLogger(__name__)
+
+REPLICA_SCHEMA = os.environ.get('REPLICA_SCHEMA', 'lang_huu_nghi')
+STATE_TABLE = 'replication_state'
+
+# Change log entries applied per Postgres transaction
+REPLICATION_BATCH_SIZE = 1000
+# Rows looked up per SQLite query (stays under the bound parameter limit)
+ROW_FETCH_CHUNK = 500
+# Upserts of at least this many rows go through COPY into a staging table;
+# smaller ones are sent as multi-row INSERT ... ON CONFLICT pages
+COPY_MIN_ROWS = 500
+UPSERT_PAGE_SIZE = 200
+# Rows per COPY buffer during a full sync
+COPY_CHUNK_ROWS = 5000
+
+REPLICATION_INTERVAL_MINUTES = 1
+
+# Name of the replica in the change feed's consumer table
+CONSUMER_NAME = 'postgres_replica'
+
+# Columns never sent to the replica; BLOB columns are skipped as well
+REPLICA_EXCLUDED_COLUMNS = {
+    'users': ('password_hash', 'original_password'),
+}
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def pg_type(sqlite_type):
+    """Postgres column type for a declared SQLite column type, or None for BLOBs"""
+    declared = (sqlite_type or '').upper()
+    if 'BLOB' in declared:
+        return None
+    if 'INT' in declared:
+        return 'BIGINT'
+    if 'BOOL' in declared:
+        return 'BOOLEAN'
+    if any(name in declared for name in ('REAL', 'FLOA', 'DOUB', 'NUMERIC', 'DECIMAL')):
+        return 'DOUBLE PRECISION'
+    # Dates are stored as text in SQLite and kept as text, so odd values
+    # entered over the years still replicate
+    return 'TEXT'
+
+def _to_int(value):
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return None
+
+def _to_float(value):
+    if value is None or isinstance(value, float):
+        return value
+    try:
+        return float(str(value).strip())
+    except ValueError:
+        return None
+
+def _to_bool(value):
+    if value is None:
+        return None
+    return str(value).strip().lower() in ('1', 'true', 't', 'yes')
+
+def _to_text(value):
+    return value if value is None or isinstance(value, str) else str(value)
+
+CONVERTERS = {'BIGINT': _to_int, 'DOUBLE PRECISION': _to_float, 'BOOLEAN': _to_bool, 'TEXT': _to_text}
+
+def csv_field(value):
+    """One COPY CSV field: NULL unquoted, text always quoted so '' stays an empty string"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+def replicated_columns(conn, table):
+    """[(name, Postgres type)] of a local table's replicated columns, id first"""
+    excluded = REPLICA_EXCLUDED_COLUMNS.get(table, ())
+    columns = []
+    for _, name, col_type, _, _, _ in conn.execute(f"PRAGMA table_info({table})").fetchall():
+        target_type = pg_type(col_type)
+        if target_type and name not in excluded:
+            columns.append((name, target_type))
+    columns.sort(key=lambda column: column[0] != 'id')
+    return columns
+
+class PostgresReplicator:
+    def __init__(self, db_path='lang_huu_nghi.db', database_url=None, schema=REPLICA_SCHEMA, source=None):
+        self.db_path = db_path
+        self.database_url = database_url or os.environ.get('REPLICA_DATABASE_URL')
+        self.schema = schema
+        self.source = source or os.path.splitext(os.path.basename(db_path))[0]
+        self.last_run = None
+        self.last_result = None
+
+    def _connect_local(self):
+        conn = connect_database(self.db_path, timeout=30)
+        attach_archive(conn, self.db_path)
+        return conn
+
+    @staticmethod
+    def _source(table):
+        """Local table or view a replica table is read from
+
+        The archive job moves old rows out of the live tables with a plain
+        DELETE, which the change log records; reading the <table>_all views
+        keeps those rows in the replica.
+        """
+        return f"{table}_all" if table in ARCHIVED_TABLES else table
+
+    def _table(self, table):
+        return f"{quote(self.schema)}.{quote(table)}"
+
+    def ensure_replica_schema(self, pg_cursor, columns):
+        """Create the replica tables, adding columns added locally since"""
+        pg_cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {quote(self.schema)}")
+        pg_cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self._table(STATE_TABLE)} (
+                source TEXT PRIMARY KEY,
+                last_seq BIGINT NOT NULL,
+                full_sync_at TIMESTAMPTZ,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        for table, table_columns in columns.items():
+            pg_cursor.execute(f"CREATE TABLE IF NOT EXISTS {self._table(table)} (id BIGINT PRIMARY KEY)")
+            for name, target_type in table_columns[1:]:
+                pg_cursor.execute(f"ALTER TABLE {self._table(table)} ADD COLUMN IF NOT EXISTS {quote(name)} {target_type}")
+
+    def get_cursor(self, pg_cursor):
+        pg_cursor.execute(f"SELECT last_seq FROM {self._table(STATE_TABLE)} WHERE source = %s", (self.source,))
+        row = pg_cursor.fetchone()
+        return row[0] if row else None
+
+    def _set_cursor(self, pg_cursor, seq, full_sync=False):
+        pg_cursor.execute(f"""
+            INSERT INTO {self._table(STATE_TABLE)} (source, last_seq, full_sync_at, updated_at)
+            VALUES (%s, %s, CASE WHEN %s THEN now() END, now())
+            ON CONFLICT (source) DO UPDATE SET
+                last_seq = EXCLUDED.last_seq,
+                full_sync_at = COALESCE(EXCLUDED.full_sync_at, {self._table(STATE_TABLE)}.full_sync_at),
+                updated_at = EXCLUDED.updated_at
+        """, (self.source, seq, full_sync))
+
+    def _copy_rows(self, pg_cursor, target, table_columns, rows):
+        """COPY rows into target in CSV format"""
+        converters = [CONVERTERS[target_type] for _, target_type in table_columns]
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(csv_field(convert(value)) for convert, value in zip(converters, row)))
+            buffer.write('\n')
+        buffer.seek(0)
+        column_list = ', '.join(quote(name) for name, _ in table_columns)
+        pg_cursor.copy_expert(f"COPY {target} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    def _upsert_rows(self, pg_cursor, table, table_columns, rows):
+        """Insert or update rows by id: COPY through a staging table for large batches"""
+        column_list = ', '.join(quote(name) for name, _ in table_columns)
+        updates = ', '.join(f"{quote(name)} = EXCLUDED.{quote(name)}" for name, _ in table_columns[1:])
+        conflict = f"ON CONFLICT (id) DO UPDATE SET {updates}" if updates else "ON CONFLICT (id) DO NOTHING"
+
+        if len(rows) >= COPY_MIN_ROWS:
+            staging = quote(f"stage_{table}")
+            pg_cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+            pg_cursor.execute(f"CREATE TEMP TABLE {staging} (LIKE {self._table(table)}) ON COMMIT DROP")
+            self._copy_rows(pg_cursor, staging, table_columns, rows)
+            pg_cursor.execute(f"""
+                INSERT INTO {self._table(table)} ({column_list})
+                SELECT {column_list} FROM {staging}
+                {conflict}
+            """)
+        else:
+            converters = [CONVERTERS[target_type] for _, target_type in table_columns]
+            values = [tuple(convert(value) for convert, value in zip(converters, row)) for row in rows]
+            execute_values(pg_cursor, f"INSERT INTO {self._table(table)} ({column_list}) VALUES %s {conflict}",
+                           values, page_size=UPSERT_PAGE_SIZE)
+
+    def full_sync(self, conn, pg_conn, columns):
+        """Replace every replica table with the local rows; returns (cursor, rows copied)
+
+        The log position is read before copying, so changes made while
+        copying are applied again afterwards (applying a change is
+        idempotent).
+        """
+        _, last_seq = change_log_bounds(conn)
+        copied = 0
+        with pg_conn.cursor() as pg_cursor:
+            pg_cursor.execute(f"TRUNCATE {', '.join(self._table(table) for table in columns)}")
+            for table, table_columns in columns.items():
+                column_list = ', '.join(name for name, _ in table_columns)
+                local = conn.execute(f"SELECT {column_list} FROM {self._source(table)} ORDER BY id")
+                while True:
+                    rows = local.fetchmany(COPY_CHUNK_ROWS)
+                    if not rows:
+                        break
+                    self._copy_rows(pg_cursor, self._table(table), table_columns, rows)
+                    copied += len(rows)
+            self._set_cursor(pg_cursor, last_seq, full_sync=True)
+        pg_conn.commit()
+        logger.info(f"Replica rebuilt: {copied} rows copied, cursor at {last_seq}")
+        return last_seq, copied
+
+    def apply_batch(self, conn, pg_conn, columns, cursor, batch_size=REPLICATION_BATCH_SIZE):
+        """Apply the next batch of logged changes after cursor
+
+        Returns (new cursor, rows upserted, rows deleted), or None when the
+        log holds nothing newer or no longer reaches back to cursor. Each changed row is applied once per batch
+        with its current local state: upserted if it exists, else deleted.
+        """
+        feed = read_changes(conn, cursor, batch_size, tables=list(columns))
+        # After a reset the next run rebuilds the replica instead
+        if feed['reset'] or feed['cursor'] == cursor:
+            return None
+
+        changed = {}
+        for _, table, row_id, _, _ in feed['changes']:
+            changed.setdefault(table, set()).add(row_id)
+
+        upserted = deleted = 0
+        with pg_conn.cursor() as pg_cursor:
+            for table, row_ids in changed.items():
+                table_columns = columns[table]
+                column_list = ', '.join(name for name, _ in table_columns)
+                row_ids = sorted(row_ids)
+                rows = []
+                for start in range(0, len(row_ids), ROW_FETCH_CHUNK):
+                    chunk = row_ids[start:start + ROW_FETCH_CHUNK]
+                    rows.extend(conn.execute(
+                        f"SELECT {column_list} FROM {self._source(table)} WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                    ).fetchall())
+                present = {row[0] for row in rows}
+                gone = [row_id for row_id in row_ids if row_id not in present]
+
+                if rows:
+                    self._upsert_rows(pg_cursor, table, table_columns, rows)
+                    upserted += len(rows)
+                if gone:
+                    pg_cursor.execute(f"DELETE FROM {self._table(table)} WHERE id = ANY(%s)", (gone,))
+                    deleted += len(gone)
+            new_cursor = feed['cursor']
+            self._set_cursor(pg_cursor, new_cursor)
+        pg_conn.commit()
+        return new_cursor, upserted, deleted
+
+    def replicate(self, full=False, max_batches=None):
+        """Bring the replica up to date; returns a summary of the run"""
+        if not self.database_url:
+            raise ValueError("REPLICA_DATABASE_URL is not set")
+
+        result = {'full_sync': False, 'copied': 0, 'batches': 0, 'upserted': 0, 'deleted': 0, 'cursor': None}
+        conn = self._connect_local()
+        try:
+            # Keeps the log from being truncated past what the replica has applied
+            register_change_consumer(conn, CONSUMER_NAME)
+            columns = {table: replicated_columns(conn, table) for table in CHANGE_LOG_TABLES}
+            with pooled_connection(self.database_url) as pg_conn:
+                with pg_conn.cursor() as pg_cursor:
+                    self.ensure_replica_schema(pg_cursor, columns)
+                    cursor = self.get_cursor(pg_cursor)
+                pg_conn.commit()
+
+                first_seq, last_seq = change_log_bounds(conn)
+                # A cursor ahead of the log (restored backup) or behind its
+                # first entry (pruned log) cannot be continued from
+                if full or cursor is None or cursor > last_seq or first_seq > cursor + 1:
+                    cursor, result['copied'] = self.full_sync(conn, pg_conn, columns)
+                    result['full_sync'] = True
+
+                while max_batches is None or result['batches'] < max_batches:
+                    applied = self.apply_batch(conn, pg_conn, columns, cursor)
+                    if applied is None:
+                        break
+                    cursor, upserted, deleted = applied
+                    result['batches'] += 1
+                    result['upserted'] += upserted
+                    result['deleted'] += deleted
+            result['cursor'] = cursor
+
+            # Entries up to the committed cursor are no longer needed by the replica
+            ack_changes(conn, CONSUMER_NAME, cursor)
+        finally:
+            conn.close()
+
+        self.last_run = datetime.now()
+        self.last_result = result
+        if result['full_sync'] or result['batches']:
+            logger.info(f"Replication run: {result}")
+        return result
+
+    def register_jobs(self):
+        """Register the replication job with the process-wide scheduler"""
+        from job_scheduler import job_scheduler
+        job_scheduler.register('postgres_replication', self.replicate, 'interval',
+                               name="Sao chép dữ liệu sang Postgres", minutes=REPLICATION_INTERVAL_MINUTES,
+                               next_run_time=datetime.now())
+
+if __name__ == "__main__":
+    # python postgres_replication.py [--full] [postgresql://user@localhost/replica]
+    logging.basicConfig(level=logging.INFO)
+    args = [arg for arg in sys.argv[1:] if arg != '--full']
+    replicator = PostgresReplicator(database_url=args[0] if args else None)
+    print(replicator.replicate(full='--full' in sys.argv))
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Record Archive
+Moves old medical and class-history records into archive.db, a separate
+database with the same columns, so the live tables only hold the recent
+working set. Each connection gets <table>_all views that read live and
+archived rows together for historical queries.
+"""
+
+import os
+import json
+import time
+import logging
+from datetime import datetime, timedelta
+from database import connect_database, log_changes, ARCHIVE_PERSON_REFERENCES, PERSON_TABLES
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DB_NAME = 'archive.db'
+ARCHIVE_SCHEMA = 'archive'
+
+# Records older than this are moved to the archive
+ARCHIVE_AFTER_DAYS = 5 * 365
+
+# Archived tables and the date column that decides when a row is old.
+# Rows with no date (a class the student is still in) stay live.
+ARCHIVED_TABLES = {
+    'medical_records': 'date',
+    'student_class_history': 'end_date',
+}
+
+# Indexes for the historical lookups the views serve
+ARCHIVE_INDEXES = [
+    ('idx_medical_records_patient', 'medical_records', 'patient_type, patient_id'),
+    ('idx_student_class_history_student_id', 'student_class_history', 'student_id'),
+]
+
+# Rows moved per transaction
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_BATCH_PAUSE_SECONDS = 0.01
+
+def archive_path_for(db_path):
+    """archive.db lives next to the live database"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), ARCHIVE_DB_NAME)
+
+def table_columns(conn, schema, table):
+    return [(row[1], row[2]) for row in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()]
+
+def ensure_archive_tables(conn):
+    """Create the archive tables with the live tables' columns
+
+    Archive tables carry no foreign keys: their parents live in the main
+    database, which a foreign key cannot reference.
+    """
+    for table in ARCHIVED_TABLES:
+        live_columns = table_columns(conn, 'main', table)
+        archive_columns = {name for name, _ in table_columns(conn, ARCHIVE_SCHEMA, table)}
+        if not archive_columns:
+            definitions = ', '.join(
+                'id INTEGER PRIMARY KEY' if name == 'id' else f"{name} {col_type}"
+                for name, col_type in live_columns
+            )
+            conn.execute(f"CREATE TABLE {ARCHIVE_SCHEMA}.{table} ({definitions})")
+        else:
+            # Columns added to the live table after the archive was created
+            for name, col_type in live_columns:
+                if name not in archive_columns:
+                    conn.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{table} ADD COLUMN {name} {col_type}")
+
+    for name, table, columns in ARCHIVE_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.{name} ON {table} ({columns})")
+
+def attach_archive(conn, db_path, create=False):
+    """Attach archive.db and (re)create the <table>_all views on a connection
+
+    Without an archive file (and create=False) the views read the live
+    tables only, so queries can use them either way. Views that span two
+    database files have to be TEMP, so every connection creates its own.
+    An id is listed once: when a row is in both places (an interrupted
+    archive run, or a live id reused after its row was archived) the live
+    row is shown. A reused id gets a new one in the archive as soon as
+    the live row is archived too.
+    """
+    main_tables = {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")}
+    if not all(table in main_tables for table in ARCHIVED_TABLES):
+        return False
+
+    archive_path = archive_path_for(db_path)
+    attached = ARCHIVE_SCHEMA in [row[1] for row in conn.execute("PRAGMA database_list")]
+    if not attached and (create or os.path.exists(archive_path)):
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_path,))
+        # Only takes effect when the file is new, before its first table
+        conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.auto_vacuum = INCREMENTAL")
+        conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.journal_mode = WAL")
+        ensure_archive_tables(conn)
+        attached = True
+
+    for table in ARCHIVED_TABLES:
+        column_list = ', '.join(name for name, _ in table_columns(conn, 'main', table))
+        conn.execute(f"DROP VIEW IF EXISTS temp.{table}_all")
+        if attached:
+            conn.execute(f"""
+                CREATE TEMP VIEW {table}_all AS
+                SELECT {column_list} FROM main.{table}
+                UNION ALL
+                SELECT {column_list} FROM {ARCHIVE_SCHEMA}.{table} a
+                WHERE NOT EXISTS (SELECT 1 FROM main.{table} m WHERE m.id = a.id)
+            """)
+        else:
+            conn.execute(f"CREATE TEMP VIEW {table}_all AS SELECT {column_list} FROM main.{table}")
+    return attached
+
+def repair_merged_references(conn):
+    """Repoint archived rows that still name a student or veteran merged away
+
+    Database.merge_people updates both files in one transaction, but in WAL
+    mode SQLite commits each file on its own, so a crash during the commit
+    can keep the live side of a merge and lose the archive side. merge_log
+    records every merge; replaying it here is a no-op for merges that
+    completed. Returns the number of rows repointed.
+    """
+    if ARCHIVE_SCHEMA not in [row[1] for row in conn.execute("PRAGMA database_list")]:
+        return 0
+    repaired = 0
+    merges = conn.execute("SELECT person_type, keep_id, drop_ids FROM main.merge_log ORDER BY id").fetchall()
+    for person_type, keep_id, drop_ids in merges:
+        person_table = PERSON_TABLES[person_type]
+        for drop_id in json.loads(drop_ids):
+            # The id has been given to a new record since; its rows are its own
+            if conn.execute(f"SELECT 1 FROM main.{person_table} WHERE id = ?", (drop_id,)).fetchone():
+                continue
+            for table, column, row_filter in ARCHIVE_PERSON_REFERENCES[person_type]:
+                condition = f" AND {row_filter}" if row_filter else ""
+                row_ids = [row[0] for row in conn.execute(
+                    f"SELECT id FROM {ARCHIVE_SCHEMA}.{table} WHERE {column} = ?{condition}", (drop_id,)
+                ).fetchall()]
+                conn.execute(
+                    f"UPDATE {ARCHIVE_SCHEMA}.{table} SET {column} = ? WHERE {column} = ?{condition}",
+                    (keep_id, drop_id)
+                )
+                log_changes(conn, table, row_ids, 'U')
+                repaired += len(row_ids)
+    conn.commit()
+    if repaired:
+        logger.warning(f"Repointed {repaired} archived rows of interrupted merges")
+    return repaired
+
+class RecordArchive:
+    def __init__(self, db_path='lang_huu_nghi.db', max_age_days=ARCHIVE_AFTER_DAYS):
+        self.db_path = db_path
+        self.archive_path = archive_path_for(db_path)
+        self.max_age_days = max_age_days
+        self.conn = connect_database(db_path, timeout=30)
+        attach_archive(self.conn, db_path, create=True)
+
+    def cutoff(self):
+        return (datetime.now() - timedelta(days=self.max_age_days)).strftime('%Y-%m-%d')
+
+    def count_archivable(self):
+        """Number of live rows per table that are past the archive age"""
+        cutoff = self.cutoff()
+        return {
+            table: self.conn.execute(
+                f"SELECT COUNT(*) FROM main.{table} WHERE {column} IS NOT NULL AND {column} < ?", (cutoff,)
+            ).fetchone()[0]
+            for table, column in ARCHIVED_TABLES.items()
+        }
+
+    def archive_table(self, table, column, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+        """Move the old rows of one table to the archive in batches
+
+        Each batch is first copied and committed to the archive, then
+        deleted from the live table. An interruption in between leaves a
+        row in both places, never in neither; the next run finishes it.
+        """
+        cutoff = self.cutoff()
+        columns = [name for name, _ in table_columns(self.conn, 'main', table)]
+        column_list = ', '.join(columns)
+        data_columns = [name for name in columns if name != 'id']
+        data_list = ', '.join(data_columns)
+
+        def same_content(alias):
+            return ' AND '.join(f"{alias}.{name} IS m.{name}" for name in data_columns)
+
+        moved = 0
+        while True:
+            ids = [row[0] for row in self.conn.execute(
+                f"SELECT id FROM main.{table} WHERE {column} IS NOT NULL AND {column} < ? ORDER BY id LIMIT ?",
+                (cutoff, batch_size)
+            ).fetchall()]
+            if not ids:
+                return moved
+
+            placeholders = ', '.join('?' * len(ids))
+            self.conn.execute(f"""
+                INSERT OR IGNORE INTO {ARCHIVE_SCHEMA}.{table} ({column_list})
+                SELECT {column_list} FROM main.{table} WHERE id IN ({placeholders})
+            """, ids)
+            # A live id can be reused after the row holding it was archived;
+            # such rows get a new id in the archive unless already copied
+            last_archived_id = self.conn.execute(
+                f"SELECT COALESCE(MAX(id), 0) FROM {ARCHIVE_SCHEMA}.{table}").fetchone()[0]
+            self.conn.execute(f"""
+                INSERT INTO {ARCHIVE_SCHEMA}.{table} ({data_list})
+                SELECT {data_list} FROM main.{table} m
+                WHERE m.id IN ({placeholders})
+                  AND EXISTS (SELECT 1 FROM {ARCHIVE_SCHEMA}.{table} a WHERE a.id = m.id AND NOT ({same_content('a')}))
+                  AND NOT EXISTS (SELECT 1 FROM {ARCHIVE_SCHEMA}.{table} a WHERE {same_content('a')})
+            """, ids)
+            log_changes(self.conn, table, [row[0] for row in self.conn.execute(
+                f"SELECT id FROM {ARCHIVE_SCHEMA}.{table} WHERE id > ?", (last_archived_id,)
+            ).fetchall()], 'I')
+            self.conn.commit()
+
+            self.conn.execute(f"DELETE FROM main.{table} WHERE id IN ({placeholders})", ids)
+            self.conn.commit()
+
+            moved += len(ids)
+            if progress:
+                progress(table, moved)
+            time.sleep(ARCHIVE_BATCH_PAUSE_SECONDS)
+
+    def purge_deleted_people(self):
+        """Drop archived rows of students and veterans deleted since they were archived
+
+        The live tables get this through ON DELETE cascades, which cannot
+        reach into another database file. Merges whose archive side was
+        lost are replayed first, so merged rows are not taken for orphans.
+        """
+        repair_merged_references(self.conn)
+        orphans = [
+            ('medical_records', "patient_type = 'student' AND NOT EXISTS (SELECT 1 FROM main.students p WHERE p.id = patient_id)"),
+            ('medical_records', "patient_type = 'veteran' AND NOT EXISTS (SELECT 1 FROM main.veterans p WHERE p.id = patient_id)"),
+            ('student_class_history', "NOT EXISTS (SELECT 1 FROM main.students s WHERE s.id = student_id)"),
+        ]
+        removed = 0
+        for table, condition in orphans:
+            row_ids = [row[0] for row in self.conn.execute(
+                f"SELECT id FROM {ARCHIVE_SCHEMA}.{table} WHERE {condition}"
+            ).fetchall()]
+            if row_ids:
+                self.conn.execute(f"DELETE FROM {ARCHIVE_SCHEMA}.{table} WHERE {condition}")
+                log_changes(self.conn, table, row_ids, 'D')
+                removed += len(row_ids)
+        self.conn.commit()
+        return removed
+
+    def backup_archive(self):
+        """Back up the live database right after archiving
+
+        Every backup carries a copy of archive.db, so the moved rows are
+        versioned together with the live tables they left and fall under
+        the same catalog, retention and point-in-time restore.
+        """
+        from local_backup import backup_service
+        return backup_service.create_database_backup(incremental=True)
+
+    def archive_old_records(self, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+        """Move every record past the archive age; returns rows moved per table"""
+        moved = {}
+        for table, column in ARCHIVED_TABLES.items():
+            moved[table] = self.archive_table(table, column, batch_size, progress)
+        self.purge_deleted_people()
+
+        if any(moved.values()):
+            self.backup_archive()
+            logger.info(f"Archived old records: {moved}")
+        return moved
+
+    def get_archive_stats(self):
+        """Live and archived row counts per table"""
+        return {
+            table: {
+                'live': self.conn.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0],
+                'archived': self.conn.execute(f"SELECT COUNT(*) FROM {ARCHIVE_SCHEMA}.{table}").fetchone()[0],
+            }
+            for table in ARCHIVED_TABLES
+        }
+
+    def close(self):
+        self.conn.close()
@@ -7,17 +7,27 @@ import os
 import time
 import random
 import string
-import psycopg2
+import asyncio
+import aiohttp
+from supabase_pool import pooled_connection
 from datetime import datetime, timedelta
-import requests
-from threading import Thread
-import schedule
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Endpoint pings run concurrently, at most this many at a time
+PING_CONCURRENCY = 5
+PING_TIMEOUT_SECONDS = 30
+# Extra attempts after a connection error or 5xx response, with
+# exponential backoff plus random jitter between them
+PING_RETRIES = 2
+PING_RETRY_BASE_DELAY = 1.0
+# PING_TIMEOUT_SECONDS bounds a single attempt; this bounds all attempts
+# at one endpoint together, well below the keep-alive job interval
+PING_DEADLINE_SECONDS = 60
+
 class SupabaseKeepAlive:
     def __init__(self, database_url=None, table_name="keep_alive", column_name="name", 
                  max_entries=10, other_endpoints=None):
@@ -28,7 +38,7 @@ class SupabaseKeepAlive:
             database_url (str): Database connection URL
             table_name (str): Table name to use for keep-alive operations
             column_name (str): Column name to store random strings
-            max_entries (int): Maximum entries before deletion starts
+            max_entries (int): Number of slots in the keep-alive ring buffer
             other_endpoints (list): List of other endpoints to ping
         """
         self.database_url = database_url or os.environ.get('DATABASE_URL')
@@ -47,7 +57,7 @@ class SupabaseKeepAlive:
     def _validate_connection(self):
         """Validate database connection before setup"""
         try:
-            with psycopg2.connect(self.database_url) as conn:
+            with pooled_connection(self.database_url) as conn:
                 with conn.cursor() as cursor:
                     cursor.execute("SELECT 1")
                     result = cursor.fetchone()
@@ -59,23 +69,70 @@ class SupabaseKeepAlive:
             raise ConnectionError(f"Cannot connect to database: {e}")
     
     def setup_table(self):
-        """Create the keep-alive table if it doesn't exist"""
+        """Create the keep-alive table if it doesn't exist
+        
+        The table is a ring buffer of max_entries slots: each run writes
+        slot run_number % max_entries, so it never grows and a run is a
+        single upsert. Tables from before the ring buffer (one row per run,
+        unique names) are converted in place.
+        """
         try:
-            with psycopg2.connect(self.database_url) as conn:
+            with pooled_connection(self.database_url) as conn:
                 with conn.cursor() as cursor:
                     cursor.execute(f"""
                         CREATE TABLE IF NOT EXISTS {self.table_name} (
-                            id SERIAL PRIMARY KEY,
-                            {self.column_name} TEXT UNIQUE NOT NULL,
+                            slot INTEGER PRIMARY KEY,
+                            run_number BIGINT NOT NULL,
+                            {self.column_name} TEXT NOT NULL,
                             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                         )
                     """)
+                    cursor.execute("""
+                        SELECT EXISTS (
+                            SELECT FROM information_schema.columns
+                            WHERE table_name = %s AND column_name = 'slot'
+                        )
+                    """, (self.table_name,))
+                    if not cursor.fetchone()[0]:
+                        self._convert_to_ring_buffer(cursor)
+                    cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {self.table_name}_run_seq")
                     conn.commit()
                     logger.info(f"Keep-alive table '{self.table_name}' is ready")
         except Exception as e:
             logger.error(f"Error setting up table: {e}")
             raise
     
+    def _convert_to_ring_buffer(self, cursor):
+        """Give the newest max_entries rows of an old keep-alive table a slot and drop the rest"""
+        cursor.execute(f"""
+            ALTER TABLE {self.table_name}
+                ADD COLUMN slot INTEGER,
+                ADD COLUMN run_number BIGINT
+        """)
+        cursor.execute(f"""
+            UPDATE {self.table_name} t SET run_number = ranked.run_number, slot = ranked.run_number %% %s
+            FROM (
+                SELECT ctid AS row_id, ROW_NUMBER() OVER (ORDER BY created_at, {self.column_name}) AS run_number
+                FROM {self.table_name}
+            ) ranked
+            WHERE t.ctid = ranked.row_id
+        """, (self.max_entries,))
+        cursor.execute(f"""
+            DELETE FROM {self.table_name}
+            WHERE run_number <= (SELECT MAX(run_number) FROM {self.table_name}) - %s
+        """, (self.max_entries,))
+        cursor.execute(f"ALTER TABLE {self.table_name} DROP CONSTRAINT IF EXISTS {self.table_name}_{self.column_name}_key")
+        cursor.execute(f"ALTER TABLE {self.table_name} DROP CONSTRAINT IF EXISTS {self.table_name}_pkey")
+        cursor.execute(f"ALTER TABLE {self.table_name} DROP COLUMN IF EXISTS id")
+        cursor.execute(f"ALTER TABLE {self.table_name} ALTER COLUMN run_number SET NOT NULL")
+        cursor.execute(f"ALTER TABLE {self.table_name} ADD PRIMARY KEY (slot)")
+        cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {self.table_name}_run_seq")
+        cursor.execute(f"""
+            SELECT setval('{self.table_name}_run_seq', GREATEST(COALESCE(MAX(run_number), 0), 1), MAX(run_number) IS NOT NULL)
+            FROM {self.table_name}
+        """)
+        logger.info(f"Converted '{self.table_name}' to a {self.max_entries}-slot ring buffer")
+    
     def generate_random_string(self, length=12):
         """Generate a random string of specified length"""
         letters = string.ascii_lowercase
@@ -86,7 +143,7 @@ class SupabaseKeepAlive:
         random_string = self.generate_random_string()
         
         try:
-            with psycopg2.connect(self.database_url) as conn:
+            with pooled_connection(self.database_url) as conn:
                 with conn.cursor() as cursor:
                     cursor.execute(f"""
                         SELECT * FROM {self.table_name} 
@@ -105,7 +162,7 @@ class SupabaseKeepAlive:
     def get_entry_count(self):
         """Get the current number of entries in the table"""
         try:
-            with psycopg2.connect(self.database_url) as conn:
+            with pooled_connection(self.database_url) as conn:
                 with conn.cursor() as cursor:
                     cursor.execute(f"SELECT COUNT(*) FROM {self.table_name}")
                     count = cursor.fetchone()[0]
@@ -114,84 +171,90 @@ class SupabaseKeepAlive:
             logger.error(f"Error getting entry count: {e}")
             return 0
     
-    def insert_random_entry(self):
-        """Insert a random entry into the table"""
+    def manage_entries(self):
+        """Write this run's random string into the next ring buffer slot
+        
+        One statement: the run number comes from the table's sequence and
+        the slot it maps to is overwritten once the buffer has wrapped.
+        """
         random_string = self.generate_random_string()
         
         try:
-            with psycopg2.connect(self.database_url) as conn:
+            with pooled_connection(self.database_url) as conn:
                 with conn.cursor() as cursor:
                     cursor.execute(f"""
-                        INSERT INTO {self.table_name} ({self.column_name})
-                        VALUES (%s)
-                        ON CONFLICT ({self.column_name}) DO NOTHING
-                    """, (random_string,))
-                    conn.commit()
+                        INSERT INTO {self.table_name} (slot, run_number, {self.column_name}, created_at)
+                        SELECT run.number %% %s, run.number, %s, CURRENT_TIMESTAMP
+                        FROM (SELECT nextval('{self.table_name}_run_seq') AS number) run
+                        ON CONFLICT (slot) DO UPDATE SET
+                            run_number = EXCLUDED.run_number,
+                            {self.column_name} = EXCLUDED.{self.column_name},
+                            created_at = EXCLUDED.created_at
+                        RETURNING slot, run_number
+                    """, (self.max_entries, random_string))
+                    slot, run_number = cursor.fetchone()
                     
-                    message = f"Inserted '{random_string}' into '{self.table_name}'"
+                    message = f"Wrote '{random_string}' to slot {slot} of '{self.table_name}' (run {run_number})"
                     logger.info(message)
                     return True, message
         except Exception as e:
-            error_msg = f"Error inserting random entry: {e}"
+            error_msg = f"Error writing keep-alive entry: {e}"
             logger.error(error_msg)
             return False, error_msg
     
-    def delete_oldest_entry(self):
-        """Delete the oldest entry from the table"""
+    async def _ping_endpoint(self, session, semaphore, endpoint):
+        """Ping one endpoint, retrying connection errors and server errors"""
+        for attempt in range(PING_RETRIES + 1):
+            try:
+                async with semaphore:
+                    async with session.get(endpoint) as response:
+                        if response.status >= 500 and attempt < PING_RETRIES:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=response.status
+                            )
+                        status = "Passed" if response.status == 200 else "Failed"
+                        return f"{endpoint} - {status}"
+            except Exception as e:
+                if attempt == PING_RETRIES:
+                    return f"{endpoint} - Failed: {str(e)}"
+            # Back off without holding a concurrency slot
+            delay = PING_RETRY_BASE_DELAY * (2 ** attempt)
+            await asyncio.sleep(delay + random.uniform(0, delay))
+    
+    async def _ping_with_deadline(self, session, semaphore, endpoint):
+        """Ping one endpoint, giving up on it once PING_DEADLINE_SECONDS have passed"""
         try:
-            with psycopg2.connect(self.database_url) as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute(f"""
-                        DELETE FROM {self.table_name}
-                        WHERE id = (
-                            SELECT id FROM {self.table_name}
-                            ORDER BY created_at ASC
-                            LIMIT 1
-                        )
-                        RETURNING {self.column_name}
-                    """)
-                    deleted_entry = cursor.fetchone()
-                    conn.commit()
-                    
-                    if deleted_entry:
-                        message = f"Deleted '{deleted_entry[0]}' from '{self.table_name}'"
-                        logger.info(message)
-                        return True, message
-                    else:
-                        message = f"No entries to delete from '{self.table_name}'"
-                        logger.info(message)
-                        return True, message
-        except Exception as e:
-            error_msg = f"Error deleting oldest entry: {e}"
-            logger.error(error_msg)
-            return False, error_msg
+            return await asyncio.wait_for(self._ping_endpoint(session, semaphore, endpoint),
+                                          PING_DEADLINE_SECONDS)
+        except asyncio.TimeoutError:
+            return f"{endpoint} - Failed: no answer within {PING_DEADLINE_SECONDS}s"
     
-    def manage_entries(self):
-        """Manage entries - insert or delete based on current count"""
-        current_count = self.get_entry_count()
-        
-        if current_count >= self.max_entries:
-            return self.delete_oldest_entry()
-        else:
-            return self.insert_random_entry()
+    async def _ping_all(self, endpoints):
+        timeout = aiohttp.ClientTimeout(total=PING_TIMEOUT_SECONDS)
+        semaphore = asyncio.Semaphore(PING_CONCURRENCY)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            return await asyncio.gather(
+                *(self._ping_with_deadline(session, semaphore, endpoint) for endpoint in endpoints)
+            )
     
     def ping_other_endpoints(self):
-        """Ping other endpoints to keep them alive"""
-        results = []
+        """Ping other endpoints to keep them alive
         
-        for endpoint in self.other_endpoints:
-            try:
-                response = requests.get(endpoint, timeout=30)
-                status = "Passed" if response.status_code == 200 else "Failed"
-                result = f"{endpoint} - {status}"
-                results.append(result)
+        The endpoints are pinged concurrently over one HTTP session, so a
+        run takes about as long as the slowest endpoint, and no longer than
+        PING_DEADLINE_SECONDS. Results keep the order of other_endpoints.
+        """
+        if not self.other_endpoints:
+            return []
+        
+        results = asyncio.run(self._ping_all(self.other_endpoints))
+        for result in results:
+            if result.endswith(" - Passed"):
                 logger.info(result)
-            except Exception as e:
-                result = f"{endpoint} - Failed: {str(e)}"
-                results.append(result)
+            else:
                 logger.error(result)
         
-        return results
+        return list(results)
     
     def run_keep_alive(self):
         """Run the complete keep-alive process"""
@@ -227,23 +290,24 @@ class SupabaseKeepAlive:
     
     def start_scheduled_task(self, cron_schedule="0 5 */3 * *"):
         """
-        Start the scheduled keep-alive task
+        Register the scheduled keep-alive jobs with the process-wide scheduler
         
         Args:
-            cron_schedule (str): Cron-like schedule (currently uses simple schedule)
+            cron_schedule (str): Cron expression of the main run (every 3 days at 5:00 AM)
         """
+        from apscheduler.triggers.cron import CronTrigger
+        from job_scheduler import job_scheduler
+        
         # Run every 3 days to ensure database stays active
-        schedule.every(3).days.at("05:00").do(self.run_keep_alive)
+        job_scheduler.register('supabase_keep_alive_cron', self.run_keep_alive,
+                               CronTrigger.from_crontab(cron_schedule), name="Giữ kết nối Supabase (định kỳ)")
         
         # Also run daily at different times for extra safety
-        schedule.every().day.at("12:00").do(self.run_keep_alive)
-        schedule.every().day.at("18:00").do(self.run_keep_alive)
+        job_scheduler.register('supabase_keep_alive_daily', self.run_keep_alive, 'cron',
+                               name="Giữ kết nối Supabase (hằng ngày)", hour='12,18', minute=0)
+        job_scheduler.start()
         
         logger.info("Scheduled keep-alive task started (every 3 days at 5:00 AM + daily at 12:00 PM and 6:00 PM)")
-        
-        while True:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
     
     def run_once(self):
         """Run keep-alive once for testing"""
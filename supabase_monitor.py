@@ -2,34 +2,192 @@
 #!/usr/bin/env python3
 """
 Supabase Health Monitor
-Provides detailed health checks and monitoring for Supabase connection
+Provides detailed health checks and monitoring for Supabase connection.
+Latency samples (connect, first query, round trip) are kept in a
+fixed-size ring buffer table in monitoring.db, a small SQLite file next to
+the application database, for percentile trends. Keeping them out of the
+application database means samples do not show up as data changes to the
+backups, the WAL archive or the backup browser.
 """
 
 import os
 import time
+import sqlite3
+import logging
+import threading
+import statistics
 import psycopg2
+from supabase_pool import pooled_connection, CONNECT_OPTIONS
 from datetime import datetime, timedelta
 from supabase_keepalive import SupabaseKeepAlive
 
+logger = logging.getLogger(__name__)
+
+MONITORING_DB_NAME = 'monitoring.db'
+
+# One latency sample every few minutes, a week of them in the ring buffer
+LATENCY_SAMPLE_INTERVAL_MINUTES = 5
+LATENCY_RING_SIZE = 7 * 24 * 60 // LATENCY_SAMPLE_INTERVAL_MINUTES
+
+# Round trips timed per sample; their median is the sample's RTT
+RTT_PROBES = 3
+
+LATENCY_METRICS = ('connect_ms', 'query_ms', 'rtt_ms')
+LATENCY_WINDOWS = {
+    '1h': timedelta(hours=1),
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+}
+LATENCY_PERCENTILES = (50, 95, 99)
+
+# p95 over the last hour this many times the 24h p95 counts as degraded
+DEGRADATION_FACTOR = 2.0
+
+# All checks of one health check share this deadline
+HEALTH_CHECK_DEADLINE_SECONDS = 10
+# Health results are reused for this long, so frequent probes cost one check
+HEALTH_CACHE_TTL_SECONDS = 30
+
+# Shared by all monitor instances; the lock also makes concurrent callers
+# wait for the check in progress instead of starting their own
+_health_cache = {'result': None, 'checked_at': 0.0}
+_health_lock = threading.Lock()
+
+# Monitoring files whose tables exist, so the schema is created once per process
+_ready_paths = set()
+_schema_lock = threading.Lock()
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+def monitoring_path_for(db_path):
+    """monitoring.db lives next to the application database"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), MONITORING_DB_NAME)
+
+class LatencyStore:
+    """Latency samples in a ring buffer table: slot = sample number % size"""
+
+    def __init__(self, db_path='lang_huu_nghi.db', size=LATENCY_RING_SIZE):
+        self.db_path = monitoring_path_for(db_path)
+        self.size = size
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if self.db_path not in _ready_paths:
+            with _schema_lock:
+                if self.db_path not in _ready_paths:
+                    # Only takes effect when the file is new, before its first table
+                    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    conn.execute("PRAGMA journal_mode = WAL")
+                    with conn:
+                        conn.execute("""
+                            CREATE TABLE IF NOT EXISTS supabase_latency (
+                                slot INTEGER PRIMARY KEY,
+                                sample_number INTEGER NOT NULL,
+                                sampled_at TEXT NOT NULL,
+                                connect_ms REAL,
+                                query_ms REAL,
+                                rtt_ms REAL,
+                                ok INTEGER NOT NULL,
+                                error TEXT
+                            )
+                        """)
+                        conn.execute("CREATE INDEX IF NOT EXISTS idx_supabase_latency_sampled_at ON supabase_latency (sampled_at)")
+                    _ready_paths.add(self.db_path)
+        return conn
+
+    def record(self, sample):
+        """Store a sample, overwriting the oldest once the buffer is full"""
+        conn = self._connect()
+        try:
+            with conn:
+                number = conn.execute("SELECT COALESCE(MAX(sample_number), 0) + 1 FROM supabase_latency").fetchone()[0]
+                conn.execute("""
+                    INSERT INTO supabase_latency (slot, sample_number, sampled_at, connect_ms, query_ms, rtt_ms, ok, error)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (slot) DO UPDATE SET
+                        sample_number = excluded.sample_number, sampled_at = excluded.sampled_at,
+                        connect_ms = excluded.connect_ms, query_ms = excluded.query_ms,
+                        rtt_ms = excluded.rtt_ms, ok = excluded.ok, error = excluded.error
+                """, (number % self.size, number, sample['sampled_at'].isoformat(), sample['connect_ms'],
+                      sample['query_ms'], sample['rtt_ms'], int(sample['ok']), sample.get('error')))
+        finally:
+            conn.close()
+
+    def get_series(self, window=LATENCY_WINDOWS['24h']):
+        """Samples newer than window, oldest first"""
+        since = (datetime.now() - window).isoformat()
+        conn = self._connect()
+        try:
+            cursor = conn.execute("""
+                SELECT sampled_at, connect_ms, query_ms, rtt_ms, ok, error
+                FROM supabase_latency WHERE sampled_at >= ? ORDER BY sample_number
+            """, (since,))
+            columns = [d[0] for d in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def get_percentiles(self):
+        """p50/p95/p99 of each metric per sliding window, with sample and error counts"""
+        series = self.get_series(max(LATENCY_WINDOWS.values()))
+        now = datetime.now()
+        stats = {}
+        for name, window in LATENCY_WINDOWS.items():
+            since = (now - window).isoformat()
+            samples = [s for s in series if s['sampled_at'] >= since]
+            window_stats = {'samples': len(samples), 'errors': sum(1 for s in samples if not s['ok'])}
+            for metric in LATENCY_METRICS:
+                values = sorted(s[metric] for s in samples if s[metric] is not None)
+                for p in LATENCY_PERCENTILES:
+                    window_stats[f'{metric}_p{p}'] = percentile(values, p)
+            stats[name] = window_stats
+        return stats
+
+    def is_degraded(self, stats=None):
+        """True when the last hour's p95 round trip or connect time is well above the day's"""
+        stats = stats or self.get_percentiles()
+        for metric in ('connect_ms', 'rtt_ms'):
+            recent, baseline = stats['1h'][f'{metric}_p95'], stats['24h'][f'{metric}_p95']
+            if recent and baseline and stats['24h']['samples'] > stats['1h']['samples'] and recent > baseline * DEGRADATION_FACTOR:
+                return True
+        return False
+
 class SupabaseMonitor:
-    def __init__(self):
+    def __init__(self, db_path='lang_huu_nghi.db'):
         self.database_url = os.environ.get('DATABASE_URL')
         if not self.database_url:
             raise ValueError("DATABASE_URL environment variable not found")
+        self.latency_store = LatencyStore(db_path)
     
-    def check_connection(self):
+    def _with_connection(self, conn, query):
+        """Run query(conn) on the given connection, or on a pooled one"""
+        if conn is not None:
+            return query(conn)
+        with pooled_connection(self.database_url) as conn:
+            return query(conn)
+    
+    def check_connection(self, conn=None):
         """Check basic database connection"""
+        def query(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT version(), current_timestamp")
+                return cursor.fetchone()
+        
         try:
-            with psycopg2.connect(self.database_url) as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT version(), current_timestamp")
-                    version, timestamp = cursor.fetchone()
-                    return {
-                        "status": "healthy",
-                        "version": version,
-                        "timestamp": timestamp,
-                        "latency_ms": self._measure_latency()
-                    }
+            version, timestamp = self._with_connection(conn, query)
+            result = {
+                "status": "healthy",
+                "version": version,
+                "timestamp": timestamp
+            }
+            if conn is None:
+                result["latency_ms"] = self._measure_latency()
+            return result
         except Exception as e:
             return {
                 "status": "unhealthy",
@@ -37,62 +195,174 @@ class SupabaseMonitor:
                 "timestamp": datetime.now()
             }
     
-    def _measure_latency(self):
-        """Measure database query latency"""
+    def measure_round_trip(self, conn):
+        """Median SELECT 1 round trip on an open connection"""
         try:
-            start_time = time.time()
-            with psycopg2.connect(self.database_url) as conn:
-                with conn.cursor() as cursor:
+            round_trips = []
+            with conn.cursor() as cursor:
+                for _ in range(RTT_PROBES):
+                    start = time.perf_counter()
                     cursor.execute("SELECT 1")
                     cursor.fetchone()
-            end_time = time.time()
-            return round((end_time - start_time) * 1000, 2)
+                    round_trips.append((time.perf_counter() - start) * 1000)
+            return {"status": "healthy", "rtt_ms": round(statistics.median(round_trips), 2)}
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+    
+    def sample_latency(self):
+        """Time a fresh connection, its first query and warm round trips
+        
+        The connection is opened outside the pool on purpose: connect and
+        first-query times are where pooler degradation shows up first.
+        """
+        sample = {'sampled_at': datetime.now(), 'connect_ms': None, 'query_ms': None,
+                  'rtt_ms': None, 'ok': False, 'error': None}
+        conn = None
+        try:
+            start = time.perf_counter()
+            conn = psycopg2.connect(self.database_url, **CONNECT_OPTIONS)
+            sample['connect_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            
+            with conn.cursor() as cursor:
+                start = time.perf_counter()
+                cursor.execute("SELECT current_timestamp")
+                cursor.fetchone()
+                sample['query_ms'] = round((time.perf_counter() - start) * 1000, 2)
+                
+                round_trips = []
+                for _ in range(RTT_PROBES):
+                    start = time.perf_counter()
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                    round_trips.append((time.perf_counter() - start) * 1000)
+                sample['rtt_ms'] = round(statistics.median(round_trips), 2)
+            sample['ok'] = True
+        except Exception as e:
+            sample['error'] = str(e)
+        finally:
+            if conn is not None:
+                conn.close()
+        return sample
+    
+    def record_latency_sample(self):
+        """Take one latency sample and store it in the ring buffer"""
+        sample = self.sample_latency()
+        self.latency_store.record(sample)
+        return sample
+    
+    def _measure_latency(self):
+        """Measure database query latency (round trip), keeping the sample"""
+        try:
+            return self.record_latency_sample()['rtt_ms']
         except:
             return None
     
-    def check_keep_alive_table(self):
+    def check_keep_alive_table(self, conn=None):
         """Check keep-alive table status"""
+        def query(conn):
+            with conn.cursor() as cursor:
+                # Check if table exists
+                cursor.execute("""
+                    SELECT EXISTS (
+                        SELECT FROM information_schema.tables 
+                        WHERE table_name = 'keep_alive'
+                    )
+                """)
+                table_exists = cursor.fetchone()[0]
+                
+                if not table_exists:
+                    return {"status": "missing", "message": "Keep-alive table not found"}
+                
+                # Check table contents
+                cursor.execute("SELECT COUNT(*) FROM keep_alive")
+                count = cursor.fetchone()[0]
+                
+                cursor.execute("""
+                    SELECT created_at FROM keep_alive 
+                    ORDER BY created_at DESC LIMIT 1
+                """)
+                last_entry = cursor.fetchone()
+                
+                return {
+                    "status": "healthy",
+                    "entry_count": count,
+                    "last_entry": last_entry[0] if last_entry else None
+                }
+        
         try:
-            with psycopg2.connect(self.database_url) as conn:
-                with conn.cursor() as cursor:
-                    # Check if table exists
-                    cursor.execute("""
-                        SELECT EXISTS (
-                            SELECT FROM information_schema.tables 
-                            WHERE table_name = 'keep_alive'
-                        )
-                    """)
-                    table_exists = cursor.fetchone()[0]
-                    
-                    if not table_exists:
-                        return {"status": "missing", "message": "Keep-alive table not found"}
-                    
-                    # Check table contents
-                    cursor.execute("SELECT COUNT(*) FROM keep_alive")
-                    count = cursor.fetchone()[0]
-                    
-                    cursor.execute("""
-                        SELECT created_at FROM keep_alive 
-                        ORDER BY created_at DESC LIMIT 1
-                    """)
-                    last_entry = cursor.fetchone()
-                    
-                    return {
-                        "status": "healthy",
-                        "entry_count": count,
-                        "last_entry": last_entry[0] if last_entry else None
-                    }
+            return self._with_connection(conn, query)
         except Exception as e:
             return {"status": "error", "error": str(e)}
     
+    def _run_health_checks(self, deadline_seconds):
+        """Connection, latency and keep-alive table checks, one after another on one connection
+        
+        A single pooled connection serializes its statements anyway, so
+        the checks run in turn against one shared deadline: each gets the
+        time left as its statement_timeout, and checks reached after the
+        deadline are reported as timed out without running.
+        """
+        deadline = time.monotonic() + deadline_seconds
+        checks = {
+            'connection': self.check_connection,
+            'latency': self.measure_round_trip,
+            'keep_alive_table': self.check_keep_alive_table,
+        }
+        results = {}
+        try:
+            with pooled_connection(self.database_url) as conn:
+                conn.autocommit = True
+                try:
+                    for name, check in checks.items():
+                        remaining_ms = int((deadline - time.monotonic()) * 1000)
+                        if remaining_ms <= 0:
+                            results[name] = {"status": "timeout",
+                                             "error": f"No answer within {deadline_seconds}s"}
+                            continue
+                        with conn.cursor() as cursor:
+                            cursor.execute("SET statement_timeout = %s", (remaining_ms,))
+                        results[name] = check(conn)
+                finally:
+                    # The checks are done; a failed reset only costs the connection
+                    if not conn.closed:
+                        try:
+                            with conn.cursor() as cursor:
+                                cursor.execute("RESET statement_timeout")
+                            conn.autocommit = False
+                        except psycopg2.Error as e:
+                            logger.warning(f"Discarding health check connection, statement_timeout reset failed: {e}")
+                            conn.close()
+        except Exception as e:
+            results['connection'] = {"status": "unhealthy", "error": str(e), "timestamp": datetime.now()}
+        
+        connection = results['connection']
+        if connection["status"] == "healthy":
+            connection["latency_ms"] = results.get('latency', {}).get('rtt_ms')
+        results['status'] = "healthy" if all(
+            results.get(name, {}).get("status") == "healthy" for name in checks
+        ) else "degraded" if connection["status"] == "healthy" else "unhealthy"
+        results['checked_at'] = datetime.now()
+        return results
+    
+    def check_health(self, max_age=HEALTH_CACHE_TTL_SECONDS, deadline_seconds=HEALTH_CHECK_DEADLINE_SECONDS):
+        """Health check results, reused while younger than max_age seconds"""
+        with _health_lock:
+            if _health_cache['result'] is not None and time.monotonic() - _health_cache['checked_at'] < max_age:
+                return _health_cache['result']
+            result = self._run_health_checks(deadline_seconds)
+            _health_cache.update(result=result, checked_at=time.monotonic())
+            return result
+    
     def run_comprehensive_check(self):
         """Run all health checks"""
         print("🔍 Supabase Health Monitor")
         print("=" * 50)
         
+        health = self.check_health(max_age=0)
+        
         # Connection check
         print("1️⃣ Database Connection:")
-        conn_status = self.check_connection()
+        conn_status = health['connection']
         if conn_status["status"] == "healthy":
             print(f"   ✅ Connected successfully")
             print(f"   📊 Latency: {conn_status['latency_ms']}ms")
@@ -103,7 +373,7 @@ class SupabaseMonitor:
         
         # Keep-alive table check
         print("\n2️⃣ Keep-Alive Table:")
-        table_status = self.check_keep_alive_table()
+        table_status = health['keep_alive_table']
         if table_status["status"] == "healthy":
             print(f"   ✅ Table exists and accessible")
             print(f"   📝 Entry count: {table_status['entry_count']}")
@@ -0,0 +1,117 @@
+"""
+Supabase Connection Pool
+Shared psycopg2 connection pool for the keep-alive service, the health
+monitor and the keep-alive daemon, so each run reuses open connections
+instead of paying a TLS handshake per query
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+logger = logging.getLogger(__name__)
+
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 4
+
+# Connections idle longer than this are checked with a round trip before
+# use; the pooler closes idle client connections after a while
+HEALTH_CHECK_AFTER_SECONDS = 60
+
+CONNECT_OPTIONS = {
+    'connect_timeout': 10,
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3,
+}
+
+_pools = {}
+_last_used = {}
+_lock = threading.Lock()
+
+def get_pool(database_url=None):
+    """The process-wide pool for a database URL, created on first use"""
+    database_url = database_url or os.environ.get('DATABASE_URL')
+    if not database_url:
+        raise ValueError("Database URL is required. Please set DATABASE_URL environment variable.")
+    with _lock:
+        if database_url not in _pools:
+            _pools[database_url] = pool.ThreadedConnectionPool(
+                POOL_MIN_CONNECTIONS, POOL_MAX_CONNECTIONS, database_url, **CONNECT_OPTIONS
+            )
+            logger.info("Postgres connection pool created")
+        return _pools[database_url]
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < HEALTH_CHECK_AFTER_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _checkout(connection_pool):
+    """A healthy connection from the pool, replacing dead ones"""
+    for _ in range(POOL_MAX_CONNECTIONS + 1):
+        conn = connection_pool.getconn()
+        if _is_healthy(conn):
+            return conn
+        logger.info("Discarding dead pooled connection")
+        _last_used.pop(id(conn), None)
+        connection_pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("No healthy connection available from the pool")
+
+@contextmanager
+def pooled_connection(database_url=None):
+    """Borrow a pooled connection; commits on success, rolls back on error
+
+    Behaves like `with psycopg2.connect(url) as conn`, except that the
+    connection goes back to the pool instead of being closed. Connections
+    that failed at the connection level, or that the caller closed to
+    discard them, are dropped rather than reused.
+    """
+    connection_pool = get_pool(database_url)
+    conn = _checkout(connection_pool)
+    broken = False
+    try:
+        yield conn
+        if not conn.closed:
+            conn.commit()
+    except Exception as e:
+        broken = conn.closed or isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        raise
+    finally:
+        broken = broken or bool(conn.closed)
+        if broken:
+            _last_used.pop(id(conn), None)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+        connection_pool.putconn(conn, close=broken)
+
+def close_pools():
+    """Close every pooled connection"""
+    with _lock:
+        for connection_pool in _pools.values():
+            connection_pool.closeall()
+        _pools.clear()
+        _last_used.clear()
+
+atexit.register(close_pools)
@@ -0,0 +1,100 @@
+"""Restoring a student from a backup into a live database that changed since"""
+
+import shutil
+
+import pytest
+
+from backup_browser import BackupBrowser
+from database import TABLE_SCHEMAS, connect_database, create_change_log
+from record_archive import RecordArchive
+
+
+class FileBackupService:
+    """Stand-in for LocalBackup reading plain .db copies"""
+
+    def read_backup_image(self, backup_path):
+        with open(backup_path, 'rb') as f:
+            return f.read()
+
+
+@pytest.fixture
+def databases(tmp_path):
+    """Live database with one student in class 1, and a backup of it"""
+    db_path = str(tmp_path / 'lang_huu_nghi.db')
+    conn = connect_database(db_path)
+    for schema in TABLE_SCHEMAS.values():
+        conn.execute(schema)
+    create_change_log(conn)
+    conn.execute("INSERT INTO classes (id, name, teacher_id, academic_year) VALUES (1, 'Lớp 1', 1, '2024-2025')")
+    conn.execute("INSERT INTO students (id, full_name, class_id) VALUES (7, 'Nguyễn Văn A', 1)")
+    conn.execute("""
+        INSERT INTO student_class_history (id, student_id, class_id, start_date, end_date)
+        VALUES (1, 7, 1, '2015-09-01', '2016-06-01')
+    """)
+    conn.execute("""
+        INSERT INTO users (id, username, password_hash, role, full_name, family_student_id)
+        VALUES (2, 'giadinh', 'x', 'family', 'Gia đình A', 7)
+    """)
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+    backup_path = str(tmp_path / 'backup.db')
+    shutil.copy(db_path, backup_path)
+    return db_path, backup_path
+
+
+def restore(db_path, backup_path, student_id=7):
+    browser = BackupBrowser(backup_path, db_path=db_path, backup_service=FileBackupService())
+    try:
+        return browser.restore_student(student_id), browser.warnings
+    finally:
+        browser.close()
+
+
+def test_restore_with_deleted_class(databases):
+    db_path, backup_path = databases
+    conn = connect_database(db_path)
+    conn.execute("DELETE FROM students WHERE id = 7")
+    conn.execute("DELETE FROM classes WHERE id = 1")
+    conn.commit()
+
+    restored, warnings = restore(db_path, backup_path)
+
+    assert conn.execute("SELECT full_name, class_id FROM students WHERE id = 7").fetchone() == ('Nguyễn Văn A', None)
+    # The history row cannot exist without its class
+    assert conn.execute("SELECT COUNT(*) FROM student_class_history").fetchone()[0] == 0
+    assert restored['student_class_history'] == 0
+    assert len(warnings) == 2
+    assert all('classes #1' in warning for warning in warnings)
+    conn.close()
+
+
+def test_restore_relinks_family_account(databases):
+    db_path, backup_path = databases
+    conn = connect_database(db_path)
+    conn.execute("DELETE FROM students WHERE id = 7")
+    conn.commit()
+    assert conn.execute("SELECT family_student_id FROM users WHERE id = 2").fetchone()[0] is None
+
+    restored, warnings = restore(db_path, backup_path)
+
+    assert conn.execute("SELECT family_student_id FROM users WHERE id = 2").fetchone()[0] == 7
+    assert restored['users'] == 1
+    assert restored['student_class_history'] == 1
+    assert warnings == []
+    conn.close()
+
+
+def test_restore_skips_archived_rows(databases):
+    db_path, backup_path = databases
+    archive = RecordArchive(db_path)
+    archive.archive_table('student_class_history', 'end_date')
+    archive.close()
+
+    restored, warnings = restore(db_path, backup_path)
+
+    conn = connect_database(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM student_class_history").fetchone()[0] == 0
+    assert restored['student_class_history'] == 0
+    conn.close()
@@ -1,4 +1,9 @@
 from typing import Dict, Any
+import os
+import sys
+import json
+import struct
+import hashlib
 
 # Vietnamese translations only
 vi = {
@@ -123,39 +128,129 @@ vi = {
     }
 }
 
+# Nested translations per language, compiled into flat catalogs at startup
+SOURCES = {
+    'vi': vi
+}
+
+# Optional precompiled catalog per language, LOCALE_DIR/<lang>/LC_MESSAGES/messages.mo,
+# with the dotted keys as msgids. Written by `python translations.py compile`;
+# its header records a hash of the source tree and the file is ignored when
+# the hash no longer matches, so edits above are never shadowed.
+LOCALE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locale')
+CATALOG_DOMAIN = 'messages'
+SOURCE_HASH_FIELD = 'X-Source-Hash'
+MO_MAGIC = 0x950412de
+
+def compile_catalog(tree: Dict[str, Any], prefix: str = "") -> Dict[str, str]:
+    """Flatten nested translations into {'group.key': text}, with interned keys"""
+    catalog = {}
+    for key, value in tree.items():
+        full_key = f"{prefix}{key}"
+        if isinstance(value, dict):
+            catalog.update(compile_catalog(value, full_key + "."))
+        elif value is not None:
+            catalog[sys.intern(full_key)] = value if isinstance(value, str) else str(value)
+    return catalog
+
+def catalog_path(language: str) -> str:
+    return os.path.join(LOCALE_DIR, language, 'LC_MESSAGES', CATALOG_DOMAIN + '.mo')
+
+def source_hash(tree: Dict[str, Any]) -> str:
+    """Hash of a language's nested translations, stored in its .mo header"""
+    data = json.dumps(tree, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def read_catalog(path: str) -> Dict[str, str]:
+    """Read a .mo file written by write_catalog, header entry ("") included
+
+    Only the layout write_catalog produces is supported: little-endian,
+    revision 0, UTF-8 and no plural forms.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, revision, count, ids_offset, strs_offset = struct.unpack_from("<5I", data)
+    if magic != MO_MAGIC or revision != 0:
+        raise ValueError(f"Not a catalog written by write_catalog: {path}")
+    catalog = {}
+    for index in range(count):
+        key_length, key_start = struct.unpack_from("<II", data, ids_offset + 8 * index)
+        text_length, text_start = struct.unpack_from("<II", data, strs_offset + 8 * index)
+        key = data[key_start:key_start + key_length].decode('utf-8')
+        catalog[key] = data[text_start:text_start + text_length].decode('utf-8')
+    return catalog
+
+def header_field(header: str, name: str) -> str:
+    for line in header.splitlines():
+        field, _, value = line.partition(':')
+        if field.strip() == name:
+            return value.strip()
+    return ""
+
+def load_catalog(language: str) -> Dict[str, str]:
+    """Flat catalog of a language, from the .mo file if it matches the sources"""
+    path = catalog_path(language)
+    if os.path.exists(path):
+        try:
+            entries = read_catalog(path)
+        except (ValueError, struct.error, UnicodeDecodeError):
+            entries = {}
+        header = entries.pop("", "")
+        if header and header_field(header, SOURCE_HASH_FIELD) == source_hash(SOURCES[language]):
+            return {sys.intern(key): text for key, text in entries.items()}
+    return compile_catalog(SOURCES[language])
+
+def write_catalog(catalog: Dict[str, str], path: str, tree_hash: str = ""):
+    """Write a flat catalog as a GNU gettext .mo file
+
+    tree_hash, the source_hash of the tree the catalog was compiled from,
+    goes into the header entry for load_catalog to check.
+    """
+    entries = dict(catalog)
+    entries[""] = "Content-Type: text/plain; charset=UTF-8\n"
+    if tree_hash:
+        entries[""] += f"{SOURCE_HASH_FIELD}: {tree_hash}\n"
+    keys = sorted(entries)
+    ids = strs = b""
+    offsets = []
+    for key in keys:
+        key_bytes, text_bytes = key.encode('utf-8'), entries[key].encode('utf-8')
+        offsets.append((len(ids), len(key_bytes), len(strs), len(text_bytes)))
+        ids += key_bytes + b"\0"
+        strs += text_bytes + b"\0"
+
+    # Header, then the (length, offset) tables of msgids and msgstrs, then the strings
+    ids_start = 7 * 4 + 16 * len(keys)
+    strs_start = ids_start + len(ids)
+    key_table = b"".join(struct.pack("<II", length, ids_start + offset) for offset, length, _, _ in offsets)
+    text_table = b"".join(struct.pack("<II", length, strs_start + offset) for _, _, offset, length in offsets)
+    header = struct.pack("<7I", MO_MAGIC, 0, len(keys), 7 * 4, 7 * 4 + 8 * len(keys), 0, 0)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(header + key_table + text_table + ids + strs)
+
 class Translator:
     def __init__(self):
-        self.translations = {
-            'vi': vi
-        }
+        self.translations = SOURCES
+        self.catalogs = {language: load_catalog(language) for language in SOURCES}
         self.current_language = 'vi'  # Vietnamese only
+        self.catalog = self.catalogs[self.current_language]
 
     def set_language(self, language: str):
         # Always set to Vietnamese since we only support Vietnamese
         self.current_language = 'vi'
+        self.catalog = self.catalogs[self.current_language]
 
     def get_text(self, key_path: str, default: str = "") -> str:
         """
-        Get translated text using dot notation for nested keys
+        Get translated text by its full dotted key
         Example: translator.get_text('common.login')
         """
-        if default is None:
-            default = ""
-            
-        keys = key_path.split('.')
-        value = self.translations[self.current_language]
-        
-        for key in keys:
-            if isinstance(value, dict) and key in value:
-                value = value[key]
-            else:
-                return default if default != "" else key_path
-                
-        # Make sure we return a string
-        if isinstance(value, str):
+        value = self.catalog.get(key_path)
+        if value is not None:
             return value
-        else:
-            return str(value) if value is not None else (default if default != "" else key_path)
+        return default or key_path
 
 # Create a global translator instance
 translator = Translator()
@@ -171,6 +266,14 @@ def set_language(language: str):
 
 # Helper function to get text
 def get_text(key_path: str, default: str = "") -> str:
-    if default is None:
-        default = ""
-    return translator.get_text(key_path, default)
\ No newline at end of file
+    value = translator.catalog.get(key_path)
+    if value is not None:
+        return value
+    return default or key_path
+
+if __name__ == "__main__":
+    # python translations.py compile  ->  locale/<lang>/LC_MESSAGES/messages.mo
+    if sys.argv[1:] == ['compile']:
+        for language, tree in SOURCES.items():
+            write_catalog(compile_catalog(tree), catalog_path(language), source_hash(tree))
+            print(f"Wrote {catalog_path(language)}")
\ No newline at end of file